@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.GWLs import GWLIndex, get_mean_data, get_mean_data_batch
+from c3s_atlas.temporal import TimeWindowIndexer
+
+GWLS = ["1.5", "2", "3", "4"]
+SCENARIOS = ["ssp126", "ssp245", "ssp370", "ssp585"]
+
+
+def members_dataset(n_members, n_lat=4, n_lon=8):
+    """Monthly 1950-2100 dataset with `n_members` members (about 0.2 MB per member)."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1950-01-01", "2100-12-01", freq="MS")
+    data = rng.random((n_members, len(time), n_lat, n_lon), dtype="float32")
+    return xr.Dataset(
+        {"tas": (["member", "time", "lat", "lon"], data)},
+        coords={
+            "member": np.arange(n_members),
+            "member_id": ("member", [f"r{i + 1}i1p1f1" for i in range(n_members)]),
+            "time": time,
+            "lat": np.linspace(-89, 89, n_lat),
+            "lon": np.linspace(-179, 179, n_lon),
+        },
+    )
+
+
+def GWLs_table(members):
+    """GWLs table with random 20-year periods and some members that do not reach the GWL."""
+    rng = np.random.default_rng(1)
+    columns = pd.MultiIndex.from_product([GWLS, SCENARIOS])
+    start = rng.integers(2000, 2080, (len(members), len(columns)))
+    values = np.where(
+        rng.random(start.shape) < 0.2, "NA",
+        np.char.add(np.char.add(start.astype(str), "-"), (start + 19).astype(str)),
+    )
+    return pd.DataFrame(values, index=members, columns=columns)
+
+
+class GWLWindows:
+    # The 500 member case peaks at about 0.6 GB of resident memory
+    params = [100, 500]
+    param_names = ["n_members"]
+
+    def setup(self, n_members):
+        self.ds = members_dataset(n_members)
+        self.index = GWLIndex(GWLs_table(self.ds.member_id.values))
+        self.periods = self.index.select(self.ds, "ssp245", "2")
+        self.periods_dict = dict(self.periods.items())
+
+    def time_indexer_windows(self, n_members):
+        TimeWindowIndexer(self.ds).windows(self.periods.start, self.periods.end)
+
+    def time_mean_data_dict(self, n_members):
+        get_mean_data(self.ds, self.periods_dict)
+
+    def time_mean_data_periods(self, n_members):
+        get_mean_data(self.ds, self.periods)
+
+    def time_mean_data_batch(self, n_members):
+        get_mean_data_batch(self.ds, self.index, SCENARIOS, GWLS)
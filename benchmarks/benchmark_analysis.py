@@ -0,0 +1,63 @@
+from c3s_atlas.analysis import (
+    annual_weighted_average,
+    ensemble_statistics,
+    mean_values_map,
+    mean_values_map_batch,
+)
+
+from .synthetic import global_dataset
+
+PERIODS = [slice("2021", "2040"), slice("2041", "2060"), slice("2081", "2100")]
+SEASONS = {
+    "Annual": list(range(1, 13)), "DJF": [12, 1, 2], "MAM": [3, 4, 5],
+    "JJA": [6, 7, 8], "SON": [9, 10, 11],
+}
+
+
+class MeanValuesMap:
+    params = [1, 5, 20]
+    param_names = ["n_members"]
+    timeout = 300
+
+    def setup(self, n_members):
+        self.ds = global_dataset(
+            n_members=n_members, n_years=120, resolution=4.0, start="1981-01-01"
+        )
+
+    def time_mean_values_map_loop(self, n_members):
+        for period in PERIODS:
+            for season in SEASONS.values():
+                mean_values_map(self.ds, "tas", "CMIP6", "change", "abs", season=season,
+                                period=period)
+
+    def time_mean_values_map_batch(self, n_members):
+        mean_values_map_batch(self.ds, "tas", "change", PERIODS, SEASONS, diff=("abs",))
+
+
+class AnnualWeightedAverage:
+    params = ([2, 5], [False, True])
+    param_names = ["n_members", "streaming"]
+    timeout = 300
+
+    def setup(self, n_members, streaming):
+        self.ds = global_dataset(n_members=n_members, n_years=20, resolution=5.0, freq="D")
+
+    def time_annual_weighted_average(self, n_members, streaming):
+        annual_weighted_average(self.ds, "tas", streaming=streaming)
+
+    def peakmem_annual_weighted_average(self, n_members, streaming):
+        annual_weighted_average(self.ds, "tas", streaming=streaming)
+
+
+class EnsembleStatistics:
+    params = [10, 50]
+    param_names = ["n_members"]
+
+    def setup(self, n_members):
+        self.da = global_dataset(n_members=n_members, n_years=10, resolution=2.0)["tas"]
+
+    def time_ensemble_statistics(self, n_members):
+        ensemble_statistics(self.da)
+
+    def peakmem_ensemble_statistics(self, n_members):
+        ensemble_statistics(self.da)
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.bias_adjustment import BiasAdjustment
+from c3s_atlas.utils import get_ds_to_fill
+
+
+def daily_dataset(start, n_years, loc, n_lat=20, n_lon=40, seed=0):
+    """Synthetic daily maximum temperature with a seasonal cycle."""
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(start, periods=365 * n_years, freq="D")
+    seasonal = 8 * np.sin(2 * np.pi * time.dayofyear.values / 365.25)[:, None, None]
+    data = loc + seasonal + rng.normal(size=(len(time), n_lat, n_lon))
+    return xr.Dataset(
+        {"tasmax": (["time", "lat", "lon"], data.astype("float32"))},
+        coords={
+            "time": time,
+            "lat": np.linspace(35, 45, n_lat),
+            "lon": np.linspace(-10, 5, n_lon),
+        },
+    )
+
+
+class BiasAdjustmentDaily:
+    params = (["eqm", "linear_scaling"], [None, "month"], [1, 4])
+    param_names = ["method", "group", "max_workers"]
+
+    def setup(self, method, group, max_workers):
+        self.obs = daily_dataset("1981-01-01", 20, 20, seed=0)
+        self.hist = daily_dataset("1981-01-01", 20, 18, seed=1)
+        self.fut = daily_dataset("2071-01-01", 20, 21, seed=2)
+        self.adjuster = BiasAdjustment({
+            "var_name": "tasmax", "method": method, "group": group,
+            "max_workers": max_workers,
+        })
+
+    def time_bias_adjustment(self, method, group, max_workers):
+        ds_to_fill = get_ds_to_fill("tasmaxbals", self.fut, self.fut, dtype="float32")
+        self.adjuster(self.obs, self.hist, self.fut, ds_to_fill, "tasmaxbals")
+
+    def peakmem_bias_adjustment(self, method, group, max_workers):
+        ds_to_fill = get_ds_to_fill("tasmaxbals", self.fut, self.fut, dtype="float32")
+        self.adjuster(self.obs, self.hist, self.fut, ds_to_fill, "tasmaxbals")
@@ -0,0 +1,68 @@
+from c3s_atlas.fixers import apply_fixers, fix_time, resampled_by_temporal_aggregation
+
+from .synthetic import cordex_dataset, era5_hourly_dataset, global_dataset
+
+VAR_MAPPING = {
+    "dataset_variable": {"tas": "t2m"},
+    "aggregation": {"tas": "mean"},
+}
+
+
+def raw_dataset(source, n_years):
+    """Raw dataset and project of each source shape."""
+    if source == "cmip6_noleap":
+        ds = global_dataset(n_members=1, n_years=n_years, freq="D", calendar="noleap")
+        return ds.isel(member=0, drop=True), "cmip6"
+    elif source == "cmip6_monthly":
+        ds = global_dataset(n_members=1, n_years=n_years, freq="MS", calendar="noleap")
+        return ds.isel(member=0, drop=True), "cmip6"
+    elif source == "cordex_360_day":
+        return cordex_dataset(n_years=n_years, calendar="360_day"), "cordex"
+    elif source == "era5_hourly":
+        return era5_hourly_dataset(n_days=31 * n_years, resolution=2.0), "era5"
+    raise ValueError(f"Source '{source}' not implemented.")
+
+
+class ApplyFixers:
+    params = (["cmip6_noleap", "cordex_360_day", "era5_hourly"], [1, 5])
+    param_names = ["source", "n_years"]
+    timeout = 300
+
+    def setup(self, source, n_years):
+        self.ds, self.project = raw_dataset(source, n_years)
+
+    def time_apply_fixers(self, source, n_years):
+        apply_fixers(self.ds.copy(), "tas", self.project, VAR_MAPPING)
+
+    def peakmem_apply_fixers(self, source, n_years):
+        apply_fixers(self.ds.copy(), "tas", self.project, VAR_MAPPING)
+
+    def peakmem_apply_fixers_float32(self, source, n_years):
+        apply_fixers(self.ds.copy(), "tas", self.project, VAR_MAPPING, dtype="float32")
+
+
+class FixTime:
+    params = (["cmip6_noleap", "cmip6_monthly", "cordex_360_day"], [1, 5])
+    param_names = ["source", "n_years"]
+
+    def setup(self, source, n_years):
+        self.ds, _ = raw_dataset(source, n_years)
+
+    def time_fix_time(self, source, n_years):
+        fix_time(self.ds)
+
+
+class HourlyToDaily:
+    params = (["t2m", "pr"], [1, 3])
+    param_names = ["variable", "n_years"]
+    timeout = 300
+
+    def setup(self, variable, n_years):
+        self.ds = era5_hourly_dataset(variable, n_days=365 * n_years, resolution=2.0)
+        self.mapping = {"aggregation": {"t2m": "mean", "pr": "sum"}}
+
+    def time_resampled_by_temporal_aggregation(self, variable, n_years):
+        resampled_by_temporal_aggregation(self.ds.copy(), self.mapping)
+
+    def peakmem_resampled_by_temporal_aggregation(self, variable, n_years):
+        resampled_by_temporal_aggregation(self.ds.copy(), self.mapping)
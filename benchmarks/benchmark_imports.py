@@ -0,0 +1,39 @@
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ["matplotlib", "cartopy", "geopandas", "regionmask", "shapely", "scipy", "xesmf"]
+
+CHECKS = {
+    "c3s_atlas.analysis": ["matplotlib", "cartopy"],
+    "c3s_atlas.products": ["matplotlib", "cartopy"],
+    "c3s_atlas.interpolation": ["xesmf"],
+    "c3s_atlas.GWLs": HEAVY_MODULES,
+    "c3s_atlas.fixers": HEAVY_MODULES,
+    "c3s_atlas.customized_regions": HEAVY_MODULES,
+}
+
+
+def imported_heavy_modules(module):
+    """Heavy modules loaded by importing `module` in a fresh interpreter."""
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps(sorted({{m.split('.')[0] for m in sys.modules}} & set({HEAVY_MODULES!r}))))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class ImportTime:
+    params = list(CHECKS)
+    param_names = ["module"]
+
+    def timeraw_import(self, module):
+        return f"import {module}"
+
+    def track_heavy_modules(self, module):
+        loaded = set(imported_heavy_modules(module)) & set(CHECKS[module])
+        assert not loaded, f"Importing {module} loads {sorted(loaded)}"
+        return len(loaded)
@@ -0,0 +1,24 @@
+from c3s_atlas.indexes import cooling_degree_days, heating_degree_days
+
+from .synthetic import global_dataset
+
+
+class DegreeDays:
+    params = ([1, 10], [None, "float32"])
+    param_names = ["n_years", "dtype"]
+    timeout = 300
+
+    def setup(self, n_years, dtype):
+        tas = global_dataset(n_members=1, n_years=n_years, freq="D", units="degC")
+        self.tas = tas["tas"].isel(member=0, drop=True) - 273.15
+        self.tasmax = self.tas + 5
+        self.tasmin = self.tas - 5
+
+    def time_heating_degree_days(self, n_years, dtype):
+        heating_degree_days(self.tas, self.tasmax, self.tasmin, dtype=dtype)
+
+    def time_cooling_degree_days(self, n_years, dtype):
+        cooling_degree_days(self.tas, self.tasmax, self.tasmin, dtype=dtype)
+
+    def peakmem_heating_degree_days(self, n_years, dtype):
+        heating_degree_days(self.tas, self.tasmax, self.tasmin, dtype=dtype)
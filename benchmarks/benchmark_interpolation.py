@@ -0,0 +1,28 @@
+from .synthetic import global_dataset
+
+
+class Interpolation:
+    params = ([2.0, 1.0], ["conservative_normed", "bilinear"])
+    param_names = ["source_resolution", "method"]
+    timeout = 600
+
+    def setup(self, source_resolution, method):
+        try:
+            import xesmf  # noqa: F401
+        except ImportError:
+            raise NotImplementedError("xesmf is not installed")
+        from c3s_atlas.interpolation import Interpolator
+
+        ds = global_dataset(n_members=1, n_years=2, resolution=source_resolution)
+        self.ds = ds.isel(member=0, drop=True)
+        self.ds["lon"] = self.ds["lon"] - 180
+        self.ds = self.ds.sortby("lat")
+        self.interpolator = Interpolator({
+            "var_name": "tas", "interpolation_method": method, "resolution": 1.0,
+        })
+
+    def time_interpolation(self, source_resolution, method):
+        self.interpolator(self.ds)
+
+    def peakmem_interpolation(self, source_resolution, method):
+        self.interpolator(self.ds)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.units import convert_units
+
+VARIABLES = {
+    "tas": "K",
+    "tasmax": "K",
+    "tasmin": "K",
+    "pr": "kg m-2 s-1",
+    "psl": "hPa",
+    "hurs": "Fraction",
+    "sfcwind": "km h**-1",
+    "rsds": "W m**-2",
+}
+
+
+def multi_variable_dataset(n_variables, n_time=3650, n_lat=90, n_lon=180, chunks=None):
+    """Daily float32 dataset with `n_variables` variables in non-standard units."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=n_time, freq="D")
+    data_vars = {}
+    for var in list(VARIABLES)[:n_variables]:
+        data = rng.random((n_time, n_lat, n_lon), dtype="float32")
+        data_vars[var] = (["time", "lat", "lon"], data, {"units": VARIABLES[var]})
+    ds = xr.Dataset(
+        data_vars,
+        coords={
+            "time": time,
+            "lat": np.linspace(-89, 89, n_lat),
+            "lon": np.linspace(-179, 179, n_lon),
+        },
+    )
+    if chunks:
+        ds = ds.chunk(chunks)
+    return ds
+
+
+class ConvertUnits:
+    params = ([1, 4, 8], [False, True])
+    param_names = ["n_variables", "dask"]
+
+    def setup(self, n_variables, dask):
+        self.ds = multi_variable_dataset(
+            n_variables, chunks={"time": 365} if dask else None
+        )
+
+    def time_convert_units(self, n_variables, dask):
+        convert_units(self.ds.copy(), "cmip6").load()
+
+    def peakmem_convert_units(self, n_variables, dask):
+        convert_units(self.ds.copy(), "cmip6").load()
@@ -0,0 +1,131 @@
+"""
+Deterministic synthetic datasets shaped like the inputs of the C3S Atlas workflow.
+
+All generators are seeded, need no network access and return raw-looking data
+(original coordinate names, units and calendars) so the fixers have work to do.
+"""
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def time_axis(start, periods, freq, calendar="standard"):
+    """Time values in the given calendar ("standard", "noleap", "360_day", ...)."""
+    if calendar in ["standard", "gregorian", "proleptic_gregorian"]:
+        return pd.date_range(start, periods=periods, freq=freq)
+    return xr.date_range(start, periods=periods, freq=freq, calendar=calendar, use_cftime=True)
+
+
+def seasonal_signal(time, n_lat, n_lon, loc, amplitude, seed):
+    """Seasonal cycle plus noise with shape (time, n_lat, n_lon), in float32."""
+    rng = np.random.default_rng(seed)
+    day = np.asarray([t.dayofyr if hasattr(t, "dayofyr") else t.dayofyear for t in time])
+    cycle = amplitude * np.sin(2 * np.pi * day / 365.25)[:, None, None]
+    noise = rng.normal(size=(len(time), n_lat, n_lon))
+    return (loc + cycle + noise).astype("float32")
+
+
+def global_dataset(
+    var="tas", n_members=3, n_years=10, resolution=2.0, freq="MS",
+    calendar="standard", units="K", seed=0, start="2000-01-01",
+):
+    """
+    CMIP-like global regular grid with members.
+
+    Longitudes are in (0, 360) and latitudes are decreasing, as in many raw model
+    outputs. The data have (member, time, lat, lon) dimensions and a `member_id`
+    coordinate.
+    """
+    periods = n_years * (12 if freq == "MS" else 365)
+    time = time_axis(start, periods, freq, calendar)
+    lat = np.arange(90 - resolution / 2, -90, -resolution)
+    lon = np.arange(resolution / 2, 360, resolution)
+    data = np.stack([
+        seasonal_signal(time, lat.size, lon.size, 288, 10, seed + member)
+        for member in range(n_members)
+    ])
+    return xr.Dataset(
+        {var: (["member", "time", "lat", "lon"], data, {"units": units})},
+        coords={
+            "member": np.arange(n_members),
+            "member_id": ("member", [f"r{i + 1}i1p1f1" for i in range(n_members)]),
+            "time": time,
+            "lat": ("lat", lat, {"standard_name": "latitude", "units": "degrees_north"}),
+            "lon": ("lon", lon, {"standard_name": "longitude", "units": "degrees_east"}),
+        },
+    )
+
+
+def rotated_pole_coordinates(rlon, rlat, pole_longitude=-162.0, pole_latitude=39.25):
+    """Geographical (lon, lat) of a rotated-pole grid, both with shape (rlat, rlon)."""
+    rlon, rlat = np.meshgrid(np.deg2rad(rlon), np.deg2rad(rlat))
+    pole_lon, pole_lat = np.deg2rad(pole_longitude), np.deg2rad(pole_latitude)
+    x = np.cos(rlat) * np.cos(rlon)
+    y = np.cos(rlat) * np.sin(rlon)
+    z = np.sin(rlat)
+    # Rotate back around the y axis (pole latitude) and the z axis (pole longitude)
+    theta, phi = -(np.pi / 2 - pole_lat), -(pole_lon + np.pi)
+    x, z = np.cos(theta) * x + np.sin(theta) * z, -np.sin(theta) * x + np.cos(theta) * z
+    x, y = np.cos(phi) * x + np.sin(phi) * y, -np.sin(phi) * x + np.cos(phi) * y
+    lon = np.rad2deg(np.arctan2(y, x))
+    lat = np.rad2deg(np.arcsin(np.clip(z, -1, 1)))
+    return lon, lat
+
+
+def cordex_dataset(
+    var="tas", n_years=5, n_rlat=106, n_rlon=103, resolution=0.44, freq="D",
+    calendar="noleap", units="K", seed=0,
+):
+    """
+    CORDEX-like rotated-pole curvilinear grid (EUR-44 shaped by default).
+
+    The data have (time, rlat, rlon) dimensions, two-dimensional `lat`/`lon`
+    coordinates and a `rotated_pole` grid mapping variable.
+    """
+    periods = n_years * (360 if calendar == "360_day" else 365) if freq == "D" else n_years * 12
+    time = time_axis("2000-01-01", periods, freq, calendar)
+    rlat = (np.arange(n_rlat) - n_rlat / 2) * resolution
+    rlon = (np.arange(n_rlon) - n_rlon / 2) * resolution
+    lon, lat = rotated_pole_coordinates(rlon, rlat)
+    data = seasonal_signal(time, n_rlat, n_rlon, 285, 8, seed)
+    return xr.Dataset(
+        {
+            var: (["time", "rlat", "rlon"], data,
+                  {"units": units, "grid_mapping": "rotated_pole"}),
+            "rotated_pole": ((), 0, {
+                "grid_mapping_name": "rotated_latitude_longitude",
+                "grid_north_pole_longitude": -162.0,
+                "grid_north_pole_latitude": 39.25,
+            }),
+        },
+        coords={
+            "time": time,
+            "rlat": ("rlat", rlat, {"standard_name": "grid_latitude"}),
+            "rlon": ("rlon", rlon, {"standard_name": "grid_longitude"}),
+            "lat": (["rlat", "rlon"], lat, {"standard_name": "latitude", "units": "degrees_north"}),
+            "lon": (["rlat", "rlon"], lon, {"standard_name": "longitude", "units": "degrees_east"}),
+        },
+    )
+
+
+def era5_hourly_dataset(
+    var="t2m", n_days=31, resolution=1.0, units="K", seed=0,
+    lat_bounds=(90, -90), lon_bounds=(0, 360),
+):
+    """
+    ERA5-like hourly series on a regular `latitude`/`longitude` grid.
+
+    Latitudes are decreasing and longitudes are in (0, 360), as in the CDS files.
+    """
+    time = pd.date_range("2000-01-01", periods=24 * n_days, freq="h")
+    latitude = np.arange(lat_bounds[0], lat_bounds[1] - resolution / 2, -resolution)
+    longitude = np.arange(lon_bounds[0], lon_bounds[1], resolution)
+    data = seasonal_signal(time, latitude.size, longitude.size, 285, 10, seed)
+    return xr.Dataset(
+        {var: (["time", "latitude", "longitude"], data, {"units": units})},
+        coords={
+            "time": time,
+            "latitude": ("latitude", latitude, {"units": "degrees_north"}),
+            "longitude": ("longitude", longitude, {"units": "degrees_east"}),
+        },
+    )
@@ -2,7 +2,111 @@ import pandas as pd
 import xarray as xr
 import numpy as np
 import os
+from functools import lru_cache
 from .utils import c_path_c3s_atlas
+from .temporal import TimeWindowIndexer
+
+class GWLPeriods:
+    """
+    Start and end years of the GWL periods of a set of members.
+
+    Parameters:
+    -----------
+    members : np.ndarray
+        Member ids.
+    start : np.ndarray
+        First year of the period of each member.
+    end : np.ndarray
+        Last year of the period of each member.
+    """
+    def __init__(self, members, start, end):
+        self.members = np.asarray(members)
+        self.start = np.asarray(start, dtype=int)
+        self.end = np.asarray(end, dtype=int)
+
+    def __len__(self):
+        return len(self.members)
+
+    def items(self):
+        """Iterate over (member, "YYYY-YYYY") pairs, as the GWLs Series does."""
+        for member, start, end in zip(self.members, self.start, self.end):
+            yield member, f"{start}-{end}"
+
+class GWLIndex:
+    """
+    Global Warming Levels table indexed by (member, scenario, GWL).
+
+    The "YYYY-YYYY" periods are parsed once into integer start/end years, with a
+    validity mask for the members that do not reach the GWL ("NA") or do not run
+    the scenario ("9999").
+
+    Parameters:
+    -----------
+    GWLs : DataFrame
+        DataFrame with the GWLs data, as returned by `load_GWLs`.
+    """
+    def __init__(self, GWLs):
+        self.members = np.asarray(GWLs.index.astype(str))
+        self.GWLs = list(dict.fromkeys(GWLs.columns.get_level_values(0)))
+        self.scenarios = list(dict.fromkeys(GWLs.columns.get_level_values(1)))
+        shape = (len(self.members), len(self.scenarios), len(self.GWLs))
+        self.start = np.full(shape, -1, dtype=int)
+        self.end = np.full(shape, -1, dtype=int)
+        self.valid = np.zeros(shape, dtype=bool)
+        for GWL, scenario in GWLs.columns:
+            years = GWLs[GWL, scenario].astype(str).str.extract(r"^\s*(\d{4})-(\d{4})\s*$")
+            valid = years[0].notna().values
+            idx = (slice(None), self.scenarios.index(scenario), self.GWLs.index(GWL))
+            self.valid[idx] = valid
+            self.start[idx] = np.where(valid, years[0].fillna(-1).astype(int).values, -1)
+            self.end[idx] = np.where(valid, years[1].fillna(-1).astype(int).values, -1)
+        self._member_positions = pd.Index(self.members)
+
+    def lookup(self, members, scenario, GWL):
+        """
+        Get the periods of many members at once.
+
+        Parameters:
+        -----------
+        members : array-like
+            Member ids.
+        scenario : str
+            Scenario name.
+        GWL : str
+            Global Warming Level (GWL).
+
+        Returns:
+        --------
+        start, end, valid : np.ndarray
+            First and last year of the period of each member and whether the member
+            reaches the GWL. Members missing from the table are not valid.
+        """
+        positions = self._member_positions.get_indexer(np.asarray(members).astype(str))
+        idx = (positions, self.scenarios.index(scenario), self.GWLs.index(str(GWL)))
+        valid = (positions >= 0) & self.valid[idx]
+        return self.start[idx], self.end[idx], valid
+
+    def select(self, ds, scenario, GWL):
+        """
+        Get the periods of the members of a dataset that reach the GWL.
+
+        Parameters:
+        -----------
+        ds : xarray.Dataset
+            The dataset with the `member_id` coordinate.
+        scenario : str
+            Scenario name.
+        GWL : str
+            Global Warming Level (GWL).
+
+        Returns:
+        --------
+        GWLPeriods
+            Periods of the members with a period, in the order of the dataset.
+        """
+        members = ds.member_id.values
+        start, end, valid = self.lookup(members, scenario, GWL)
+        return GWLPeriods(members[valid], start[valid], end[valid])
 
 def select_member_GWLs(ds, GWLs, project, scenario, GWL):
     '''
@@ -12,8 +116,8 @@ def select_member_GWLs(ds, GWLs, project, scenario, GWL):
     -----------
     ds : xarray.Dataset
         The dataset containing the GWLs data.
-    GWLs : DataFrame
-        DataFrame containing GWLs data.
+    GWLs : DataFrame or GWLIndex
+        DataFrame containing GWLs data, or the GWL index returned by `load_GWL_index`.
     project : str
         Model name, either 'CMIP6' or 'CMIP5'.
     scenario : str
@@ -23,9 +127,12 @@ def select_member_GWLs(ds, GWLs, project, scenario, GWL):
 
     Returns:
     --------
-    GWLs_members_with_period : DataFrame
+    GWLs_members_with_period : DataFrame or GWLPeriods
         GWLs data for the specified model, scenario, and GWL with period information.
+        GWLPeriods if `GWLs` is a GWLIndex.
     '''
+    if isinstance(GWLs, GWLIndex):
+        return GWLs.select(ds, scenario, GWL)
 
     members = np.intersect1d(ds.member_id.values, GWLs.index)
     GWLs_members = GWLs[GWL, scenario].loc[members]
@@ -48,7 +155,41 @@ def load_GWLs(model):
     GWLs: DataFrame
         A DataFrame containing the Global Warming Levels data for the specified model.
     '''
-    root_GWLs = 'warming_levels/'
+    # Convert all data to strings
+    return read_GWLs(model).astype(str)
+
+@lru_cache(maxsize=None)
+def load_GWL_index(model):
+    '''
+    Loads (once per model) the Global Warming Levels (GWLs) index for a given model.
+
+    Parameters:
+    -----------
+    model: str
+        The name of the model.
+
+    Returns:
+    --------
+    GWLIndex
+        The GWLs of the model indexed by member, scenario and GWL.
+    '''
+    return GWLIndex(read_GWLs(model))
+
+@lru_cache(maxsize=None)
+def read_GWLs(model):
+    '''
+    Reads (once per model) the Global Warming Levels (GWLs) CSV file for a given model.
+
+    Parameters:
+    -----------
+    model: str
+        The name of the model.
+
+    Returns:
+    --------
+    GWLs: DataFrame
+        The GWLs table as stored in the CSV file. It is shared between calls, do not modify it.
+    '''
     if model in ["CMIP5", "CMIP6"]:
         GWLs = pd.read_csv(f"{c_path_c3s_atlas}/auxiliar/GWLs/{model}_WarmingLevels.csv", 
                            header=[0, 1], index_col=[0])
@@ -58,12 +199,10 @@ def load_GWLs(model):
     elif model == "CORDEX-EUR-11":
         GWLs = pd.read_csv(f"{c_path_c3s_atlas}/auxiliar/GWLs/CMIP5_WarmingLevels.csv", 
                            header=[0, 1], index_col=[0])
-    # Convert all data to strings
-    GWLs = GWLs.astype(str)
 
     return GWLs
 
-def select_over_period(ds, mean_period):
+def select_over_period(ds, mean_period, indexer=None):
     """
     Function to select the data from a DataArray over a given time period.
     
@@ -73,17 +212,18 @@ def select_over_period(ds, mean_period):
         The DataArray to select from.
     mean_period: str
         The time period in format "YYYY-YYYY".
+    indexer: TimeWindowIndexer, optional
+        Indexer of the time coordinate of `ds`, to be shared between many calls.
     
     Returns:
     --------
     xarray.DataArray: 
         A new DataArray containing data for the specified period.
     """
-    start_date = mean_period.split('-')[0] + '-01-01'
-    end_date = mean_period.split('-')[1] + '-12-31'
-    return ds.sel(time=slice(start_date, end_date))
+    indexer = indexer or TimeWindowIndexer(ds)
+    return indexer.select(ds, mean_period)
 
-def mean_over_period(ds, mean_period):
+def mean_over_period(ds, mean_period, indexer=None):
     """
     Function to do a mean of the data from a DataArray over a given time period.
     
@@ -93,17 +233,17 @@ def mean_over_period(ds, mean_period):
         The DataArray to select from.
     mean_period:str
         The time period in format "YYYY-YYYY".
+    indexer: TimeWindowIndexer, optional
+        Indexer of the time coordinate of `ds`, to be shared between many calls.
     
     Returns:
     --------
     xarray.DataArray: 
         A new DataArray containing the mean of data for the specified period.
     """
-    start_date = mean_period.split('-')[0] + '-01-01'
-    end_date = mean_period.split('-')[1] + '-12-31'
-    return ds.sel(time=slice(start_date, end_date)).mean('time')
+    return select_over_period(ds, mean_period, indexer).mean('time')
 
-def GWLs_groupby_month(ds, mean_period):
+def GWLs_groupby_month(ds, mean_period, indexer=None):
     """
     Function to do a mean of the data from a DataArray over a given time period.
     
@@ -113,19 +253,20 @@ def GWLs_groupby_month(ds, mean_period):
         The DataArray to select from.
     mean_period:str
         The time period in format "YYYY-YYYY".
+    indexer: TimeWindowIndexer, optional
+        Indexer of the time coordinate of `ds`, to be shared between many calls.
     
     Returns:
     --------
     xarray.DataArray: 
         A new DataArray containing the mean of data for the specified period.
     """
+    ds = select_over_period(ds, mean_period, indexer)
     dates = pd.to_datetime(ds['time'].values)
     months = np.array([date.month for date in dates])
     ds = ds.assign_coords(month=('time', months))
-    start_date = mean_period.split('-')[0] + '-01-01'
-    end_date = mean_period.split('-')[1] + '-12-31'
     
-    return ds.sel(time=slice(start_date, end_date)).groupby('month').mean(dim='time', skipna=True)
+    return ds.groupby('month').mean(dim='time', skipna=True)
 
 def get_selected_data(ds, GWLs_members_with_period):
     """
@@ -135,15 +276,18 @@ def get_selected_data(ds, GWLs_members_with_period):
     ----------
     ds: xarray.Dataset
         The Dataset containing the data to be selected.
-    GWLs_members_with_period: dict
+    GWLs_members_with_period: dict or GWLPeriods
         A dictionary where the keys are the member names and the values are tuples
-        representing the time period (start_date, end_date).
+        representing the time period (start_date, end_date), or the periods
+        returned by `GWLIndex.select`.
 
     Returns:
     -------
     xarray.DataArray or xarray.Dataset
         A DataArray or Dataset with the selected data concatenated along the 'member' dimension.
     """
+    if isinstance(GWLs_members_with_period, GWLPeriods):
+        return ds.isel(member = np.isin(ds.member_id.values, GWLs_members_with_period.members))
     #Selecting data for each member
     selected_data = None
     members_gwl=[]
@@ -157,7 +301,7 @@ def get_selected_data(ds, GWLs_members_with_period):
         #    selected_data= select_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period)
 
     mem_inters_gwl = np.intersect1d(ds.member_id.values, members_gwl)
-    ds_members = ds.isel(member = np.in1d(ds.member_id.values, mem_inters_gwl))
+    ds_members = ds.isel(member = np.isin(ds.member_id.values, mem_inters_gwl))
     return ds_members
 
 def get_mean_data(ds,GWLs_members_with_period):
@@ -168,29 +312,167 @@ def get_mean_data(ds,GWLs_members_with_period):
     ----------
     ds: xarray.Dataset
         The Dataset containing the data to be selected.
-    GWLs_members_with_period: dict
+    GWLs_members_with_period: dict or GWLPeriods
         A dictionary where the keys are the member names and the values are tuples
-        representing the time period (start_date, end_date).
+        representing the time period (start_date, end_date), or the periods
+        returned by `GWLIndex.select`. With GWLPeriods the windows of all the members
+        are located at once and selected by position.
 
     Returns:
     -------
     xarray.DataArray or xarray.Dataset
         A DataArray or Dataset with the selected data concatenated along the 'member' dimension.
     """
+    if isinstance(GWLs_members_with_period, GWLPeriods):
+        ds_members = get_selected_data(ds, GWLs_members_with_period)
+        periods = GWLs_members_with_period.start, GWLs_members_with_period.end
+        # Align the periods with the order of the members in the dataset
+        order = pd.Index(GWLs_members_with_period.members).get_indexer(ds_members.member_id.values)
+        starts, ends = TimeWindowIndexer(ds_members).windows(periods[0][order], periods[1][order])
+        averaged_data = xr.concat([
+            ds_members.isel(member=[i], time=slice(start, end)).mean('time')
+            for i, (start, end) in enumerate(zip(starts, ends))
+        ], dim='member')
+        return averaged_data, ds_members
     # Applying time averaging for each member
+    indexer = TimeWindowIndexer(ds)
     averaged_data = None
     for member, mean_period in GWLs_members_with_period.items():
         if averaged_data:
             averaged_data = xr.concat([averaged_data, 
-                                       mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period)], 
+                                       mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period, indexer)], 
                                       dim = 'member')
         else:
-            averaged_data= mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period)
+            averaged_data= mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period, indexer)
 
     mem_inters_gwl = np.intersect1d(ds.member_id.values, averaged_data.member_id.values)
-    ds_members = ds.isel(member = np.in1d(ds.member_id.values, mem_inters_gwl))
+    ds_members = ds.isel(member = np.isin(ds.member_id.values, mem_inters_gwl))
     return averaged_data, ds_members
 
+def get_mean_data_batch(ds, GWL_index, scenarios, GWLs):
+    """
+    Gets the GWL window means of every member for many scenarios and GWLs at once.
+
+    The data are reduced once to cumulative yearly sums and counts (see
+    `cumulative_yearly_sums`). The mean over any window of years is then the
+    difference of two cumulative sums, so overlapping windows of different members,
+    scenarios and GWLs share the same single pass over the data.
+
+    Parameters:
+    ----------
+    ds: xarray.Dataset
+        The Dataset with `member` dimension and `member_id` coordinate.
+    GWL_index: GWLIndex
+        The GWLs index returned by `load_GWL_index`.
+    scenarios: list of str
+        Scenario names.
+    GWLs: list of str
+        Global Warming Levels, e.g. ['1.5', '2', '3', '4'].
+
+    Returns:
+    -------
+    xarray.Dataset
+        Window means with `scenario` and `gwl` dimensions. Members that do not reach
+        a GWL under a scenario are NaN.
+    """
+    GWLs = [str(GWL) for GWL in GWLs]
+    year_values, cum_sums, cum_counts = cumulative_yearly_sums(ds)
+    shape = (len(scenarios), len(GWLs), len(ds.member_id))
+    first = np.zeros(shape, dtype=int)
+    last = np.zeros(shape, dtype=int)
+    valid = np.zeros(shape, dtype=bool)
+    for i, scenario in enumerate(scenarios):
+        for j, GWL in enumerate(GWLs):
+            start, end, valid[i, j] = GWL_index.lookup(ds.member_id.values, scenario, GWL)
+            first[i, j] = np.searchsorted(year_values, start, side='left')
+            last[i, j] = np.searchsorted(year_values, end, side='right')
+    dims = ['scenario', 'gwl', 'member']
+    averaged_data = window_means(
+        ds, cum_sums, cum_counts, xr.DataArray(first, dims=dims), xr.DataArray(last, dims=dims)
+    )
+    averaged_data = averaged_data.where(xr.DataArray(valid, dims=dims))
+    return averaged_data.assign_coords(scenario=scenarios, gwl=GWLs)
+
+def cumulative_yearly_sums(ds):
+    """
+    Cumulative sums and counts of the valid values of a dataset over the years.
+
+    The time steps of each year are added with a single `np.add.reduceat` (the time
+    coordinate must be sorted), or with a grouped sum for dask-backed data, both
+    accumulating in float64 without casting the data. They are then accumulated over
+    the years with a leading zero, so the sum over the years [i0, i1) is
+    `cum_sums[i1] - cum_sums[i0]`.
+
+    Parameters:
+    ----------
+    ds: xarray.Dataset
+        The Dataset with a sorted time coordinate.
+
+    Returns:
+    -------
+    year_values: np.ndarray
+        The years of the dataset.
+    cum_sums, cum_counts: xarray.Dataset
+        Cumulative sums and counts with a `year` dimension one longer than `year_values`.
+    """
+    years = TimeWindowIndexer(ds).years
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+
+    def cumulative(yearly):
+        zero = xr.zeros_like(yearly.isel(year=[0]))
+        return xr.concat([zero, yearly.cumsum('year')], dim='year')
+
+    cum_sums, cum_counts = xr.Dataset(), xr.Dataset()
+    for var, data in ds.data_vars.items():
+        dims = [dim if dim != 'time' else 'year' for dim in data.dims]
+        if data.chunks:
+            # Lazy data are reduced by year with xarray and stay lazy
+            yearly_sums = data.groupby('time.year').sum('time', skipna=True, dtype='float64')
+            yearly_counts = data.notnull().groupby('time.year').sum('time')
+            yearly_sums = yearly_sums.drop_vars('year').transpose(*dims)
+            yearly_counts = yearly_counts.drop_vars('year').transpose(*dims)
+        else:
+            axis = data.get_axis_num('time')
+            values = data.values
+            valid = ~np.isnan(values)
+            coords = {name: coord for name, coord in data.coords.items() if 'time' not in coord.dims}
+            yearly_sums = xr.DataArray(np.add.reduceat(
+                np.where(valid, values, 0), starts, axis=axis, dtype='float64'
+            ), dims=dims, coords=coords)
+            yearly_counts = xr.DataArray(np.add.reduceat(
+                valid, starts, axis=axis, dtype='int64'
+            ), dims=dims, coords=coords)
+        cum_sums[var] = cumulative(yearly_sums)
+        cum_counts[var] = cumulative(yearly_counts)
+    return years[starts], cum_sums, cum_counts
+
+def window_means(ds, cum_sums, cum_counts, first, last):
+    """
+    Means over windows of years from the output of `cumulative_yearly_sums`.
+
+    Parameters:
+    ----------
+    ds: xarray.Dataset
+        The Dataset passed to `cumulative_yearly_sums`, for the output data types.
+    cum_sums, cum_counts: xarray.Dataset
+        Cumulative sums and counts.
+    first, last: xarray.DataArray
+        Position of the first year of each window and position after its last year.
+
+    Returns:
+    -------
+    xarray.Dataset
+        The mean of every window, with the dimensions of `first` and `last`.
+    """
+    window_sums = cum_sums.isel(year=last) - cum_sums.isel(year=first)
+    window_counts = cum_counts.isel(year=last) - cum_counts.isel(year=first)
+    averaged_data = window_sums / window_counts.where(window_counts > 0)
+    # Keep the floating point type of the data, as the mean over time does
+    for var in averaged_data.data_vars:
+        if np.issubdtype(ds[var].dtype, np.floating):
+            averaged_data[var] = averaged_data[var].astype(ds[var].dtype)
+    return averaged_data
+
 def get_mean_data_by_months(ds,GWLs_members_with_period):
     """
     Gets the mean of data for each member based on the specified time periods.
@@ -209,15 +491,16 @@ def get_mean_data_by_months(ds,GWLs_members_with_period):
         A DataArray or Dataset with the selected data concatenated along the 'member' dimension.
     """
     # Applying time averaging for each member
+    indexer = TimeWindowIndexer(ds)
     averaged_data = None
     for member, mean_period in GWLs_members_with_period.items():
         if averaged_data:
             averaged_data = xr.concat([averaged_data, 
-                                       GWLs_groupby_month(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period)], 
+                                       GWLs_groupby_month(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period, indexer)], 
                                       dim = 'member')
         else:
-            averaged_data= mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period)
+            averaged_data= mean_over_period(ds.sel(member=np.where(ds.member_id == member)[0]), mean_period, indexer)
 
     mem_inters_gwl = np.intersect1d(ds.member_id.values, averaged_data.member_id.values)
-    ds_members = ds.isel(member = np.in1d(ds.member_id.values, mem_inters_gwl))
+    ds_members = ds.isel(member = np.isin(ds.member_id.values, mem_inters_gwl))
     return averaged_data, ds_members
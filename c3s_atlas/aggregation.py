@@ -1,5 +1,8 @@
 from enum import Enum
 
+import numpy as np
+import xarray as xr
+
 
 class AggregationFunction(Enum):
     Min = "minimum"
@@ -10,7 +13,9 @@ class AggregationFunction(Enum):
     Percentile95 = "per95"
 
 
-def aggregate_in_time(ds: any, agg_funct: AggregationFunction, agg_res: str = "1D"):
+def aggregate_in_time(
+    ds: any, agg_funct: AggregationFunction, agg_res: str = "1D", dtype: str = None
+):
     """
     Group data by day and by using and aggregation function.
 
@@ -18,20 +23,40 @@ def aggregate_in_time(ds: any, agg_funct: AggregationFunction, agg_res: str = "1
     ----------
     ds (xr.Dataset): dataset to group its value by its time variable.
     agg_funct (AggregationFunction): aggregation function to use.
+    agg_res (str): resampling frequency.
+    dtype (str): data type of the result (e.g. "float32"). Means and sums are
+        accumulated in float64 and cast afterwards. If None, the data type
+        returned by xarray is kept.
 
     Returns
     -------
     grouped_ds (xr.Dataset): dataset with variables aggregated spatially.
     """
+    if agg_res == "1D" and agg_funct in BLOCK_FUNCTIONS and steps_per_day(ds) is not None:
+        return aggregate_daily_blocks(ds, agg_funct, dtype=dtype)
+    return resample_in_time(ds, agg_funct, agg_res, dtype)
+
+
+def resample_in_time(
+    ds: any, agg_funct: AggregationFunction, agg_res: str = "1D", dtype: str = None
+):
+    """
+    Group data by time with `resample` and an aggregation function.
+
+    See `aggregate_in_time`, which uses this function unless the data are regular
+    sub-daily data aggregated to daily data.
+    """
+    # Accumulate in float64 without making a float64 copy of the data
+    accumulate = {} if dtype is None else {"dtype": "float64"}
     resampled = ds.resample(time=agg_res)
     if agg_funct == AggregationFunction.Mean:
-        result = resampled.mean("time")
+        result = resampled.mean("time", **accumulate)
     elif agg_funct == AggregationFunction.Min:
         result = resampled.min("time")
     elif agg_funct == AggregationFunction.Max:
         result = resampled.max("time")
     elif agg_funct == AggregationFunction.Sum:
-        result = resampled.sum("time")
+        result = resampled.sum("time", **accumulate)
     elif agg_funct == AggregationFunction.Percentile99:
         result = resampled.quantile(q=0.99, dim="time")
     elif agg_funct == AggregationFunction.Percentile95:
@@ -42,4 +67,122 @@ def aggregate_in_time(ds: any, agg_funct: AggregationFunction, agg_res: str = "1
             "one of the following: 'maximum', 'minimum', 'mean', 'sum', "
             "'per99', 'per95'."
         )
+    if dtype is not None:
+        result = result.astype(dtype)
+    return result
+
+
+# Aggregations computed on (day, step) blocks by `aggregate_daily_blocks`
+BLOCK_FUNCTIONS = {
+    AggregationFunction.Mean: "mean",
+    AggregationFunction.Min: "min",
+    AggregationFunction.Max: "max",
+    AggregationFunction.Sum: "sum",
+}
+
+
+def steps_per_day(ds: any):
+    """
+    Number of time steps per day of regular sub-daily data (e.g. 24 for hourly data).
+
+    Parameters
+    ----------
+    ds (xr.Dataset): dataset with a time dimension
+
+    Returns
+    -------
+    int, or None if the time values are not datetime64 values with a constant step
+    dividing the day
+    """
+    time = ds["time"].values
+    if time.size < 2 or not np.issubdtype(time.dtype, np.datetime64):
+        return None
+    step = np.diff(time.astype("datetime64[ns]").astype("int64"))
+    day = 86400 * 10**9
+    if step[0] <= 0 or step[0] >= day or day % step[0] or (step != step[0]).any():
+        return None
+    return int(day // step[0])
+
+
+def aggregate_daily_blocks(
+    ds: any, agg_funct: AggregationFunction, dtype: str = None, days_per_block: int = 366
+):
+    """
+    Aggregate regular sub-daily data to daily data by reshaping the time steps of
+    the whole days into (day, step) blocks.
+
+    The whole days are reduced with `coarsen`, which keeps the dask chunks aligned
+    with the days and reshapes in-memory arrays without copying them. Data still
+    lazily read from a file are reduced `days_per_block` days at a time, so only one
+    block is in memory at once. The incomplete days at both ends (e.g. after shifting
+    the precipitation by one hour) are resampled. The result is the same as
+    `aggregate_in_time` with a daily resampling, except for the variables without
+    time dimension, which are kept as they are instead of being repeated every day.
+
+    Parameters
+    ----------
+    ds (xr.Dataset): regular sub-daily data, see `steps_per_day`
+    agg_funct (AggregationFunction): mean, minimum, maximum or sum
+    dtype (str): data type of the result (e.g. "float32"). Means and sums are
+        accumulated in float64 and cast afterwards.
+    days_per_block (int): days reduced at once when the data are read from a file,
+        or when in-memory means and sums are accumulated in float64.
+
+    Returns
+    -------
+    grouped_ds (xr.Dataset): daily data
+    """
+    if agg_funct not in BLOCK_FUNCTIONS:
+        raise ValueError(
+            "Aggregation function not implented. Please, specify "
+            "one of the following: 'maximum', 'minimum', 'mean', 'sum'."
+        )
+    steps = steps_per_day(ds)
+    time = ds.indexes["time"]
+    # Whole days run from the first midnight to the last complete day
+    first = int(np.argmax(time == time.floor("D")))
+    if time[first] != time[first].floor("D"):
+        first = len(time)
+    n_days = (len(time) - first) // steps
+    last = first + n_days * steps
+    accumulate = dtype is not None and agg_funct in [
+        AggregationFunction.Mean, AggregationFunction.Sum
+    ]
+
+    def reduce(block):
+        # Coarsen takes no dtype, so only one block at a time is cast to float64
+        if accumulate:
+            block = block.astype("float64")
+        days = getattr(block.coarsen(time=steps), BLOCK_FUNCTIONS[agg_funct])()
+        return days.assign_coords(time=block.indexes["time"][::steps])
+
+    static = []
+    if isinstance(ds, xr.Dataset):
+        static = [name for name, da in ds.data_vars.items() if "time" not in da.dims]
+        variables = ds.drop_vars(static).variables.values()
+    else:
+        variables = [ds.variable]
+    lazily_read = any(
+        not variable._in_memory and variable.chunks is None for variable in variables
+    )
+    timed = ds.drop_vars(static) if static else ds
+    parts = []
+    if first > 0:
+        parts.append(resample_in_time(timed.isel(time=slice(0, first)), agg_funct, "1D", dtype))
+    body = timed.isel(time=slice(first, last))
+    if body.chunks:
+        # Chunks of whole days so every block lies in a single chunk
+        body = body.chunk(time=max(body.chunksizes["time"][0] // steps, 1) * steps)
+    blockwise = lazily_read or (accumulate and not body.chunks)
+    block_size = days_per_block * steps if blockwise else max(last - first, 1)
+    for start in range(0, last - first, block_size):
+        block = body.isel(time=slice(start, start + block_size))
+        parts.append(reduce(block.load() if lazily_read else block))
+    if last < len(time):
+        parts.append(resample_in_time(timed.isel(time=slice(last, None)), agg_funct, "1D", dtype))
+    result = parts[0] if len(parts) == 1 else xr.concat(parts, dim="time")
+    if static:
+        result = result.assign({name: ds[name] for name in static})
+    if dtype is not None:
+        result = result.astype(dtype)
     return result
@@ -0,0 +1,211 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from c3s_atlas.logger import get_logger
+from c3s_atlas.utils import fill_region, interp_columns, nanquantile_columns
+
+logger = get_logger("Bias-adjustment")
+
+
+class BiasAdjustment:
+    """
+    A class for bias adjusting data block by block into a dataset to fill.
+
+    Parameters
+    ----------
+    bias_adjustment_attrs (dict): A dictionary containing the variable name ("var_name"),
+        the method ("method": "eqm" for empirical quantile mapping or "linear_scaling"),
+        and optionally the kind of correction ("kind": "+" additive or "*" multiplicative),
+        the grouping of the time steps ("group": None or "month"), the number of
+        quantiles ("n_quantiles"), the number of longitudes per block ("block_size")
+        and the number of threads ("max_workers").
+    """
+
+    def __init__(
+        self,
+        bias_adjustment_attrs: dict
+    ):
+        self.var_name = bias_adjustment_attrs['var_name']
+        self.method = bias_adjustment_attrs['method']
+        self.kind = bias_adjustment_attrs.get('kind', '+')
+        self.group = bias_adjustment_attrs.get('group', None)
+        self.n_quantiles = bias_adjustment_attrs.get('n_quantiles', 100)
+        self.block_size = bias_adjustment_attrs.get('block_size', 10)
+        self.max_workers = bias_adjustment_attrs.get('max_workers', None)
+        if self.method not in ADJUSTMENT_FUNCTIONS:
+            raise ValueError(
+                f"Bias adjustment method '{self.method}' not implemented. Please, "
+                f"specify one of the following: {list(ADJUSTMENT_FUNCTIONS.keys())}."
+            )
+
+    def __call__(self, obs, hist, fut, ds_to_fill, variable=None, path=None):
+        """
+        Bias adjust the future data and store it in the dataset to fill.
+
+        The grid is split into blocks of `block_size` longitudes which are adjusted
+        in parallel and written into `ds_to_fill` as soon as they are ready. With a
+        Zarr store the blocks are widened to whole chunks of the store, so no chunk
+        is written by two threads at once.
+
+        Parameters
+        ----------
+        obs (xarray.Dataset): observations over the calibration period
+        hist (xarray.Dataset): model data over the calibration period
+        fut (xarray.Dataset): model data to be adjusted, on the same grid
+        ds_to_fill (xarray.Dataset): dataset created with `utils.get_ds_to_fill`
+        variable (str): variable of `ds_to_fill`. The default is `var_name`
+        path (str or pathlib.Path): Zarr store of `ds_to_fill` when it was created
+            with the "zarr" storage
+
+        Returns
+        -------
+        ds_to_fill (xarray.Dataset): the dataset filled with the adjusted data
+        """
+        variable = variable or self.var_name
+        groups = list(zip(
+            time_groups(obs, self.group), time_groups(hist, self.group), time_groups(fut, self.group)
+        ))
+        blocks = lon_blocks(ds_to_fill, variable, self.block_size, path)
+
+        def adjust_block(block):
+            values = [
+                ds[self.var_name].isel(lon=block).transpose("time", "lat", "lon").values
+                for ds in (obs, hist, fut)
+            ]
+            shape = values[2].shape
+            obs_b, hist_b, fut_b = (v.reshape(v.shape[0], -1) for v in values)
+            adjusted = np.full(fut_b.shape, np.nan, dtype=fut_b.dtype)
+            for obs_idx, hist_idx, fut_idx in groups:
+                adjusted[fut_idx] = ADJUSTMENT_FUNCTIONS[self.method](
+                    obs_b[obs_idx], hist_b[hist_idx], fut_b[fut_idx],
+                    kind=self.kind, n_quantiles=self.n_quantiles
+                )
+            adjusted = xr.DataArray(adjusted.reshape(shape), dims=["time", "lat", "lon"])
+            dims = ds_to_fill[variable].dims
+            fill_region(
+                ds_to_fill, variable, adjusted.transpose(*dims).values, {"lon": block}, path
+            )
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(adjust_block, blocks))
+        logger.info(f"{variable} bias adjusted with {self.method} in {len(blocks)} blocks")
+        return ds_to_fill
+
+
+def lon_blocks(ds_to_fill: xr.Dataset, variable: str, block_size: int, path=None) -> list:
+    """
+    Split the longitudes of the dataset to fill into blocks adjusted in parallel.
+
+    Blocks written to a Zarr store (`path` is not None) cover whole lon chunks of the
+    store, i.e. `block_size` is rounded up to a multiple of the chunk size, because
+    concurrent writes of parts of the same chunk overwrite each other.
+
+    Parameters
+    ----------
+    ds_to_fill (xarray.Dataset): dataset created with `utils.get_ds_to_fill`
+    variable (str): variable of `ds_to_fill`
+    block_size (int): number of longitudes per block
+    path (str or pathlib.Path): Zarr store of `ds_to_fill`, if any
+
+    Returns
+    -------
+    list of slice with the longitudes of each block
+    """
+    n_lon = ds_to_fill.sizes["lon"]
+    if path is not None:
+        da = ds_to_fill[variable]
+        chunks = da.encoding.get("chunks")
+        if chunks is not None:
+            chunk = chunks[da.dims.index("lon")]
+        else:
+            chunk = max(da.chunksizes["lon"]) if da.chunks else n_lon
+        block_size = -(-block_size // chunk) * chunk
+    return [slice(i, min(i + block_size, n_lon)) for i in range(0, n_lon, block_size)]
+
+
+def time_groups(ds: xr.Dataset, group: str = None) -> list:
+    """
+    Get the time indices of each group of time steps.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): data with a time dimension
+    group (str): None (all the time steps together) or "month"
+
+    Returns
+    -------
+    list of np.ndarray with the time indices of each group
+    """
+    if group is None:
+        return [np.arange(len(ds.time))]
+    elif group == "month":
+        months = ds["time.month"].values
+        return [np.flatnonzero(months == month) for month in range(1, 13)]
+    raise ValueError(f"Group '{group}' not implemented. Please, specify None or 'month'.")
+
+
+def empirical_quantile_mapping(obs, hist, fut, kind="+", n_quantiles=100):
+    """
+    Empirical quantile mapping of every column (grid cell) of `fut`.
+
+    The quantiles of `obs` and `hist` are computed for all the cells at once and the
+    correction between them is interpolated at the future values. Values outside the
+    calibration range receive the correction of the extreme quantiles.
+
+    Parameters
+    ----------
+    obs (np.ndarray): (time, cells) observations
+    hist (np.ndarray): (time, cells) model data over the calibration period
+    fut (np.ndarray): (time, cells) model data to be adjusted
+    kind (str): "+" additive or "*" multiplicative correction
+    n_quantiles (int): number of quantiles
+
+    Returns
+    -------
+    np.ndarray: (time, cells) adjusted data
+    """
+    quantiles = np.linspace(0, 1, n_quantiles)
+    obs_q = nanquantile_columns(obs, quantiles)
+    hist_q = nanquantile_columns(hist, quantiles)
+    if kind == "+":
+        correction = interp_columns(fut, hist_q, obs_q - hist_q)
+        return (fut + correction).astype(fut.dtype)
+    elif kind == "*":
+        ratio = np.divide(obs_q, hist_q, out=np.ones(hist_q.shape), where=hist_q > 0)
+        correction = interp_columns(fut, hist_q, ratio)
+        return (fut * correction).astype(fut.dtype)
+    raise ValueError(f"Kind '{kind}' not implemented. Please, specify '+' or '*'.")
+
+
+def linear_scaling(obs, hist, fut, kind="+", n_quantiles=None):
+    """
+    Linear scaling of every column (grid cell) of `fut`.
+
+    Parameters
+    ----------
+    obs (np.ndarray): (time, cells) observations
+    hist (np.ndarray): (time, cells) model data over the calibration period
+    fut (np.ndarray): (time, cells) model data to be adjusted
+    kind (str): "+" additive or "*" multiplicative correction
+    n_quantiles: not used, kept for a common signature
+
+    Returns
+    -------
+    np.ndarray: (time, cells) adjusted data
+    """
+    obs_mean = np.nanmean(obs, axis=0, dtype="float64")
+    hist_mean = np.nanmean(hist, axis=0, dtype="float64")
+    if kind == "+":
+        return (fut + (obs_mean - hist_mean)).astype(fut.dtype)
+    elif kind == "*":
+        ratio = np.divide(obs_mean, hist_mean, out=np.ones(hist_mean.shape), where=hist_mean > 0)
+        return (fut * ratio).astype(fut.dtype)
+    raise ValueError(f"Kind '{kind}' not implemented. Please, specify '+' or '*'.")
+
+
+ADJUSTMENT_FUNCTIONS = {
+    "eqm": empirical_quantile_mapping,
+    "linear_scaling": linear_scaling,
+}
@@ -0,0 +1,313 @@
+import functools
+import hashlib
+import inspect
+import marshal
+import os
+import time
+from pathlib import Path
+from typing import Callable, Union
+
+import xarray as xr
+
+from c3s_atlas.logger import get_logger
+
+logger = get_logger("Result-cache")
+
+# Environment variables of the default cache
+CACHE_DIR_VARIABLE = "C3S_ATLAS_CACHE_DIR"
+CACHE_SIZE_VARIABLE = "C3S_ATLAS_CACHE_MAX_BYTES"
+
+
+def data_token(data: Union[xr.Dataset, xr.DataArray]) -> str:
+    """
+    Identify the content of a Dataset or DataArray without reading it when possible.
+
+    Data variables still lazily read from a file (not modified since they were opened
+    and indexed by coordinates along all their dimensions) are identified by the path,
+    modification time and size of the file together with the coordinates of the
+    selection. Dask-backed data are identified by the tokens of their chunks, and any
+    other data by their values. The attributes and encoding of every variable are
+    part of the token.
+
+    Data modified in place (e.g. through `.values`) keep the encoding of the file and
+    are not detected: drop their encoding (`da.encoding = {}`) to identify them by
+    their values.
+
+    Parameters
+    ----------
+    data : xarray.Dataset or xarray.DataArray
+        The data.
+
+    Returns
+    -------
+    str
+        A hexadecimal token.
+    """
+    from dask.base import tokenize
+
+    if isinstance(data, xr.Dataset):
+        coords, data_vars = data.coords, dict(data.data_vars)
+    else:
+        coords, data_vars = data.coords, {("data", data.name): data}
+    source = data.encoding.get("source")
+    file_id = None
+    if source and os.path.exists(source):
+        stat = os.stat(source)
+        file_id = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+
+    def variable_token(variable, from_file):
+        content = file_id if from_file else variable.data
+        return tokenize(
+            variable.dims, variable.shape, str(variable.dtype), variable.attrs,
+            variable.encoding, content,
+        )
+
+    tokens = [
+        (str(name), variable_token(coord.variable, False)) for name, coord in coords.items()
+    ]
+    for name, da in data_vars.items():
+        from_file = (
+            file_id is not None
+            and da.chunks is None
+            and da.encoding.get("source") == source
+            and all(dim in data.indexes for dim in da.dims)
+        )
+        tokens.append((str(name), variable_token(da.variable, from_file)))
+    return tokenize(type(data).__name__, sorted(tokens), data.attrs)
+
+
+def function_token(function: Callable) -> str:
+    """
+    Identify the code of a function and the versions of c3s_atlas and xarray.
+
+    Only the code of the function itself is hashed (that of the function wrapped by
+    decorators, if any); the version of c3s_atlas covers the functions it calls.
+    """
+    from dask.base import tokenize
+
+    import c3s_atlas
+
+    code = getattr(inspect.unwrap(function), "__code__", None)
+    return tokenize(
+        function.__module__, function.__qualname__, c3s_atlas.__version__, xr.__version__,
+        hashlib.sha256(marshal.dumps(code)).hexdigest() if code is not None else None,
+    )
+
+
+def call_key(function: Callable, args: tuple, kwargs: dict) -> str:
+    """
+    Key of a function call from the code of the function (see `function_token`), its
+    data and parameters.
+
+    Parameters
+    ----------
+    function : callable
+        The function.
+    args, kwargs : tuple, dict
+        The arguments of the call. Datasets and DataArrays are identified with
+        `data_token`, any other argument with `dask.base.tokenize`.
+
+    Returns
+    -------
+    str
+        A hexadecimal key.
+    """
+    from dask.base import tokenize
+
+    def normalize(value):
+        if isinstance(value, (xr.Dataset, xr.DataArray)):
+            return ("xarray", data_token(value))
+        return value
+
+    return tokenize(
+        function_token(function),
+        [normalize(arg) for arg in args],
+        {name: normalize(value) for name, value in sorted(kwargs.items())},
+    )
+
+
+class ResultCache:
+    """
+    A content-addressed cache of function results stored as NetCDF files.
+
+    The results of a call are stored under a key computed from the function, its
+    input data and its parameters (see `call_key`), so a call repeated with
+    unchanged inputs reads the stored result instead of computing it again. The
+    least recently used files are evicted when the cache grows over `max_bytes`.
+    Only Dataset and DataArray results are stored, other results are returned
+    without caching.
+
+    Parameters
+    ----------
+    cache_dir (str or pathlib.Path): directory of the cache, created if needed
+    max_bytes (int): maximum size of the cache. The default is 10 GiB
+
+    Examples
+    --------
+    >>> cache = ResultCache("~/.cache/c3s-atlas")
+    >>> apply_fixers = cache(fixers.apply_fixers)
+    >>> ds = apply_fixers(ds, "tas", "cmip6", map_variables)  # computed and stored
+    >>> ds = apply_fixers(ds, "tas", "cmip6", map_variables)  # read from the cache
+    """
+
+    def __init__(self, cache_dir: Union[str, Path], max_bytes: int = 10 * 2**30):
+        self.cache_dir = Path(cache_dir).expanduser()
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path(self, key: str, kind: str) -> Path:
+        """Path of the file of a key, `kind` being "dataset" or "dataarray"."""
+        return self.cache_dir / f"{key}.{kind}.nc"
+
+    def get(self, key: str):
+        """
+        Read a stored result.
+
+        Returns
+        -------
+        xarray.Dataset, xarray.DataArray or None
+            The result, loaded in memory, or None if the key is not stored.
+        """
+        for kind, load in [("dataset", xr.load_dataset), ("dataarray", xr.load_dataarray)]:
+            path = self.path(key, kind)
+            try:
+                result = load(path)
+            except FileNotFoundError:
+                continue
+            # The modification time records the last use for the eviction
+            os.utime(path)
+            return result
+        return None
+
+    def put(self, key: str, result) -> bool:
+        """
+        Store a result and evict the least recently used files over the size limit.
+
+        The file is written to a temporary name and renamed once complete, so
+        concurrent readers never see truncated files.
+
+        Returns
+        -------
+        bool
+            True if the result was stored.
+        """
+        if isinstance(result, xr.Dataset):
+            path = self.path(key, "dataset")
+        elif isinstance(result, xr.DataArray):
+            path = self.path(key, "dataarray")
+        else:
+            return False
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            result.to_netcdf(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as error:
+            logger.info(f"Result {key} could not be cached: {error}")
+            return False
+        finally:
+            if tmp_path.exists():
+                os.remove(tmp_path)
+        self.evict(keep=path)
+        return True
+
+    def size(self) -> int:
+        """Bytes stored in the cache."""
+        return sum(path.stat().st_size for path in self.cache_dir.glob("*.nc"))
+
+    def evict(self, keep: Path = None):
+        """
+        Remove the least recently used files until the cache fits in `max_bytes`.
+
+        Parameters
+        ----------
+        keep (pathlib.Path): file never removed, e.g. the one just written
+        """
+        files = []
+        for path in self.cache_dir.glob("*.nc"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logger.info(f"Evicted {path.name} from the cache ({size / 2**20:.1f} MiB)")
+
+    def clear(self):
+        """Remove every stored result."""
+        for path in self.cache_dir.glob("*.nc"):
+            os.remove(path)
+
+    def __call__(self, function: Callable) -> Callable:
+        """
+        Wrap a function so its results are read from or stored in the cache.
+
+        Parameters
+        ----------
+        function (callable): function returning a Dataset or DataArray
+
+        Returns
+        -------
+        callable: the cached function
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            key = call_key(function, args, kwargs)
+            result = self.get(key)
+            if result is not None:
+                logger.info(
+                    f"{function.__name__} read from the cache in "
+                    f"{time.perf_counter() - start:.2f} s"
+                )
+                return result
+            result = function(*args, **kwargs)
+            self.put(key, result)
+            return result
+        return wrapper
+
+
+def cached(function: Callable = None, cache: ResultCache = None):
+    """
+    Cache a function in the given cache or in the default one.
+
+    The default cache is only created when the `C3S_ATLAS_CACHE_DIR` environment
+    variable is set (its size limit is read from `C3S_ATLAS_CACHE_MAX_BYTES`),
+    otherwise the function is returned unchanged, so the library never writes to
+    disk unless asked to.
+
+    Parameters
+    ----------
+    function (callable): the function, or None to use `cached` as a decorator
+        factory, e.g. `@cached(cache=ResultCache(path))`
+    cache (ResultCache): the cache. The default is the cache of the environment
+
+    Returns
+    -------
+    callable: the cached function
+    """
+    if function is None:
+        return functools.partial(cached, cache=cache)
+    cache = cache or default_cache()
+    if cache is None:
+        return function
+    return cache(function)
+
+
+@functools.lru_cache(maxsize=1)
+def default_cache() -> ResultCache:
+    """The cache of the `C3S_ATLAS_CACHE_DIR` environment variable, or None."""
+    cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+    if not cache_dir:
+        return None
+    max_bytes = os.environ.get(CACHE_SIZE_VARIABLE)
+    return ResultCache(cache_dir, int(max_bytes)) if max_bytes else ResultCache(cache_dir)
@@ -0,0 +1,522 @@
+"""
+Declarative batch runner of the C3S Atlas workflow.
+
+A job spec (YAML or JSON) lists the steps of the workflow and a matrix of values
+(variables, projects, scenarios, seasons, periods...) referenced in the steps as
+"{name}" placeholders, e.g.:
+
+    output_dir: ./atlas-job
+    max_workers: 4
+    matrix:
+      scenario: [ssp245, ssp585]
+      season: {DJF: [12, 1, 2], JJA: [6, 7, 8]}
+    steps:
+      - name: fixed
+        step: fixers
+        input: "data/CMIP6/tas_{scenario}_*.nc"
+        variable: tas
+        project: cmip6
+        map_variables: {dataset_variable: {tas: tas}, aggregation: {tas: mean}}
+      - name: regridded
+        step: interpolation
+        needs: fixed
+        attrs: {interpolation_method: conservative_normed, resolution: 1.0, var_name: tas}
+      - name: map
+        step: analysis
+        needs: regridded
+        function: mean_values_map
+        args: [tas, CMIP6, change]
+        kwargs:
+          diff: abs
+          season: "{season}"
+          period: {start: "2081", stop: "2100"}
+      - name: robustness
+        step: analysis
+        needs: regridded
+        function: categories_robustness
+        args: [tas]
+        kwargs:
+          season: "{season}"
+          period: {start: "2081", stop: "2100"}
+      - name: figure
+        step: product
+        needs: [map, robustness]
+        function: hatched_map_plot
+        var: tas
+        input_kwargs: {categories: robustness}
+        output: "figures/tas_{scenario}_{season}.png"
+        attrs: {project: CMIP6, scenario: "{scenario}", season_name: "{season!s}", unit: degC}
+        kwargs:
+          mode: change
+          diff: abs
+          period: {start: "2081", stop: "2100"}
+          baseline_period: {start: "1981", stop: "2010"}
+
+A matrix entry is a list of values or a mapping of labels to values. The labels
+name the outputs (e.g. "tas_ssp245_DJF.png") and a setting made of a single
+placeholder gets the value itself (e.g. the months [12, 1, 2] for "{season}"), unless
+the placeholder is converted to a string (e.g. the label "DJF" for "{season!s}").
+
+Every step is run once per combination of the matrix values it references (directly
+or through the steps it needs), so the steps shared by many products (e.g. the
+fixers, which do not depend on the season) are only run once. The steps run in
+parallel processes as soon as their inputs are ready and the completed steps are
+recorded in a checkpoint file, so a job interrupted or partially failed resumes
+where it stopped.
+
+The steps are:
+    fixers: `fixers.apply_fixers` on the files of `input` (glob pattern)
+    index: a function of `indexes` (or a dotted path, e.g. "xclim.indices.tx_days_above")
+        called with the input variables given in `variables` ({argument: variable})
+    interpolation: `interpolation.Interpolator` with `attrs`
+    analysis: a function of `analysis` called with the input dataset, `args` and `kwargs`.
+        Tuple results are stored as one variable per Dataset or DataArray element
+    product: a plot function of `products` rendered with `rendering.render_figure` on
+        the output of the first step it needs. `input_kwargs` ({argument: step}) passes
+        the outputs of other needed steps as arguments of the plot function
+
+Mappings with only "start" and "stop" keys are converted to slices.
+"""
+import argparse
+import hashlib
+import importlib
+import itertools
+import json
+import os
+import string
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from glob import glob
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.logger import get_logger
+
+logger = get_logger("Job-runner")
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def load_job(path: Union[str, Path]) -> dict:
+    """
+    Read a job spec from a YAML or JSON file.
+
+    Parameters
+    ----------
+    path (str or pathlib.Path): path of the job spec
+
+    Returns
+    -------
+    dict: the job spec
+    """
+    path = Path(path)
+    with open(path) as file:
+        if path.suffix in [".yaml", ".yml"]:
+            import yaml
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def placeholders(value) -> set:
+    """Names of the "{name}" placeholders found in the strings of a value."""
+    if isinstance(value, str):
+        return {field for _, field, _, _ in string.Formatter().parse(value) if field}
+    if isinstance(value, dict):
+        return set().union(*map(placeholders, value.values()))
+    if isinstance(value, (list, tuple)):
+        return set().union(*map(placeholders, value))
+    return set()
+
+
+def matrix_value(matrix: dict, name: str, label):
+    """Value of a label of a matrix entry given as a mapping, or the label itself."""
+    entry = matrix.get(name)
+    return entry[label] if isinstance(entry, dict) else label
+
+
+def format_values(value, values: dict, matrix: dict = None):
+    """
+    Replace the "{name}" placeholders found in the strings of a value.
+
+    A string made of a single placeholder is replaced by the matrix value itself,
+    keeping its type (e.g. a number or the list of months of a season label).
+    """
+    matrix = matrix or {}
+    if isinstance(value, str):
+        fields = placeholders(value)
+        if len(fields) == 1 and value == f"{{{next(iter(fields))}}}":
+            name = next(iter(fields))
+            return matrix_value(matrix, name, values[name])
+        return value.format_map(values) if fields else value
+    if isinstance(value, dict):
+        return {key: format_values(item, values, matrix) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [format_values(item, values, matrix) for item in value]
+    return value
+
+
+def to_python(value):
+    """Convert the mappings with only "start" and "stop" keys to slices."""
+    if isinstance(value, dict):
+        if value and set(value) <= {"start", "stop"}:
+            return slice(value.get("start"), value.get("stop"))
+        return {key: to_python(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_python(item) for item in value]
+    return value
+
+
+def build_tasks(job: dict) -> dict:
+    """
+    Build the dependency graph of the tasks of a job.
+
+    Every step is expanded over the combinations of the matrix values it references.
+    Tasks with the same step, settings and inputs get the same key and are only
+    built once.
+
+    Parameters
+    ----------
+    job (dict): the job spec
+
+    Returns
+    -------
+    dict: the tasks by key, in an order where every task follows the tasks it needs.
+        Each task has the step name ("name"), kind ("step"), formatted settings
+        ("config"), keys of the tasks it needs ("needs"), the matrix values it
+        depends on ("values") and its output path ("output").
+    """
+    matrix = job.get("matrix", {})
+    output_dir = Path(job.get("output_dir", "."))
+    steps = {step["name"]: step for step in job["steps"]}
+    # Matrix names every step depends on, including those of the steps it needs
+    dependencies = {}
+    for name, step in steps.items():
+        for needed in as_list(step.get("needs")):
+            if needed not in dependencies:
+                raise ValueError(
+                    f"Step '{name}' needs '{needed}', which must be defined before it."
+                )
+        dependencies[name] = placeholders(step).union(
+            *(dependencies[needed] for needed in as_list(step.get("needs")))
+        )
+        unknown = dependencies[name] - set(matrix)
+        if unknown:
+            raise ValueError(f"Step '{name}' uses {sorted(unknown)}, which are not in the matrix.")
+        for needed in step.get("input_kwargs", {}).values():
+            if needed not in as_list(step.get("needs")):
+                raise ValueError(f"Step '{name}' reads the output of '{needed}' but does not need it.")
+
+    tasks = {}
+    for name, step in steps.items():
+        names = sorted(dependencies[name])
+        for combination in itertools.product(*(list(matrix[n]) for n in names)):
+            values = dict(zip(names, combination))
+            needs = [
+                task_key(steps, dependencies, needed, values, matrix)
+                for needed in as_list(step.get("needs"))
+            ]
+            key = task_key(steps, dependencies, name, values, matrix)
+            if key in tasks:
+                continue
+            config = format_values(step, values, matrix)
+            suffix = ".png" if step["step"] == "product" else ".nc"
+            output = config.get("output", f"{name}/{key}{suffix}")
+            tasks[key] = {
+                "key": key, "name": name, "step": step["step"], "config": config,
+                "needs": needs, "values": values, "output": str(output_dir / output),
+            }
+    return tasks
+
+
+def task_key(steps: dict, dependencies: dict, name: str, values: dict, matrix: dict = None) -> str:
+    """Key of a step for the matrix values it depends on."""
+    step = steps[name]
+    own_values = {n: values[n] for n in sorted(dependencies[name])}
+    needs = [
+        task_key(steps, dependencies, needed, values, matrix)
+        for needed in as_list(step.get("needs"))
+    ]
+    # The values of the labels are part of the key, so editing them runs the step again
+    label_values = {n: matrix_value(matrix or {}, n, v) for n, v in own_values.items()}
+    content = json.dumps(
+        [format_values(step, own_values, matrix), label_values, needs], sort_keys=True, default=str
+    )
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def as_list(value) -> list:
+    """A list from None, a single value or a list."""
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def resolve_function(name: str, module: str):
+    """A function of the given c3s_atlas module, or of the module of a dotted path."""
+    module, _, name = name.rpartition(".") if "." in name else (module, "", name)
+    return getattr(importlib.import_module(module), name)
+
+
+def open_inputs(inputs: list) -> xr.Dataset:
+    """Open and merge the outputs of the tasks a task needs."""
+    datasets = [xr.open_dataset(path) for path in inputs]
+    return datasets[0] if len(datasets) == 1 else xr.merge(datasets)
+
+
+def write_netcdf(result, output: Path, name: str = None, default_name: str = "data"):
+    """
+    Write a Dataset or DataArray to a temporary file renamed once complete.
+
+    DataArrays are stored as the variable `name`, or their own name, or `default_name`.
+    The Dataset and DataArray elements of a tuple are stored together, the first one
+    as above and the DataArrays that follow as `{name}_1`, `{name}_2`...
+    """
+    extra = []
+    if isinstance(result, tuple):
+        result, extra = result[0], list(result[1:])
+    if isinstance(result, xr.DataArray):
+        name = name or result.name or default_name
+        result = result.to_dataset(name=name)
+    if not isinstance(result, xr.Dataset):
+        raise TypeError(f"Expected an xarray Dataset or DataArray, got {type(result)}.")
+    for i, item in enumerate(extra, start=1):
+        if isinstance(item, xr.DataArray):
+            item = item.to_dataset(name=f"{name or default_name}_{i}")
+        if isinstance(item, xr.Dataset):
+            result = xr.merge([result, item])
+    tmp_path = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    try:
+        result.to_netcdf(tmp_path)
+        os.replace(tmp_path, output)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
+def run_fixers(config: dict, inputs: list, output: Path):
+    """Apply the fixers to the files of `input`."""
+    from c3s_atlas.fixers import apply_fixers
+
+    paths = sorted(glob(config["input"]))
+    if not paths:
+        raise FileNotFoundError(f"No files match {config['input']}")
+    ds = xr.open_mfdataset(paths) if len(paths) > 1 else xr.open_dataset(paths[0])
+    ds = apply_fixers(
+        ds, config["variable"], config["project"], config["map_variables"], config.get("dtype")
+    )
+    write_netcdf(ds, output)
+
+
+def run_index(config: dict, inputs: list, output: Path):
+    """Compute an index from the variables of the input dataset."""
+    function = resolve_function(config["function"], "c3s_atlas.indexes")
+    ds = open_inputs(inputs)
+    kwargs = {argument: ds[var] for argument, var in config.get("variables", {}).items()}
+    result = function(**kwargs, **to_python(config.get("kwargs", {})))
+    # The index is stored as `output_variable` or the name of the step
+    write_netcdf(result, output, config.get("output_variable", config["name"]))
+
+
+def run_interpolation(config: dict, inputs: list, output: Path):
+    """Interpolate the input dataset."""
+    from c3s_atlas.interpolation import Interpolator
+
+    attrs = dict(config["attrs"])
+    for coord in ["lons", "lats"]:
+        if coord in attrs:
+            attrs[coord] = np.asarray(attrs[coord])
+    write_netcdf(Interpolator(attrs)(open_inputs(inputs)), output)
+
+
+def run_analysis(config: dict, inputs: list, output: Path):
+    """Apply an analysis function to the input dataset."""
+    function = resolve_function(config["function"], "c3s_atlas.analysis")
+    result = function(
+        open_inputs(inputs), *to_python(config.get("args", [])),
+        **to_python(config.get("kwargs", {}))
+    )
+    write_netcdf(result, output, config.get("output_variable"), config["name"])
+
+
+def run_product(config: dict, inputs: list, output: Path):
+    """Render a plot of the output of the first needed step."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from c3s_atlas.rendering import render_figure
+
+    outputs = dict(zip(as_list(config.get("needs")), inputs))
+    kwargs = to_python(config.get("kwargs", {}))
+    # Arguments read from the outputs of other steps, e.g. the robustness categories
+    for argument, needed in config.get("input_kwargs", {}).items():
+        with xr.open_dataset(outputs[needed]) as ds:
+            kwargs[argument] = ds[list(ds.data_vars)[0]].load()
+    render_figure({
+        "plot": config["function"], "data": inputs[0], "var": config["var"],
+        "attrs": config.get("attrs", {}), "kwargs": kwargs,
+        "output": output, "dpi": config.get("dpi", 100),
+    })
+
+
+STEP_FUNCTIONS = {
+    "fixers": run_fixers,
+    "index": run_index,
+    "interpolation": run_interpolation,
+    "analysis": run_analysis,
+    "product": run_product,
+}
+
+
+def run_task(task: dict, inputs: list) -> float:
+    """
+    Run one task in a worker process.
+
+    Parameters
+    ----------
+    task (dict): the task, see `build_tasks`
+    inputs (list of str): outputs of the tasks it needs
+
+    Returns
+    -------
+    float: elapsed seconds
+    """
+    start = time.perf_counter()
+    if task["step"] not in STEP_FUNCTIONS:
+        raise ValueError(
+            f"Step '{task['step']}' not implemented. Please, specify one of the "
+            f"following: {list(STEP_FUNCTIONS.keys())}."
+        )
+    output = Path(task["output"])
+    os.makedirs(output.parent, exist_ok=True)
+    STEP_FUNCTIONS[task["step"]](task["config"], inputs, output)
+    return time.perf_counter() - start
+
+
+def read_checkpoint(path: Path) -> dict:
+    """Keys of the completed tasks and their outputs, empty if there is no checkpoint."""
+    if not path.exists():
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_checkpoint(path: Path, checkpoint: dict):
+    """Write the checkpoint atomically."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file, indent=1)
+    os.replace(tmp_path, path)
+
+
+def run_job(job: dict, max_workers: int = None, restart: bool = False) -> pd.DataFrame:
+    """
+    Run the tasks of a job in parallel processes, resuming from its checkpoint.
+
+    Tasks are submitted as soon as the tasks they need are done. Tasks recorded as
+    done in the checkpoint whose output still exists are skipped, and the tasks
+    needing a failed task are not run.
+
+    Parameters
+    ----------
+    job (dict): the job spec
+    max_workers (int): number of processes. The default is `max_workers` of the
+        job spec or the number of CPUs
+    restart (bool): ignore the checkpoint and run every task again
+
+    Returns
+    -------
+    pandas.DataFrame: one row per task with the step name, matrix values, output,
+        status ("done", "skipped", "failed" or "blocked") and elapsed seconds
+    """
+    tasks = build_tasks(job)
+    output_dir = Path(job.get("output_dir", "."))
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = output_dir / CHECKPOINT_FILE
+    checkpoint = {} if restart else read_checkpoint(checkpoint_path)
+
+    records = {
+        key: {"name": task["name"], "values": task["values"], "output": task["output"],
+              "status": "pending", "seconds": 0.0}
+        for key, task in tasks.items()
+    }
+    for key, task in tasks.items():
+        if checkpoint.get(key) == task["output"] and Path(task["output"]).exists():
+            records[key]["status"] = "skipped"
+
+    def finished(key):
+        return records[key]["status"] in ["done", "skipped"]
+
+    start = time.perf_counter()
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers or job.get("max_workers")) as executor:
+        while True:
+            for key, task in tasks.items():
+                record = records[key]
+                if record["status"] != "pending":
+                    continue
+                if any(records[needed]["status"] in ["failed", "blocked"] for needed in task["needs"]):
+                    record["status"] = "blocked"
+                elif all(finished(needed) for needed in task["needs"]):
+                    inputs = [tasks[needed]["output"] for needed in task["needs"]]
+                    running[executor.submit(run_task, task, inputs)] = key
+                    record["status"] = "running"
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                record = records[key]
+                try:
+                    record["seconds"] = future.result()
+                    record["status"] = "done"
+                    checkpoint[key] = tasks[key]["output"]
+                    write_checkpoint(checkpoint_path, checkpoint)
+                except Exception as error:
+                    record["status"] = "failed"
+                    logger.info(f"Task {record['name']} {record['values']} failed: {error}")
+
+    report = pd.DataFrame(
+        list(records.values()), columns=["name", "values", "output", "status", "seconds"]
+    )
+    logger.info(
+        f"Job finished in {time.perf_counter() - start:.1f} s: "
+        f"{report['status'].value_counts().to_dict()}"
+    )
+    return report
+
+
+def main(argv: list = None):
+    """Entry point of the `c3s-atlas` command."""
+    parser = argparse.ArgumentParser(
+        prog="c3s-atlas", description="Run a C3S Atlas job spec (YAML or JSON)."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the tasks of a job")
+    run_parser.add_argument("job", help="path of the job spec")
+    run_parser.add_argument("--max-workers", type=int, default=None, help="number of processes")
+    run_parser.add_argument(
+        "--restart", action="store_true", help="ignore the checkpoint and run every task"
+    )
+    plan_parser = subparsers.add_parser("plan", help="list the tasks of a job without running them")
+    plan_parser.add_argument("job", help="path of the job spec")
+    args = parser.parse_args(argv)
+
+    job = load_job(args.job)
+    if args.command == "plan":
+        tasks = build_tasks(job)
+        plan = pd.DataFrame([
+            {"key": key, "name": task["name"], "values": task["values"], "needs": len(task["needs"])}
+            for key, task in tasks.items()
+        ])
+        print(plan.to_string(index=False))
+        return 0
+    report = run_job(job, max_workers=args.max_workers, restart=args.restart)
+    print(report.to_string(index=False))
+    return int((report["status"].isin(["failed", "blocked"])).any())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,10 @@
 import numpy as np
 import os
 import xarray as xr
-import regionmask
-from shapely.geometry import Polygon
-import geopandas as gpd
 from .utils import c_path_c3s_atlas
 
+# regionmask, shapely and geopandas are imported by the methods that use them
+
 class Mask:
     def __init__(self, ds: xr.Dataset):
         """
@@ -26,6 +25,9 @@ class Mask:
         Returns:
             np.ndarray: Mask for the user-defined region.
         """
+        import regionmask
+        from shapely.geometry import Polygon
+
         # Define a polygon object (region_poly) based on the provided region definition
         region_poly = Polygon(region)
         
@@ -54,6 +56,8 @@ class Mask:
         Returns:
             np.ndarray: Mask for the AR6 region.
         """
+        import regionmask
+
         # Extract longitude (lon) and latitude (lat) coordinates from the dataset (self.ds)
         lon = self.ds['lon'].values
         lat = self.ds['lat'].values
@@ -92,6 +96,9 @@ class Mask:
         Returns:
           np.array: A boolean NumPy array representing the mask for the specified region.
         """
+        import geopandas as gpd
+        import regionmask
+
         # Read the GeoJSON file
         geojson_data = gpd.read_file(file_path)        
         # Filter the GeoDataFrame to get only rows with the abbreviations
@@ -115,6 +122,9 @@ class Mask:
           Returns:
               np.array: A boolean NumPy array representing the mask for European countries.
           """
+        import geopandas as gpd
+        import regionmask
+
         # Read the GeoJSON file
         geojson_data = gpd.read_file(f"{c_path_c3s_atlas}/auxiliar/geojsons/european-countries_areas.geojson")
         
@@ -141,6 +151,9 @@ class Mask:
         Returns:
           np.array: A boolean NumPy array representing the mask for EUCRA countries.
         """
+        import geopandas as gpd
+        import regionmask
+
         # Read the GeoJSON file
         geojson_data = gpd.read_file(f"{c_path_c3s_atlas}/auxiliar/geojsons/EUCRA_areas.geojson")
         
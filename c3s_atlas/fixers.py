@@ -2,19 +2,21 @@ import datetime
 from typing import Union
 
 import cftime
+import numpy
 import pandas
 import xarray
-from dateutil.relativedelta import relativedelta
 
 from c3s_atlas.aggregation import AggregationFunction, aggregate_in_time
 from c3s_atlas.errors import InferFrequencyError
-from c3s_atlas.logger import get_logger
+from c3s_atlas.logger import get_logger, instrumented
 from c3s_atlas.temporal import infer_freq
 from c3s_atlas.units import convert_units
+from c3s_atlas.utils import cast_data_vars
 
 logger = get_logger(name="Homogenization-fixers")
 
 
+@instrumented()
 def fix_time(dataset: xarray.Dataset):
     """
     Adjust time-related attributes and values in the input dataset to a standardized format.
@@ -33,28 +35,79 @@ def fix_time(dataset: xarray.Dataset):
         dataset = dataset.rename({"time_counter": "time"})
     dataset_frequency, coerced = infer_dataset_frequency(dataset)
     if dataset_frequency == "MS" or dataset_frequency == "YS":
+        # Data with one time step per period only need their time values rewritten
+        starts = regular_period_starts(dataset, dataset_frequency)
+        if starts is not None:
+            return dataset.assign_coords(time=starts)
         #logger.info(
         #    "The data is in monthly resolution, "
         #    "so there's no need to adjust the calendar, instead, "
         #    "we will apply a resampling process to standarize the time values"
         #)
         dataset = dataset.resample(time=dataset_frequency).mean()
-        if (
-            type(dataset.time.values[0]) == cftime._cftime.DatetimeNoLeap
-            or type(dataset.time.values[0]) == cftime._cftime.Datetime360Day
-            or type(dataset.time.values[0]) == cftime.DatetimeJulian
-        ):
-            datetime_object = [
-                datetime.datetime(year=d.year, month=d.month, day=d.day)
-                for d in dataset.time.values
-            ]
-            dataset["time"] = datetime_object
+        if isinstance(dataset.time.values[0], CONVERTED_CFTIME_TYPES):
+            dataset["time"] = to_datetime_index(dataset.time)
         return dataset
     else:
         dataset = fix_non_standard_calendar(dataset, coerced, dataset_frequency)
         return dataset
 
 
+# cftime dates converted to datetime64 by `fix_time`
+CONVERTED_CFTIME_TYPES = (
+    cftime.DatetimeNoLeap, cftime.Datetime360Day, cftime.DatetimeJulian
+)
+
+
+def to_datetime_index(time: xarray.DataArray) -> pandas.DatetimeIndex:
+    """
+    Convert time values (datetime64 or cftime) to a DatetimeIndex with the same
+    year, month and day, without looping over the dates in Python.
+    """
+    return pandas.DatetimeIndex(pandas.to_datetime(pandas.DataFrame({
+        "year": time.dt.year.values,
+        "month": time.dt.month.values,
+        "day": time.dt.day.values,
+    })))
+
+
+def regular_period_starts(
+    dataset: xarray.Dataset, dataset_frequency: str
+) -> Union[pandas.DatetimeIndex, None]:
+    """
+    Start of the period of every time step of monthly ("MS") or annual ("YS") data.
+
+    Parameters
+    ----------
+    dataset (xarray.Dataset): data stored by dimensions
+    dataset_frequency (str): "MS" or "YS"
+
+    Returns
+    -------
+    pandas.DatetimeIndex with the first day of the month (or year) of every time
+    step, or None if the data are not exactly one time step per period without
+    gaps (so they must be resampled) or their dates are kept as cftime by `fix_time`.
+    """
+    time = dataset.time
+    if not (
+        numpy.issubdtype(time.dtype, numpy.datetime64)
+        or isinstance(time.values[0], CONVERTED_CFTIME_TYPES)
+    ):
+        return None
+    years = time.dt.year.values
+    if dataset_frequency == "MS":
+        months = time.dt.month.values
+        periods = years * 12 + months - 1
+    else:
+        months = numpy.ones_like(years)
+        periods = years
+    if not (numpy.diff(periods) == 1).all():
+        return None
+    return pandas.DatetimeIndex(pandas.to_datetime(
+        pandas.DataFrame({"year": years, "month": months, "day": 1})
+    ), name="time")
+
+
 def fix_non_standard_calendar(
     dataset: xarray.Dataset, coerced, dataset_frequency
 ) -> xarray.Dataset:
@@ -85,13 +138,40 @@ def fix_non_standard_calendar(
         real_time = pandas.date_range(
             start=coerced[0].replace(day=1), end=coerced[-1], freq=dataset_frequency
         )
-    # Removing 29 (no leap years) and 30 feb
-    dataset = dataset.where(~dataset.time.isnull(), drop=True)
-    # Filling missing dates (31 of every month)
-    dataset = dataset.reindex({"time": real_time}, method="ffill")
+    # Every date of the standard calendar takes the last valid date up to it, so the
+    # 29 and 30 February are dropped and the missing dates (e.g. the 31st of every
+    # month) are filled forward with a single selection
+    source, filled = calendar_index_map(coerced, real_time)
+    dataset = dataset.isel(time=source).assign_coords(time=real_time)
+    if not filled.all():
+        filled = xarray.DataArray(filled, dims="time", coords={"time": real_time})
+        dataset = dataset.map(lambda da: da.where(filled) if "time" in da.dims else da)
     return dataset
 
 
+def calendar_index_map(coerced: pandas.DatetimeIndex, real_time: pandas.DatetimeIndex):
+    """
+    Position of the time step of the source calendar used for every date of the
+    target calendar, i.e. the last valid source date at or before it.
+
+    Parameters
+    ----------
+    coerced (pandas.DatetimeIndex): source dates, NaT where they do not exist in the
+        standard calendar (e.g. 30 February)
+    real_time (pandas.DatetimeIndex): dates of the target calendar
+
+    Returns
+    -------
+    source (numpy.ndarray): position of the source time step of every target date
+    filled (numpy.ndarray): False for the target dates before the first source date,
+        which have no source time step (their position is the first one)
+    """
+    valid = numpy.flatnonzero(~coerced.isnull())
+    positions = coerced[valid].searchsorted(real_time, side="right") - 1
+    filled = positions >= 0
+    return valid[numpy.clip(positions, 0, None)], filled
+
+
 def infer_dataset_frequency(dataset):
     """
     Infer dataset frequency (daily, monthly, ...).
@@ -135,6 +215,7 @@ def infer_dataset_frequency(dataset):
     return dataset_frequency, coerced
 
 
+@instrumented()
 def fix_inverse_latitudes(
     dataset: xarray.Dataset, project: str, latname: str = "lat"
 ) -> xarray.Dataset:
@@ -158,7 +239,7 @@ def fix_inverse_latitudes(
     """
     latname = latname if "cordex" not in project else "lon"
     if "cordex" not in project and len(dataset.lat.shape) != 2:
-        dataset = dataset.sortby(latname)
+        dataset = sort_coordinate(dataset, latname)
     return dataset
 
 
@@ -185,6 +266,7 @@ def check_temporal_resolution(dataset: xarray.Dataset):
         )
 
 
+@instrumented()
 def fix_360_longitudes(
     dataset: xarray.Dataset, project: str, lonname: str = "lon"
 ) -> xarray.Dataset:
@@ -208,10 +290,43 @@ def fix_360_longitudes(
     if lon.max().values > 180 and lon.min().values >= 0:
         dataset[lonname] = dataset[lonname].where(lon <= 180, other=lon - 360)
     if "cordex" not in project and len(dataset.lat.shape) != 2:
-        dataset = dataset.reindex(**{lonname: sorted(dataset[lonname])})
+        dataset = sort_coordinate(dataset, lonname)
     return dataset
 
 
+def sort_coordinate(dataset: xarray.Dataset, name: str) -> xarray.Dataset:
+    """
+    Sort a dataset along a one-dimensional coordinate with a single selection.
+
+    Increasing coordinates are returned as they are, decreasing ones are reversed
+    with a step slice and rotated ones (e.g. longitudes in (0, 360) relabelled to
+    (-180, 180)) are rolled at the split point. Other coordinates are sorted with
+    `argsort`. The selection is lazy for dask arrays and data read from a file.
+
+    Parameters
+    ----------
+    dataset (xarray.Dataset): data stored by dimensions
+    name (str): name of the coordinate
+
+    Returns
+    -------
+    dataset (xarray.Dataset): data with the coordinate in increasing order
+    """
+    values = dataset[name].values
+    dim = dataset[name].dims[0]
+    steps = numpy.diff(values)
+    if (steps > 0).all():
+        return dataset
+    if (steps < 0).all():
+        return dataset.isel({dim: slice(None, None, -1)})
+    descents = numpy.flatnonzero(steps < 0)
+    if len(descents) == 1 and (steps != 0).all() and values[-1] < values[0]:
+        split = descents[0] + 1
+        return dataset.isel({dim: numpy.roll(numpy.arange(len(values)), -split)})
+    return dataset.isel({dim: numpy.argsort(values, kind="stable")})
+
+
+@instrumented()
 def fix_spatial_coord_names(dataset: xarray.Dataset) -> xarray.Dataset:
     """
     Fix the coordinates names for spatial coordinates (x, y, lon, lat, ...).
@@ -255,6 +370,7 @@ def fix_spatial_coord_names(dataset: xarray.Dataset) -> xarray.Dataset:
             return dataset.rename(mapping)
 
 
+@instrumented()
 def adding_coords(ds: xarray.Dataset):
     """
     Adding dimensions to coordinates if needed.
@@ -277,6 +393,7 @@ def adding_coords(ds: xarray.Dataset):
         return ds
 
 
+@instrumented()
 def reorder_dimensions(ds: xarray.Dataset):
     """
     Reorders the dimensions of an xarray Dataset.
@@ -297,8 +414,9 @@ def reorder_dimensions(ds: xarray.Dataset):
     return ds
 
 
+@instrumented()
 def resampled_by_temporal_aggregation(
-    ds: xarray.Dataset, var_mapping: Union[dict, None]
+    ds: xarray.Dataset, var_mapping: Union[dict, None], dtype: str = None
 ):
     """
     Resample by time.
@@ -309,6 +427,8 @@ def resampled_by_temporal_aggregation(
     ----------
     ds (xarray.Dataset): data stored by dimensions
     var_mapping (dict): dictionary for mapping the variables of the different datasets
+    dtype (str): data type of the resampled data (e.g. "float32"). If None, the data
+        type returned by the aggregation is kept.
 
     Returns
     -------
@@ -324,13 +444,11 @@ def resampled_by_temporal_aggregation(
         # load the temporal aggregation from the mapping
         var_name = list(ds.data_vars)[0]
         if var_name == "pr":
-            ds["time"] = [
-                pandas.to_datetime(x) - relativedelta(hours=1) for x in ds.time.values
-            ]
+            ds["time"] = ds.indexes["time"] - datetime.timedelta(hours=1)
         temporal_agg = var_mapping["aggregation"][var_name]
         temporal_agg_function = AggregationFunction(temporal_agg)
         # apply the resample and the aggregation method
-        ds = aggregate_in_time(ds, temporal_agg_function)
+        ds = aggregate_in_time(ds, temporal_agg_function, dtype=dtype)
         logger.info("Dataset resampled to daily resolution")
     else:
         logger.info(
@@ -341,6 +459,7 @@ def resampled_by_temporal_aggregation(
     return ds
 
 
+@instrumented()
 def rename_and_delete_variables(
     ds: xarray.Dataset, variable: str, var_mapping: Union[dict, None]
 ) -> xarray.Dataset:
@@ -388,6 +507,7 @@ def rename_and_delete_variables(
         ds = ds.drop_vars(dim_to_remove)
     return ds
 
+@instrumented()
 def standard_names(ds: xarray.Dataset) -> xarray.Dataset:
     """
     Function to include standar-names to coordinate variables
@@ -414,13 +534,17 @@ def standard_names(ds: xarray.Dataset) -> xarray.Dataset:
 
     return ds
 
-def apply_fixers(ds, variable, project_id, map_variables):
+@instrumented()
+def apply_fixers(ds, variable, project_id, map_variables, dtype=None):
     """
     Apply the data fixers to the data.
 
     Parameters
     ----------
     ds (xarray.Dataset): data stored by dimensions
+    dtype (str): data type kept through the fixers, e.g. "float32" to avoid
+        doubling the memory of float32 raw data. If None, the data types
+        produced by each fixer are kept.
 
     Returns
     -------
@@ -429,10 +553,11 @@ def apply_fixers(ds, variable, project_id, map_variables):
     ds = fix_spatial_coord_names(ds)
     ds = fix_time(ds)
     ds = rename_and_delete_variables(ds, variable, map_variables)
-    ds = convert_units(ds, project = project_id)
+    ds = cast_data_vars(ds, dtype)
+    ds = convert_units(ds, project = project_id, dtype = dtype)
     ds = fix_360_longitudes(ds, project = project_id)
     ds = fix_inverse_latitudes(ds, project = project_id)
-    ds = resampled_by_temporal_aggregation(ds, map_variables)
+    ds = resampled_by_temporal_aggregation(ds, map_variables, dtype = dtype)
     ds = reorder_dimensions(ds)
     ds = adding_coords(ds)
     ds = standard_names(ds)
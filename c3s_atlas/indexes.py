@@ -7,6 +7,7 @@ def heating_degree_days(
     tasmin: xr.DataArray | None = None,
     freq: str = "YS",
     thresh: float = 15.5,
+    dtype: str = None,
  ) -> xr.DataArray:
     """
     Heating Degree days following Spinoni et al. (2014).
@@ -24,6 +25,9 @@ def heating_degree_days(
     thresh : float, optional
         threshold in Celsius degrees above which heating degree days are computed,
         by default 15
+    dtype : str, optional
+        data type of the daily values and the result (e.g. "float32"). The
+        accumulation is done in float64. By default None (data type of the inputs).
 
     Returns
     -------
@@ -37,6 +41,9 @@ def heating_degree_days(
     """
     if tas is None or tasmax is None or tasmin is None:
         raise ValueError("tas, tasmax, and tasmin must all be provided")
+    if dtype is not None:
+        tas, tasmax, tasmin = (da.astype(dtype, copy=False) for da in (tas, tasmax, tasmin))
+        thresh = np.dtype(dtype).type(thresh)
 
     hdd = xr.zeros_like(tas.copy())
     #hdd = tas.copy(deep=True)
@@ -49,6 +56,8 @@ def heating_degree_days(
     mask = thresh <= tasmin.values
     hdd = xr.where(mask, 0, hdd)
 
+    if dtype is not None:
+        return hdd.resample(time = freq).sum(dtype="float64").astype(dtype)
     return hdd.resample(time = freq).sum()
 
 def cooling_degree_days(
@@ -57,6 +66,7 @@ def cooling_degree_days(
     tasmin: xr.DataArray | None = None,
     freq: str = "YS",
     thresh: float = 22,
+    dtype: str = None,
  ) -> xr.DataArray:
     """
 
@@ -74,6 +84,9 @@ def cooling_degree_days(
         Resampling frequency.
     thresh : float, optional
         threshold in Celsius degrees below which cooling degree days are computed, by default 15
+    dtype : str, optional
+        data type of the daily values and the result (e.g. "float32"). The
+        accumulation is done in float64. By default None (data type of the inputs).
 
     Returns
     -------
@@ -90,6 +103,9 @@ def cooling_degree_days(
     """
     if tas is None or tasmax is None or tasmin is None:
         raise ValueError("tas, tasmax, and tasmin must all be provided")
+    if dtype is not None:
+        tas, tasmax, tasmin = (da.astype(dtype, copy=False) for da in (tas, tasmax, tasmin))
+        thresh = np.dtype(dtype).type(thresh)
 
     cdd = xr.zeros_like(tas.copy())
     #cdd = tas.copy(deep=True)
@@ -102,5 +118,7 @@ def cooling_degree_days(
     mask = thresh <= tasmin
     cdd = xr.where(mask, tas - thresh, cdd)
 
+    if dtype is not None:
+        return cdd.resample(time = freq).sum(dtype="float64").astype(dtype)
     return cdd.resample(time = freq).sum()
 
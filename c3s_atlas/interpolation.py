@@ -1,10 +1,24 @@
+import os
 import sys
 from pathlib import Path
 from typing import Tuple, Union
 
+import cf_xarray  # noqa: F401 (registers the `.cf` accessor, which xESMF used to load)
 import numpy as np
 import xarray as xr
-import xesmf as xe
+
+from c3s_atlas.logger import data_nbytes, instrument
+from c3s_atlas.utils import c_path_c3s_atlas
+
+# Resolutions (in degrees) of the land-sea masks shipped in auxiliar/reference-grids
+REFERENCE_GRIDS = {
+    0.0625: "006p25",
+    0.125: "012p5",
+    0.25: "025",
+    0.5: "050",
+    1.0: "100",
+    2.0: "200",
+}
 
 
 class Interpolator:
@@ -15,6 +29,8 @@ class Interpolator:
     ----------
     interpolation_attrs (dict): A dictionary containing the
         interpolation method, lons/lats or resolution. Only "conservative_normed" method has been tested.
+        Optionally, "source_mask", "destination_mask", "weights_path" and "dtype"
+        (see `interpolation`).
     data (xarray): The data to be interpolated.
     """
 
@@ -32,6 +48,10 @@ class Interpolator:
             self.lons = None
             self.lats = None
             self.resolution = interpolation_attrs['resolution']
+        self.source_mask = interpolation_attrs.get('source_mask', 'mean')
+        self.destination_mask = interpolation_attrs.get('destination_mask', None)
+        self.weights_path = interpolation_attrs.get('weights_path', None)
+        self.dtype = interpolation_attrs.get('dtype', None)
 
     def __call__(self, data):
         """
@@ -46,7 +66,11 @@ class Interpolator:
                              self.var_name,
                              self.resolution, 
                              self.lons,
-                             self.lats)
+                             self.lats,
+                             source_mask=self.source_mask,
+                             destination_mask=self.destination_mask,
+                             weights_path=self.weights_path,
+                             dtype=self.dtype)
         return df_inter
 
 def estimate_boundaries(
@@ -197,6 +221,8 @@ def generate_destination_grid(
         The destination grid, compatible with xESMF.
     """
     if res:
+        # xESMF (and ESMF) are only loaded when a regridding is actually needed
+        import xesmf as xe
         ds_grid = xe.util.grid_2d(-180.0, 180.0, res, -90.0, 90.0, res)
     else:
         xx, yy = np.meshgrid(x, y)
@@ -370,6 +396,171 @@ def make_cf_compliant(
     return grid
 
 
+def load_reference_mask(
+    lon_values: np.ndarray, lat_values: np.ndarray, surface: str = "land",
+    threshold: float = 0.5
+) -> np.ndarray:
+    """
+    Build a land or sea mask for a regular grid from the shipped reference grids.
+
+    The land-sea mask file (auxiliar/reference-grids/land_sea_mask_grd*.nc) is
+    selected from the grid spacing and its land proportion is sampled at the
+    grid centers.
+
+    Parameters
+    ----------
+    lon_values : np.ndarray
+        A vector containing the longitude values of the grid centers.
+    lat_values : np.ndarray
+        A vector containing the latitude values of the grid centers.
+    surface : str, optional
+        "land" to keep the land cells or "sea" to keep the ocean cells. The default is "land".
+    threshold : float, optional
+        Land proportion from which a cell is considered land. The default is 0.5.
+
+    Returns
+    -------
+    mask : np.ndarray
+        A (lat, lon) matrix equal to 1 for the cells to keep and 0 for the rest.
+    """
+    if surface not in ["land", "sea"]:
+        raise ValueError(f"Surface must be 'land' or 'sea', got '{surface}'")
+    lon_values = np.asarray(lon_values)
+    lat_values = np.asarray(lat_values)
+    if lon_values.ndim != 1 or lat_values.ndim != 1:
+        raise ValueError("Land-sea masks can only be built for regular grids")
+    resolution = float(np.round(np.abs(np.diff(lon_values)).min(), 4))
+    if resolution not in REFERENCE_GRIDS:
+        raise ValueError(
+            f"There is no land-sea mask for a {resolution} degree grid. "
+            f"Available resolutions: {list(REFERENCE_GRIDS.keys())}"
+        )
+    grid_file = (
+        f"{c_path_c3s_atlas}/auxiliar/reference-grids/"
+        f"land_sea_mask_grd{REFERENCE_GRIDS[resolution]}.nc"
+    )
+    lons = np.where(lon_values > 180, lon_values - 360, lon_values)
+    with xr.open_dataset(grid_file) as ds_mask:
+        land = ds_mask["mask"].sel(
+            lon=lons, lat=lat_values, method="nearest", tolerance=resolution / 2
+        ).transpose("lat", "lon").values >= threshold
+    if surface == "land":
+        return land.astype(int)
+    return (~land).astype(int)
+
+
+def regular_axes(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the longitude and latitude vectors of the 2-D coordinates of a regular grid.
+
+    Parameters
+    ----------
+    lon : np.ndarray
+        A (y, x) matrix containing the longitude values of the grid centers.
+    lat : np.ndarray
+        A (y, x) matrix containing the latitude values of the grid centers.
+
+    Returns
+    -------
+    lon_values, lat_values : Tuple[np.ndarray, np.ndarray]
+        The longitudes of the first row and the latitudes of the first column.
+    """
+    lon = np.asarray(lon)
+    lat = np.asarray(lat)
+    if lon.ndim != 2 or lat.ndim != 2:
+        return lon, lat
+    if not (np.allclose(lon, lon[:1, :]) and np.allclose(lat, lat[:, :1])):
+        raise ValueError(
+            "Land-sea masks can only be built for regular grids, but the longitudes "
+            "change along the columns or the latitudes along the rows of this grid"
+        )
+    return lon[0, :], lat[:, 0]
+
+
+def get_source_mask(ds_ref: xr.Dataset, var_name: str, source_mask: str = "mean") -> xr.DataArray:
+    """
+    Get the mask of the reference dataset used by the regridder.
+
+    Parameters
+    ----------
+    ds_ref : xr.Dataset
+        The reference dataset formatted with `generate_reference_grid`.
+    var_name : str
+        The name of the variable.
+    source_mask : str, optional
+        "mean" masks the cells that are NaN in the mean over the non spatial dimensions
+        (the whole dataset is read). "first" masks the cells that are NaN in the first
+        time slice. "land"/"sea" keep the land/sea cells of the shipped reference grids.
+        The default is "mean".
+
+    Returns
+    -------
+    mask : xr.DataArray
+        A (y, x) DataArray equal to 1 for the valid cells and 0 for the rest.
+    """
+    dims = [dim for dim in ds_ref[var_name].dims if not dim in ['x', 'y']]
+    if source_mask == "mean":
+        values = ds_ref[var_name].mean(dims)
+    elif source_mask == "first":
+        values = ds_ref[var_name].isel({dim: 0 for dim in dims})
+    elif source_mask in ["land", "sea"]:
+        lon_values, lat_values = regular_axes(ds_ref["lon"].values, ds_ref["lat"].values)
+        mask = load_reference_mask(lon_values, lat_values, surface=source_mask)
+        return xr.DataArray(mask, dims=["y", "x"])
+    else:
+        raise ValueError(
+            f"Source mask '{source_mask}' not implemented. Please, specify "
+            "one of the following: 'mean', 'first', 'land', 'sea'."
+        )
+    return xr.where(~np.isnan(values), 1, 0) # set nan equal to 0 and 1 for the rest
+
+
+def get_destination_mask(ds_dest: xr.Dataset, destination_mask: str = None) -> xr.DataArray:
+    """
+    Get the mask of the destination grid used by the regridder.
+
+    Parameters
+    ----------
+    ds_dest : xr.Dataset
+        The destination grid formatted with `generate_destination_grid`.
+    destination_mask : str, optional
+        "land"/"sea" keep the land/sea cells of the shipped reference grids. If None,
+        all the cells are kept. The default is None.
+
+    Returns
+    -------
+    mask : xr.DataArray
+        A (y, x) DataArray equal to 1 for the valid cells and 0 for the rest.
+    """
+    if destination_mask is None:
+        return xr.where(~np.isnan(ds_dest['lon']), 1, 1) # set all values equal to 1
+    lon_values, lat_values = regular_axes(ds_dest["lon"].values, ds_dest["lat"].values)
+    mask = load_reference_mask(lon_values, lat_values, surface=destination_mask)
+    return xr.DataArray(mask, dims=["y", "x"])
+
+
+def write_weights(regridder, weights_path: Path):
+    """
+    Store the weights of a regridder in a temporary file renamed once complete.
+
+    Other processes reusing the weights of the same grid never read a truncated file.
+
+    Parameters
+    ----------
+    regridder : xesmf.Regridder
+        The regridder.
+    weights_path : pathlib.Path
+        File where the weights are stored.
+    """
+    tmp_path = weights_path.with_name(f".{weights_path.name}.{os.getpid()}.tmp")
+    try:
+        regridder.to_netcdf(str(tmp_path))
+        os.replace(tmp_path, weights_path)
+    finally:
+        if tmp_path.exists():
+            os.remove(tmp_path)
+
+
 def interpolation(
     ds: xr.Dataset,
     interpolation_method: str,
@@ -377,6 +568,10 @@ def interpolation(
     resolution: float = None,
     lon_values: np.array = None,
     lat_values: np.array = None,
+    source_mask: str = "mean",
+    destination_mask: str = None,
+    weights_path: Union[str, Path] = None,
+    dtype: str = None,
 ) -> xr.Dataset:
     """
     Apply an interpolation method to the data using the xESMF package.
@@ -400,6 +595,22 @@ def interpolation(
         A vector containing the latitude values of the reference grid
         (i.e. the grid that the data will be interpolated onto).
         This argument is only used when the `resolution` argument is not provided.
+    source_mask : str, optional
+        How the mask of the original data is obtained: "mean" (NaNs of the mean over
+        time, reads the whole dataset), "first" (NaNs of the first time slice) or
+        "land"/"sea" (shipped land-sea masks, regular grids only). The default is "mean".
+    destination_mask : str, optional
+        "land"/"sea" to only fill the land/sea cells of the destination grid using the
+        shipped land-sea masks. If None, all the cells are filled. The default is None.
+    weights_path : str or pathlib.Path, optional
+        File where the regridding weights are stored. If the file exists the weights
+        are reused instead of being computed again, so it must only be shared between
+        datasets with the same source grid, destination grid and masks.
+        The default is None (weights are not stored).
+    dtype : str, optional
+        Data type of the interpolated variable (e.g. "float32"). The weights are
+        applied in float64 and the result is cast afterwards. If None, the data type
+        returned by xESMF is kept. The default is None.
     output_path : pathlib.Path
         Path where the interpolated data will be stored.
     clobber : bool
@@ -409,27 +620,47 @@ def interpolation(
     -------
     ds_inter (xarray.Dataset): The interpolated dataset.
     """
-    # Format original dataset
-    ds_ref = generate_reference_grid(ds, var_name)
+    with instrument("interpolation.grids", ds):
+        # Format original dataset
+        ds_ref = generate_reference_grid(ds, var_name)
 
-    # Create reference dataset
-    if resolution:
-        ds_dest = generate_destination_grid(res=resolution)
-    else:
-        ds_dest = generate_destination_grid(x=lon_values, y=lat_values)
+        # Create reference dataset
+        if resolution:
+            ds_dest = generate_destination_grid(res=resolution)
+        else:
+            ds_dest = generate_destination_grid(x=lon_values, y=lat_values)
 
-    # Add mask to the referece and destination datasets
-    dims = [dim for dim in ds_ref[var_name].dims if not dim in ['x', 'y']]
-    ds_ref["mask"] = xr.where(~np.isnan(ds_ref[var_name].mean(dims)), 1, 0) # set nan equal to 0 and 1 for the rest
-    ds_dest["mask"] = xr.where(~np.isnan(ds_dest['lon']), 1, 1) # set all values equal to 1
+        # Add mask to the referece and destination datasets
+        ds_ref["mask"] = get_source_mask(ds_ref, var_name, source_mask)
+        ds_dest["mask"] = get_destination_mask(ds_dest, destination_mask)
 
     # Interpolation
-    regridder = xe.Regridder(
-        ds_ref, ds_dest, interpolation_method, periodic=True, unmapped_to_nan=True,
-        ignore_degenerate=True
-    )
+    weights_kwargs = {}
+    if weights_path is not None:
+        weights_kwargs = {
+            "filename": str(weights_path),
+            "reuse_weights": Path(weights_path).exists(),
+        }
+    import xesmf as xe
+    with instrument("interpolation.weights", ds_ref) as record:
+        regridder = xe.Regridder(
+            ds_ref, ds_dest, interpolation_method, periodic=True, unmapped_to_nan=True,
+            ignore_degenerate=True, **weights_kwargs
+        )
+        if weights_path is not None and not weights_kwargs["reuse_weights"]:
+            write_weights(regridder, Path(weights_path))
+        if record is not None:
+            record["reused_weights"] = weights_kwargs.get("reuse_weights", False)
     ## ignore_degenerate (bool) – Ignore degenerate cells when checking the input Grids or   Meshes for errors. If this is set to True, then the regridding proceeds, but degenerate cells will be skipped. If set to False, a degenerate cell produces an error. This currently only applies to CONSERVE, other regrid methods currently always skip degenerate cells. If None, defaults to False.
-    ds_inter = regridder(ds_ref)
-    ds_output = make_cf_compliant(ds, ds_dest, ds_inter, var_name)
+    with instrument("interpolation.apply", ds_ref) as record:
+        ds_inter = regridder(ds_ref)
+        if dtype is not None:
+            ds_inter[var_name] = ds_inter[var_name].astype(dtype)
+        if record is not None:
+            record["output_bytes"] = data_nbytes(ds_inter)
+    with instrument("interpolation.cf_output", ds_inter) as record:
+        ds_output = make_cf_compliant(ds, ds_dest, ds_inter, var_name)
+        if record is not None:
+            record["output_bytes"] = data_nbytes(ds_output)
 
     return ds_output
@@ -1,5 +1,11 @@
+import functools
+import json
 import logging
 import os
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 
 
@@ -51,3 +57,233 @@ def get_logger(
     logger.addHandler(handler)
     logger.propagate = False
     return logger
+
+
+# Per-stage instrumentation. It is disabled unless `enable_instrumentation` is called
+# or the environment variable is set ("1" or "true", "memory" also traces the memory
+# allocations with tracemalloc), and the disabled stages only cost a flag check.
+INSTRUMENTATION_VARIABLE = "C3S_ATLAS_INSTRUMENTATION"
+# Records kept for `stage_records` and `stage_summary`, the oldest are dropped first
+MAX_STAGE_RECORDS = 10000
+
+_instrumentation = {
+    "enabled": os.environ.get(INSTRUMENTATION_VARIABLE, "").lower() in ("1", "true", "memory"),
+    "trace_memory": os.environ.get(INSTRUMENTATION_VARIABLE, "").lower() == "memory",
+    "records": deque(maxlen=MAX_STAGE_RECORDS),
+    "stack": [],
+}
+
+
+def enable_instrumentation(trace_memory: bool = False):
+    """
+    Start recording the instrumented stages.
+
+    Parameters
+    ----------
+    trace_memory : bool, optional
+        Trace the Python and NumPy memory allocations with tracemalloc to report the
+        peak allocated by every stage. It slows down the allocations, so it is off
+        by default.
+    """
+    _instrumentation["enabled"] = True
+    _instrumentation["trace_memory"] = trace_memory
+
+
+def disable_instrumentation():
+    """Stop recording the instrumented stages."""
+    _instrumentation["enabled"] = False
+    _instrumentation["trace_memory"] = False
+
+
+def instrumentation_enabled() -> bool:
+    """Whether the instrumented stages are recorded."""
+    return _instrumentation["enabled"]
+
+
+def stage_records(clear: bool = False) -> list:
+    """
+    Get the records of the instrumented stages run so far.
+
+    Only the last `MAX_STAGE_RECORDS` records are kept, every record is also
+    emitted through the logger.
+
+    Parameters
+    ----------
+    clear : bool, optional
+        Remove the records once returned. The default is False.
+
+    Returns
+    -------
+    list of dict
+        One record per stage with its name, wall and CPU seconds, process peak RSS
+        and its increase, traced peak memory and input/output bytes.
+    """
+    records = list(_instrumentation["records"])
+    if clear:
+        _instrumentation["records"].clear()
+    return records
+
+
+def data_nbytes(data) -> int:
+    """Bytes of an array, DataArray or Dataset (None for other objects)."""
+    nbytes = getattr(data, "nbytes", None)
+    return int(nbytes) if nbytes is not None else None
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of the process in MiB (None where not available).
+
+    It is the high-water mark since the process started (`ru_maxrss`), never reset.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kibibytes on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+@contextmanager
+def instrument(stage: str, data=None, logger: logging.Logger = None):
+    """
+    Record the wall time, CPU time, memory and bytes processed by a stage.
+
+    The record is emitted as a JSON line through the logger and kept for
+    `stage_summary`. The caller may set `record["output_bytes"]` or add other
+    fields to the yielded record. Lazy (dask) data are only measured while the
+    stage builds or computes them.
+
+    The resident memory cannot be measured per stage: "process_peak_rss_mb" is the
+    peak of the whole process so far (see `peak_rss_mb`) and "peak_rss_increase_mb"
+    how much the stage raised it, which is 0 when the stage stays below an earlier
+    peak. "traced_peak_mb" is the peak allocated by the stage itself, when the
+    memory is traced.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage, e.g. "fixers.fix_time".
+    data : array, xarray.DataArray or xarray.Dataset, optional
+        Input of the stage, used to report the bytes processed.
+    logger : logging.Logger, optional
+        Logger used to emit the record. The default is the "Instrumentation" logger.
+
+    Yields
+    ------
+    dict or None
+        The record of the stage, or None when the instrumentation is disabled.
+    """
+    if not _instrumentation["enabled"]:
+        yield None
+        return
+    import tracemalloc
+
+    stack = _instrumentation["stack"]
+    trace_memory = _instrumentation["trace_memory"]
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        # tracemalloc keeps a single peak, the enclosing stage keeps the one seen so far
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        tracemalloc.reset_peak()
+    frame = {"start": current if trace_memory else 0, "peak": 0}
+    stack.append(frame)
+    record = {"stage": stage, "input_bytes": data_nbytes(data), "output_bytes": None}
+    rss = peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = time.process_time() - cpu
+        record["process_peak_rss_mb"] = peak_rss_mb()
+        record["peak_rss_increase_mb"] = (
+            None if rss is None else record["process_peak_rss_mb"] - rss
+        )
+        stack.pop()
+        record["traced_peak_mb"] = None
+        if trace_memory and tracemalloc.is_tracing():
+            peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            record["traced_peak_mb"] = (peak - frame["start"]) / 2**20
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        _instrumentation["records"].append(record)
+        (logger or _instrumentation_logger()).info(json.dumps(record))
+
+
+def instrumented(stage: str = None):
+    """
+    Decorator recording every call of a function as an instrumented stage.
+
+    The first argument of the call is taken as the input data and the returned
+    value as the output data.
+
+    Parameters
+    ----------
+    stage : str, optional
+        Name of the stage. The default is "<module>.<function>" without the
+        package name.
+    """
+    def decorator(function):
+        name = stage or f"{function.__module__.split('.')[-1]}.{function.__name__}"
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _instrumentation["enabled"]:
+                return function(*args, **kwargs)
+            with instrument(name, args[0] if args else None) as record:
+                result = function(*args, **kwargs)
+                record["output_bytes"] = data_nbytes(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def stage_summary(records: list = None):
+    """
+    Aggregate the records of the instrumented stages by stage name.
+
+    Parameters
+    ----------
+    records : list of dict, optional
+        The records to aggregate. The default is all the records run so far.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per stage with the number of calls, the total and maximum wall
+        seconds, the total CPU seconds, the process peak RSS reached by the end of
+        the stage, the largest increase of that peak and the maximum traced peak
+        memory (see `instrument`), and the total input bytes, sorted by total wall
+        time.
+    """
+    import pandas as pd
+
+    records = stage_records() if records is None else records
+    columns = [
+        "stage", "wall_seconds", "cpu_seconds", "process_peak_rss_mb",
+        "peak_rss_increase_mb", "traced_peak_mb", "input_bytes",
+    ]
+    df = pd.DataFrame(records, columns=columns)
+    summary = df.groupby("stage").agg(
+        calls=("wall_seconds", "size"),
+        wall_seconds=("wall_seconds", "sum"),
+        max_wall_seconds=("wall_seconds", "max"),
+        cpu_seconds=("cpu_seconds", "sum"),
+        process_peak_rss_mb=("process_peak_rss_mb", "max"),
+        peak_rss_increase_mb=("peak_rss_increase_mb", "max"),
+        traced_peak_mb=("traced_peak_mb", "max"),
+        input_bytes=("input_bytes", "sum"),
+    )
+    return summary.sort_values("wall_seconds", ascending=False)
+
+
+def _instrumentation_logger() -> logging.Logger:
+    logger = logging.getLogger("Instrumentation")
+    if not logger.handlers:
+        logger = get_logger("Instrumentation")
+    return logger
@@ -0,0 +1,283 @@
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.interpolation import Interpolator
+from c3s_atlas.logger import get_logger
+
+logger = get_logger("Parallel-interpolation")
+
+HASH_ATTRIBUTE = "c3s_atlas_input_hash"
+
+
+def input_hash(path: Path, interpolation_attrs: dict, block_size: int = 2**20) -> str:
+    """
+    Hash the content of an input file together with the interpolation settings.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the input file.
+    interpolation_attrs : dict
+        The interpolation settings passed to `Interpolator`.
+    block_size : int, optional
+        Number of bytes read at once. The default is 1 MiB.
+
+    Returns
+    -------
+    str
+        The hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(interpolation_attrs, sort_keys=True, default=str).encode())
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def grid_key(path: Path, var_name: str = None, source_mask: str = "mean") -> str:
+    """
+    Identify the regridding weights of a file from its grid and source mask.
+
+    The key hashes the longitude and latitude values and, for the data-dependent
+    source masks ("mean" and "first"), the missing values of the first time slice of
+    `var_name`. With "mean" this is an approximation: files whose missing values
+    only differ after the first time slice share their weights.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the input file.
+    var_name : str, optional
+        The name of the interpolated variable.
+    source_mask : str, optional
+        The source mask of the interpolation, see `interpolation.get_source_mask`.
+        The default is "mean".
+
+    Returns
+    -------
+    str
+        A short hash shared by all the files that can use the same weights.
+    """
+    digest = hashlib.sha256()
+    with xr.open_dataset(path) as ds:
+        spatial_dims = set()
+        for coord in ["longitude", "latitude"]:
+            values = np.ascontiguousarray(ds.cf[coord].values, dtype="float64")
+            digest.update(str(values.shape).encode())
+            digest.update(values.tobytes())
+            spatial_dims.update(ds.cf[coord].dims)
+        if source_mask in ["mean", "first"] and var_name in ds:
+            da = ds[var_name]
+            first = da.isel({dim: 0 for dim in da.dims if dim not in spatial_dims})
+            digest.update(np.packbits(first.isnull().values).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def is_up_to_date(output_path: Path, hash_value: str) -> bool:
+    """
+    Check whether an output file was produced from the same input and settings.
+
+    Parameters
+    ----------
+    output_path : pathlib.Path
+        Path of the interpolated file.
+    hash_value : str
+        Hash of the input file returned by `input_hash`.
+
+    Returns
+    -------
+    bool
+        True if the output exists and stores the same input hash.
+    """
+    if not output_path.exists():
+        return False
+    try:
+        with xr.open_dataset(output_path) as ds:
+            return ds.attrs.get(HASH_ATTRIBUTE) == hash_value
+    except (OSError, ValueError):
+        return False
+
+
+def interpolate_file(
+    path: Path, output_path: Path, interpolation_attrs: dict, hash_value: str
+) -> float:
+    """
+    Interpolate one file and write the result atomically.
+
+    The result is written to a temporary file in the output directory which is
+    renamed to its final name once complete, so interrupted jobs never leave
+    truncated outputs behind.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the input file.
+    output_path : pathlib.Path
+        Path of the interpolated file.
+    interpolation_attrs : dict
+        The interpolation settings passed to `Interpolator`.
+    hash_value : str
+        Hash of the input file, stored as a global attribute of the output.
+
+    Returns
+    -------
+    float
+        Elapsed seconds.
+    """
+    start = time.perf_counter()
+    tmp_path = output_path.with_name(f".{output_path.name}.{os.getpid()}.tmp")
+    with xr.open_dataset(path) as ds:
+        ds_inter = Interpolator(interpolation_attrs)(ds)
+        ds_inter.attrs[HASH_ATTRIBUTE] = hash_value
+        try:
+            ds_inter.to_netcdf(tmp_path)
+            os.replace(tmp_path, output_path)
+        finally:
+            if tmp_path.exists():
+                os.remove(tmp_path)
+    return time.perf_counter() - start
+
+
+def inspect_file(path: Path, interpolation_attrs: dict):
+    """
+    Get the input hash (see `input_hash`) and grid group (see `grid_key`) of a file.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        Path of the input file.
+    interpolation_attrs : dict
+        The interpolation settings passed to `Interpolator`.
+
+    Returns
+    -------
+    tuple of str
+        The input hash and the grid key.
+    """
+    hash_value = input_hash(path, interpolation_attrs)
+    group = grid_key(
+        path, interpolation_attrs.get("var_name"), interpolation_attrs.get("source_mask", "mean")
+    )
+    return hash_value, group
+
+
+def interpolate_files(
+    paths: List[Union[str, Path]],
+    interpolation_attrs: dict,
+    output_dir: Union[str, Path],
+    weights_dir: Union[str, Path] = None,
+    max_workers: int = None,
+    suffix: str = "_interpolated",
+) -> pd.DataFrame:
+    """
+    Interpolate many files in parallel, sharing the regridding weights between files.
+
+    Files are grouped by source grid and mask (see `grid_key`). One file of every
+    group computes and stores the weights and the remaining files of the group are
+    only started once it succeeds, so they reuse the weights. If it fails, the next
+    file of the group computes them instead. Outputs whose stored input hash matches
+    the current input and settings are skipped, and files that cannot be read are
+    reported as failed without stopping the rest.
+
+    Parameters
+    ----------
+    paths : list of str or pathlib.Path
+        Input files.
+    interpolation_attrs : dict
+        The interpolation settings passed to `Interpolator` (without "weights_path").
+    output_dir : str or pathlib.Path
+        Directory where the interpolated files are written.
+    weights_dir : str or pathlib.Path, optional
+        Directory where the weights are stored. The default is `output_dir`/weights.
+    max_workers : int, optional
+        Number of processes. The default is the number of CPUs.
+    suffix : str, optional
+        Suffix added to the input file name. The default is "_interpolated".
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per file with the output path, grid group, status
+        ("done", "skipped" or "failed") and elapsed seconds.
+    """
+    output_dir = Path(output_dir)
+    weights_dir = Path(weights_dir) if weights_dir else output_dir / "weights"
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(weights_dir, exist_ok=True)
+    settings_key = hashlib.sha256(
+        json.dumps(interpolation_attrs, sort_keys=True, default=str).encode()
+    ).hexdigest()[:16]
+
+    records = {}
+    groups = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Inputs are hashed and grouped in parallel, an unreadable file only fails itself
+        inspections = {
+            path: executor.submit(inspect_file, path, interpolation_attrs)
+            for path in map(Path, paths)
+        }
+        for path, future in inspections.items():
+            output_path = output_dir / f"{path.stem}{suffix}.nc"
+            records[path] = {
+                "path": str(path), "output": str(output_path), "group": None,
+                "status": "skipped", "seconds": 0.0,
+            }
+            try:
+                hash_value, group = future.result()
+            except Exception as error:
+                logger.info(f"Reading of {path} failed: {error}")
+                records[path]["status"] = "failed"
+                continue
+            records[path]["group"] = group
+            if is_up_to_date(output_path, hash_value):
+                continue
+            attrs = dict(
+                interpolation_attrs,
+                weights_path=str(weights_dir / f"weights_{group}_{settings_key}.nc"),
+            )
+            groups[group].append((path, output_path, attrs, hash_value))
+
+        running = {}
+
+        def submit(job, builds_weights):
+            running[executor.submit(interpolate_file, *job)] = (job[0], builds_weights)
+
+        # One file of each group creates the weights file, the rest wait for it
+        for jobs in groups.values():
+            submit(jobs.pop(0), True)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, builds_weights = running.pop(future)
+                try:
+                    records[path]["seconds"] = future.result()
+                    records[path]["status"] = "done"
+                except Exception as error:
+                    logger.info(f"Interpolation of {path} failed: {error}")
+                    records[path]["status"] = "failed"
+                if not builds_weights:
+                    continue
+                jobs = groups[records[path]["group"]]
+                if records[path]["status"] == "done":
+                    # The weights exist, the rest of the group reuses them
+                    for job in jobs:
+                        submit(job, False)
+                    jobs.clear()
+                elif jobs:
+                    # The next file of the group computes the weights instead
+                    submit(jobs.pop(0), True)
+
+    report = pd.DataFrame(list(records.values()))
+    logger.info(f"Interpolation report:\n{report.to_string(index=False)}")
+    return report
@@ -1,16 +1,56 @@
-import matplotlib.pyplot as plt
+# matplotlib and cartopy are imported by the functions that use them, so importing
+# this module stays cheap for the processes that never plot
+from __future__ import annotations
+
 import xarray as xr
 import array as arr
 import numpy as np
 import pandas as pd
-import regionmask
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from matplotlib.patches import Patch
+from functools import lru_cache
 
 from c3s_atlas.utils import (
-    get_attribute
+    settings_registry
 )
+from c3s_atlas.analysis import ensemble_statistics
+
+def get_name_and_units(var, attrs):
+    '''
+    Gets the name of a variable and its units for the titles of the plots.
+
+    Parameters:
+    -----------
+    var : str
+        The variable (e.g. 't').
+    attrs : dict
+        Dictionary with the attributes, with the units in "unit".
+
+    Returns:
+    --------
+    tuple of str
+        The name of the variable and the units.
+    '''
+    name_var = settings_registry.variable_name(var)
+    units = settings_registry.units_label(attrs.get("unit"))
+    if units is None:
+        units = attrs.get("unit")
+    return name_var, units
+
+@lru_cache(maxsize=None)
+def get_projection(name = 'PlateCarree'):
+    '''
+    Gets a cartopy projection, created once per process and shared between figures.
+
+    Parameters:
+    -----------
+    name : str, optional
+        Name of the projection class in `cartopy.crs`. Default is 'PlateCarree'.
+
+    Returns:
+    --------
+    cartopy.crs.Projection
+    '''
+    import cartopy.crs as ccrs
+    return getattr(ccrs, name)()
 
 def climate_stripe_plot(ds, var, attrs, mode, diff = "abs", season = 'Annual', period = None,
                         baseline_period=slice(1850, 1870), cmap = 'seismic', cbar_value=0) -> plt.Figure:
@@ -41,6 +81,7 @@ def climate_stripe_plot(ds, var, attrs, mode, diff = "abs", season = 'Annual', p
     plt.Figure
         The matplotlib figure containing the climate stripes plot.
     """
+    import matplotlib.pyplot as plt
     # select period
     ds = ds.loc[dict(year=period)]
     # Calculate the reference difference
@@ -88,10 +129,7 @@ def climate_stripe_plot(ds, var, attrs, mode, diff = "abs", season = 'Annual', p
     cbar = fig.colorbar(img, ax=ax, extend='both')
     
     #set title
-    name_var = get_attribute("variable", var)
-    units = get_attribute("units", attrs.get("unit"))
-    if units == None:
-        units = attrs.get("unit")
+    name_var, units = get_name_and_units(var, attrs)
     if diff == 'rel':
         units = "%"
     if mode == 'climatology':
@@ -102,8 +140,40 @@ def climate_stripe_plot(ds, var, attrs, mode, diff = "abs", season = 'Annual', p
     
     return plt  # Return the plot object
 
+def downsample_to_pixels(ax, da, dpi, how = 'mean'):
+    '''
+    Reduces a (lat, lon) field so that it has no more cells than pixels in the axes.
+
+    Parameters:
+    -----------
+    ax : matplotlib.axes.Axes
+        The axes where the field is drawn.
+    da : xr.DataArray
+        The field with lat and lon dimensions.
+    dpi : int
+        Resolution of the output image.
+    how : str, optional
+        'mean' to average the merged cells or 'nearest' to keep one of them
+        (for categories). Default is 'mean'.
+
+    Returns:
+    --------
+    xr.DataArray
+        The downsampled field.
+    '''
+    bbox = ax.get_position()
+    pixels = {'lon': bbox.width * ax.figure.get_figwidth() * dpi,
+              'lat': bbox.height * ax.figure.get_figheight() * dpi}
+    factors = {dim: max(1, int(np.ceil(da.sizes[dim] / pixels[dim]))) for dim in pixels}
+    if factors == {'lon': 1, 'lat': 1}:
+        return da
+    if how == 'nearest':
+        return da.isel({dim: slice(factor // 2, None, factor) for dim, factor in factors.items()})
+    return da.coarsen(factors, boundary='trim', coord_func='mean').mean()
+
 def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, period = None,
-                     baseline_period = None, GWLs = None, cmap = 'Wistia_r', pvalue = 0.05):
+                     baseline_period = None, GWLs = None, cmap = 'Wistia_r', pvalue = 0.05,
+                     rasterized = False, downsample = False, dpi = 100):
     '''
     Plots the different areas of robustness on the map.
     
@@ -127,17 +197,61 @@ def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, perio
         The baseline period for comparison.
     pvalue : float, optional
         Level of significance for the trend analysis
+    rasterized : bool, optional
+        If True, draw the data with a rasterized `pcolormesh` and all the hatched areas
+        with a single `contourf`, which is much faster for high resolution grids.
+    downsample : bool, optional
+        If True (and `rasterized`), reduce the grid to the pixels of the map at `dpi`
+        before drawing it.
+    dpi : int, optional
+        Resolution of the output image used to downsample. Default is 100.
     
     Returns:
     -------
     plt.Figure
         The matplotlib figure containing the hatched map of robustness.
     '''
+    import matplotlib.pyplot as plt
+    import cartopy.feature as cfeature
+    from matplotlib.patches import Patch
 
     fig = plt.figure(figsize=(60, 10))
-    ax = fig.add_subplot(1, 2, 1, projection=ccrs.PlateCarree())
-
-    if mode == "trends":
+    ax = fig.add_subplot(1, 2, 1, projection=get_projection())
+
+    if rasterized:
+        def resample(da, how = 'mean'):
+            return downsample_to_pixels(ax, da, dpi, how) if downsample else da
+
+        def draw(da, vmin, vmax, **cbar_kwargs):
+            da = resample(da)
+            img = ax.pcolormesh(da.lon, da.lat, da.transpose('lat', 'lon'), cmap = cmap,
+                                vmin = vmin, vmax = vmax, shading = 'nearest',
+                                transform = get_projection(), rasterized = True)
+            fig.colorbar(img, ax = ax, **cbar_kwargs)
+
+        def hatch(da, hatches):
+            # One contourf with a hatch per level computes all the polygons at once
+            da = resample(da, how = 'nearest').transpose('lat', 'lon')
+            ax.contourf(da.lon, da.lat, da, levels = np.arange(len(hatches) + 1) + 0.5,
+                        colors = 'none', hatches = hatches, transform = get_projection())
+
+    if mode == "trends" and rasterized:
+        max_values = np.nanmax(abs(ds['slope']*10))
+        draw(ds['slope']*10, - max_values, max_values,
+             label = f"Units: {attrs.get('unit')} per decade")
+        hatch((ds['pvalue'] > pvalue).where(ds['slope'].notnull()), ['xxxx'])
+        legend_elements = [
+            Patch(facecolor='none', edgecolor='black', hatch='', 
+                  label='Significant trend (original color)'),
+            Patch(facecolor='none', edgecolor='black', hatch='xxxx', 
+                  label='Non significant trends')]
+        ax.legend(handles=legend_elements, loc='center left', 
+                  bbox_to_anchor=(0, -0.1),
+                  prop={'size': 14})
+    elif rasterized:
+        max_values = abs(ds).max().values.item()
+        draw(ds, - max_values, max_values)
+    elif mode == "trends":
         # Adjust colormap based on your preference
         max_values = np.nanmax(abs(ds['slope']*10))
         min_values = - max_values
@@ -148,7 +262,7 @@ def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, perio
         #non significance trends
         ax.contourf(
             lons, lats, (ds['slope']*10).where(ds['pvalue'] > pvalue),
-            transform=ccrs.PlateCarree(),
+            transform=get_projection(),
             colors='none',
             hatches='xxxx',
         )
@@ -168,32 +282,35 @@ def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, perio
         min_values = - max_values
         ds.plot(cmap = cmap, vmin = min_values, vmax = max_values)
     if mode == "change":
-        # Get latitude and longitude values
-        lons, lats = np.meshgrid(categories.lon, categories.lat)
+        if rasterized:
+            hatch(categories, ['', '\\\\', 'xxxx'])
+        else:
+            # Get latitude and longitude values
+            lons, lats = np.meshgrid(categories.lon, categories.lat)
         
-        # Plot hatched areas for category 1shrink
-        ax.contourf(
-            lons, lats, categories.where(categories == 1),
-            transform=ccrs.PlateCarree(),
-            colors='none',
-            hatches='',
-        )
+            # Plot hatched areas for category 1shrink
+            ax.contourf(
+                lons, lats, categories.where(categories == 1),
+                transform=get_projection(),
+                colors='none',
+                hatches='',
+            )
         
-        # Plot hatched areas for category 2
-        ax.contourf(
-            lons, lats, categories.where(categories == 2),
-            transform=ccrs.PlateCarree(),
-            colors='none',
-            hatches='\\\\',
-        )
+            # Plot hatched areas for category 2
+            ax.contourf(
+                lons, lats, categories.where(categories == 2),
+                transform=get_projection(),
+                colors='none',
+                hatches='\\\\',
+            )
         
-        # Plot hatched areas for category 3
-        ax.contourf(
-            lons, lats, categories.where(categories == 3),
-            transform=ccrs.PlateCarree(),
-            colors='none',
-            hatches='xxxx',
-        )
+            # Plot hatched areas for category 3
+            ax.contourf(
+                lons, lats, categories.where(categories == 3),
+                transform=get_projection(),
+                colors='none',
+                hatches='xxxx',
+            )
         
         # Manually create legend
         legend_elements = [
@@ -212,10 +329,7 @@ def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, perio
     ax.add_feature(cfeature.COASTLINE)
 
     #set title
-    name_var = get_attribute("variable", var)
-    units = get_attribute("units", attrs.get("unit"))
-    if units == None:
-        units = attrs.get("unit")
+    name_var, units = get_name_and_units(var, attrs)
     if mode == 'climatology':
         title = f'{name_var} ({units}) - {attrs.get("project")} - {mode}  - {attrs.get("scenario")}  - ({attrs.get("season_name")})'
     elif GWLs:
@@ -229,7 +343,7 @@ def hatched_map_plot(ds, var, attrs, mode, diff = None, categories = None, perio
 
 def annual_cycle(ds, var, attrs, mode, diff = None, 
                  baseline_period = slice('1850', '1870'), 
-                 period = slice('2081', '2100'), GWLs = None):
+                 period = slice('2081', '2100'), GWLs = None, ensemble_stats = None):
     '''
     Function to visualize the annual cycle of climate data.
 
@@ -251,12 +365,16 @@ def annual_cycle(ds, var, attrs, mode, diff = None,
         Time period to consider for the analysis. Default is slice('2081', '2100').
     GWLs : xarray.Dataset, optional
         String containing the global warming level. Default is None.
+    ensemble_stats : xarray.Dataset, optional
+        The output of `analysis.ensemble_statistics` for `ds`, with at least the
+        10th, 25th, 75th and 90th percentiles. Computed if not provided. Default is None.
 
     Returns:
     --------
     fig : matplotlib.figure.Figure
         Figure object containing the time series plot.
     '''
+    import matplotlib.pyplot as plt
     # Create figure and axes
     fig, ax = plt.subplots(figsize=(20, 15))
     
@@ -264,40 +382,31 @@ def annual_cycle(ds, var, attrs, mode, diff = None,
         # Calculate mean line
         mean_change = ds
     else:
-        members = ds['member'].count().values
+        if ensemble_stats is None:
+            ensemble_stats = ensemble_statistics(ds)
         # Calculate mean line
-        mean_change = ds.mean('member')
+        mean_change = ensemble_stats['mean']
         time_plot = ds
     
-        # Calculate change for each member and plot
-        for m in range(members):
-            time_plot.sel(member=m).plot(ax=ax, color='red', linewidth=0.5, linestyle = ':')
+        # Plot all the members at once
+        ax.plot(time_plot['month'], time_plot.transpose('month', 'member'), color='red',
+                linewidth=0.5, linestyle = ':')
         ax.plot([], color='red', linewidth=0.25, linestyle = ":" ,label = attrs.get("project"))# to add it to the legend
         
-        # Calculate percentiles and fill between them
-        upper_90th_percentile = np.nanpercentile(time_plot, 90,
-                                                 axis=time_plot.dims.index('member'))
-        lower_10th_percentile = np.nanpercentile(time_plot, 10,
-                                                 axis=time_plot.dims.index('member'))
-        upper_75th_percentile = np.nanpercentile(time_plot, 75,
-                                                 axis=time_plot.dims.index('member'))
-        lower_25th_percentile = np.nanpercentile(time_plot, 25,
-                                                 axis=time_plot.dims.index('member'))
+        # Fill between the percentiles
+        percentiles = ensemble_stats['percentiles']
         ax.fill_between(mean_change['month'], 
-                        upper_90th_percentile, lower_10th_percentile, color='red',
+                        percentiles.sel(percentile=90), percentiles.sel(percentile=10), color='red',
                         alpha=0.25, label='P10 to P90')
         ax.fill_between(mean_change['month'],
-                        upper_75th_percentile, lower_25th_percentile, color='red',
+                        percentiles.sel(percentile=75), percentiles.sel(percentile=25), color='red',
                         alpha=0.3,label='P25 to P75')
     
     # Plot the mean line
     mean_change.plot(ax=ax, color='red', linewidth=2, label='P50 (Median)')
 
     #set title
-    name_var = get_attribute("variable", var)
-    units = get_attribute("units", attrs.get("unit"))
-    if units == None:
-        units = attrs.get("unit")
+    name_var, units = get_name_and_units(var, attrs)
     if diff == 'rel':
         units = "%"
     if mode == 'climatology':
@@ -330,7 +439,7 @@ def annual_cycle(ds, var, attrs, mode, diff = None,
 def time_series(ds, var, attrs, mode = 'climatology', diff = 'abs', 
                 ds_baseline = None, season = 'Annual', 
                 period = None, baseline_period = None, GWL = None, GWLs = None,
-                results = None, trend_period = slice('1950','2020')):
+                results = None, trend_period = slice('1950','2020'), ensemble_stats = None):
     '''
     Function to visualize time series of climate data.
 
@@ -359,20 +468,22 @@ def time_series(ds, var, attrs, mode = 'climatology', diff = 'abs',
         Global warming level. Default is None.
     GWLs : xarray.Dataset, optional
         Dataset containing global warming levels. Default is None.
+    ensemble_stats : xarray.Dataset, optional
+        The output of `analysis.ensemble_statistics` for the plotted members (the
+        changes in 'change' mode), with at least the 10th, 25th, 75th and 90th
+        percentiles. Computed if not provided. Default is None.
 
     Returns:
     --------
     fig : matplotlib.figure.Figure
         Figure object containing the time series plot.
     '''      
+    import matplotlib.pyplot as plt
     # Create figure and axes
     fig, ax = plt.subplots(figsize=(20, 15))
 
      #get units
-    name_var = get_attribute("variable", var)
-    units = get_attribute("units", attrs.get("unit"))
-    if units == None:
-        units = attrs.get("unit")
+    name_var, units = get_name_and_units(var, attrs)
     if attrs.get("project") in ["ERA5", "ERA5-Land", "E-OBS", "ORAS5"]:# project that don't have menber
         if mode == 'change':
             if diff =='abs':
@@ -392,8 +503,6 @@ def time_series(ds, var, attrs, mode = 'climatology', diff = 'abs',
             fitted_line.plot(color = 'grey',
                              label= f'Trend {slope.round(5)*10} {units} per decade (p_value {results.pvalue.round(4)})')
     else:
-        members = ds['member'].count().values
-                        
         # Calculate mean line
         if mode == 'change':
             if diff =='abs':
@@ -408,21 +517,16 @@ def time_series(ds, var, attrs, mode = 'climatology', diff = 'abs',
             mean_change = ds.mean('member')
             time_plot = ds 
         
-        # Calculate change for each member and plot
-        for m in range(members):
-            time_plot.sel(member=m).plot(ax=ax, color='red', linewidth=0.5, linestyle = ':')
+        # Plot all the members at once
+        ax.plot(time_plot['year'], time_plot.transpose('year', 'member'), color='red',
+                linewidth=0.5, linestyle = ':')
             
-        upper_90th_percentile = np.nanpercentile(time_plot, 90,
-                                                 axis = time_plot.dims.index('member'))
-        lower_10th_percentile = np.nanpercentile(time_plot, 10,
-                                                 axis = time_plot.dims.index('member'))
-        upper_75th_percentile = np.nanpercentile(time_plot, 75,
-                                                 axis = time_plot.dims.index('member'))
-        lower_25th_percentile = np.nanpercentile(time_plot, 25,
-                                                 axis = time_plot.dims.index('member'))
-        ax.fill_between(mean_change['year'], upper_90th_percentile, lower_10th_percentile, 
+        if ensemble_stats is None:
+            ensemble_stats = ensemble_statistics(time_plot)
+        percentiles = ensemble_stats['percentiles']
+        ax.fill_between(mean_change['year'], percentiles.sel(percentile=90), percentiles.sel(percentile=10), 
                         color='red', alpha=0.25, label='P10 to P90')
-        ax.fill_between(mean_change['year'], upper_75th_percentile, lower_25th_percentile, 
+        ax.fill_between(mean_change['year'], percentiles.sel(percentile=75), percentiles.sel(percentile=25), 
                         color='red', alpha=0.3,label='P25 to P75')
 
     mean_change.plot(ax=ax, color='red', linewidth=2, label='P50 (Median)')
@@ -507,6 +611,7 @@ def seasonal_stripe_plot(ds, var, attrs,  mode, diff = None,
     plt.Figure
         The matplotlib figure containing the climate stripes plot.
     """
+    import matplotlib.pyplot as plt
                             
     # Calculate the reference difference
     if mode == 'change':
@@ -550,10 +655,7 @@ def seasonal_stripe_plot(ds, var, attrs,  mode, diff = None,
                         'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
     
     #set title
-    name_var = get_attribute("variable", var)
-    units = get_attribute("units", attrs.get("unit"))
-    if units == None:
-        units = attrs.get("unit")
+    name_var, units = get_name_and_units(var, attrs)
     if diff == 'rel':
         units = "%"
     if mode == 'climatology':
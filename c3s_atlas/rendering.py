@@ -0,0 +1,167 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Tuple
+
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.logger import get_logger
+
+logger = get_logger("Rendering")
+
+PLOT_FUNCTIONS = [
+    "climate_stripe_plot",
+    "hatched_map_plot",
+    "annual_cycle",
+    "time_series",
+    "seasonal_stripe_plot",
+]
+
+
+def init_worker(coastline_scales: Tuple[str] = ("110m", "50m")):
+    """
+    Prepare a rendering process: select the Agg backend and load the shared resources.
+
+    The cartopy projections are cached by `products.get_projection` and cartopy keeps
+    the Natural Earth geometries in memory once read, so every figure rendered by the
+    process reuses them.
+
+    Parameters
+    ----------
+    coastline_scales : tuple of str, optional
+        Natural Earth scales of the coastlines read in advance. The default is
+        ("110m", "50m").
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import cartopy.feature as cfeature
+    from c3s_atlas.products import get_projection
+
+    get_projection()
+    for scale in coastline_scales:
+        try:
+            list(cfeature.COASTLINE.with_scale(scale).geometries())
+        except Exception as error:
+            logger.info(f"Coastlines at {scale} could not be loaded: {error}")
+
+
+def load_data(data):
+    """
+    Get the data of a plot spec.
+
+    Parameters
+    ----------
+    data : xarray.Dataset, xarray.DataArray, str or pathlib.Path
+        The data, or the path of a NetCDF file. Files with a single variable are
+        returned as a DataArray.
+
+    Returns
+    -------
+    xarray.Dataset or xarray.DataArray
+    """
+    if isinstance(data, (str, Path)):
+        data = xr.load_dataset(data)
+        if len(data.data_vars) == 1:
+            data = data[list(data.data_vars)[0]]
+    return data
+
+
+def render_figure(spec: dict, dpi: int = 100) -> float:
+    """
+    Render one plot spec and write the image to disk.
+
+    Parameters
+    ----------
+    spec : dict
+        The plot spec with the name of the plot function of `products` ("plot"), the
+        data ("data", see `load_data`), the variable ("var"), the attributes ("attrs"),
+        the path of the image ("output") and, optionally, the keyword arguments of the
+        plot function ("kwargs", e.g. {"mode": "change", "diff": "abs"}) and the
+        resolution ("dpi").
+    dpi : int, optional
+        Resolution used when the spec does not set one. The default is 100.
+
+    Returns
+    -------
+    float
+        Elapsed seconds.
+    """
+    import matplotlib.pyplot as plt
+    from c3s_atlas import products
+
+    start = time.perf_counter()
+    if spec["plot"] not in PLOT_FUNCTIONS:
+        raise ValueError(
+            f"Plot '{spec['plot']}' not implemented. Please, specify one of the "
+            f"following: {PLOT_FUNCTIONS}."
+        )
+    plot_function = getattr(products, spec["plot"])
+    fig = plot_function(
+        load_data(spec["data"]), spec["var"], spec.get("attrs", {}), **spec.get("kwargs", {})
+    )
+    # Some plot functions return the pyplot module or nothing
+    if not isinstance(fig, plt.Figure):
+        fig = plt.gcf()
+    output = Path(spec["output"])
+    os.makedirs(output.parent, exist_ok=True)
+    try:
+        fig.savefig(output, dpi=spec.get("dpi", dpi), bbox_inches="tight")
+    finally:
+        plt.close(fig)
+    return time.perf_counter() - start
+
+
+def render_figures(
+    specs: List[dict],
+    max_workers: int = None,
+    dpi: int = 100,
+    coastline_scales: Tuple[str] = ("110m", "50m"),
+) -> pd.DataFrame:
+    """
+    Render many plot specs in parallel processes with the Agg backend.
+
+    Parameters
+    ----------
+    specs : list of dict
+        The plot specs, see `render_figure`.
+    max_workers : int, optional
+        Number of processes. The default is the number of CPUs.
+    dpi : int, optional
+        Resolution used when a spec does not set one. The default is 100.
+    coastline_scales : tuple of str, optional
+        Natural Earth scales of the coastlines loaded by every process before
+        rendering. The default is ("110m", "50m").
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per spec with the plot, output path, status ("done" or "failed")
+        and elapsed seconds.
+    """
+    records = [
+        {"plot": spec["plot"], "output": str(spec["output"]), "status": "failed", "seconds": 0.0}
+        for spec in specs
+    ]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=init_worker, initargs=(coastline_scales,)
+    ) as executor:
+        futures = {executor.submit(render_figure, spec, dpi): i for i, spec in enumerate(specs)}
+        for future in as_completed(futures):
+            record = records[futures[future]]
+            try:
+                record["seconds"] = future.result()
+                record["status"] = "done"
+            except Exception as error:
+                logger.info(f"Rendering of {record['output']} failed: {error}")
+
+    report = pd.DataFrame(records, columns=["plot", "output", "status", "seconds"])
+    done = report[report["status"] == "done"]
+    logger.info(
+        f"Rendered {len(done)} of {len(report)} figures in "
+        f"{time.perf_counter() - start:.1f} s (mean {done['seconds'].mean():.2f} s "
+        f"per figure, max {done['seconds'].max():.2f} s)"
+    )
+    return report
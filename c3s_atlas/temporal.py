@@ -1,5 +1,6 @@
 import xarray
 import cftime
+import numpy as np
 import re
 
 def infer_freq(ds: xarray.Dataset):
@@ -68,3 +69,115 @@ def add_time(ds: xarray.Dataset) -> xarray.Dataset:
     ds = ds.assign_coords(time=("time", time))
 
     return ds
+
+def period_years(period):
+    """
+    Get the first and last years of a period.
+
+    Parameters
+    ----------
+    period : str or slice
+        The period in format "YYYY-YYYY" or a slice of years, e.g. slice('2081', '2100').
+
+    Returns
+    -------
+    tuple or None
+        (start, end) years, or None if the period is not given in whole years.
+    """
+    if isinstance(period, str):
+        period = period.split('-')
+        if len(period) != 2:
+            return None
+        start, end = period
+    elif isinstance(period, slice):
+        start, end = period.start, period.stop
+    else:
+        return None
+    try:
+        return int(start), int(end)
+    except (TypeError, ValueError):
+        return None
+
+class TimeWindowIndexer:
+    """
+    Translates windows of years into integer positions of a sorted time coordinate.
+
+    The years of the time coordinate are computed once, so selecting many windows
+    (e.g. one per member and GWL) only costs a `np.searchsorted` each instead of a
+    label-based search of the time index.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset or xarray.DataArray
+        Data with a sorted `time` coordinate.
+    """
+    def __init__(self, ds):
+        self.years = ds['time'].dt.year.values
+        if np.any(np.diff(self.years) < 0):
+            raise ValueError("The time coordinate must be sorted to index windows of years.")
+
+    def windows(self, start, end):
+        """
+        Get the positions of many windows of years at once.
+
+        Parameters
+        ----------
+        start : array-like
+            First year of each window.
+        end : array-like
+            Last year of each window (included).
+
+        Returns
+        -------
+        first, last : np.ndarray
+            Position of the first time step of each window and position after its
+            last time step.
+        """
+        first = np.searchsorted(self.years, start, side='left')
+        last = np.searchsorted(self.years, end, side='right')
+        return first, last
+
+    def window(self, period):
+        """
+        Get the positions of a period.
+
+        Parameters
+        ----------
+        period : str or slice
+            The period in format "YYYY-YYYY" or a slice of years.
+
+        Returns
+        -------
+        slice or None
+            Integer slice of the time steps of the period, or None if the period is
+            not given in whole years.
+        """
+        years = period_years(period)
+        if years is None:
+            return None
+        first, last = self.windows(*years)
+        return slice(int(first), int(last))
+
+    def select(self, ds, period):
+        """
+        Select the time steps of a period.
+
+        Periods that are not given in whole years (e.g. slices of dates) are selected
+        with `ds.sel`.
+
+        Parameters
+        ----------
+        ds : xarray.Dataset or xarray.DataArray
+            Data with the time coordinate of the indexer.
+        period : str or slice
+            The period in format "YYYY-YYYY" or a slice of years.
+
+        Returns
+        -------
+        xarray.Dataset or xarray.DataArray
+            The data of the period.
+        """
+        window = self.window(period)
+        if window is None:
+            return ds.sel(time=period)
+        return ds.isel(time=window)
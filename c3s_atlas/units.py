@@ -1,6 +1,8 @@
 import xarray as xr
+import numpy as np
 import re
-from c3s_atlas.logger import get_logger
+from functools import lru_cache
+from c3s_atlas.logger import get_logger, instrumented
 from c3s_atlas.temporal import infer_freq
 
 logger = get_logger("UNITS_TRANSFORM")
@@ -118,12 +120,31 @@ VALID_UNITS = {
 }
 
 
-def convert_units(ds: xr.Dataset, project: str) -> xr.Dataset:
+@lru_cache(maxsize=None)
+def valid_units_pattern(ds_var: str) -> re.Pattern:
     """
-    Transform the data units.
+    Compile (once per variable) the regular expression of the valid units.
 
-    Performs data transformation by reading the 'units' attribute inside the metadata.
-    For instance: if data is in Kelvin, the function transform it in ºC
+    Parameters
+    ----------
+    ds_var : str
+        The name of the variable.
+
+    Returns
+    -------
+    re.Pattern
+        Compiled pattern matching the units expected for the variable.
+    """
+    return re.compile(f"^{VALID_UNITS[ds_var]}$")
+
+
+def get_conversion_plan(ds: xr.Dataset, project: str) -> dict:
+    """
+    Get the unit conversions needed by the variables of a dataset.
+
+    The time frequency of the dataset is inferred at most once, and only if a
+    variable whose conversion depends on it (monthly radiation or ERA5 evaporation)
+    has to be converted.
 
     Parameters
     ----------
@@ -134,26 +155,103 @@ def convert_units(ds: xr.Dataset, project: str) -> xr.Dataset:
 
     Returns
     -------
-    ds (xarray.Dataset): data with the new units
+    plan (dict): (scale, offset, new units) for each variable to be converted
     """
+    plan = {}
+    time_frequency = None
     for ds_var in list(ds.data_vars):
-        if re.match(f"^{VALID_UNITS[ds_var]}$", ds[ds_var].attrs["units"]):
+        units = ds[ds_var].attrs["units"]
+        if valid_units_pattern(ds_var).match(units):
             logger.info(
                 f"The dataset {ds_var} units are already in the correct magnitude"
             )
+            continue
+        logger.info(
+            f"The dataset {ds_var} units are not in the correct magnitude. "
+            f"A conversion from {units} to "
+            f"{VALID_UNITS[ds_var]} will be performed."
+        )
+        if ds_var in ["rlds", "rsds"] or ("era5" in project and ds_var in ["evspsbl"]):
+            if time_frequency is None:
+                time_frequency = infer_freq(ds)
+        if (time_frequency == "MS" and ds_var in ["rlds", "rsds"]) or (
+            "era5" in project and ds_var in ["evspsbl"] and time_frequency == "MS"
+        ):
+            plan[ds_var] = UNIT_CONVERTER_MONTHLY[units]
         else:
-            logger.info(
-                f"The dataset {ds_var} units are not in the correct magnitude. "
-                f'A conversion from {ds[ds_var].attrs["units"]} to '
-                f"{VALID_UNITS[ds_var]} will be performed."
-            )
-            time_frequency = infer_freq(ds)
-            if (time_frequency == "MS" and ds_var in ["rlds", "rsds"]) or (
-                "era5" in project and ds_var in ["evspsbl"] and time_frequency == "MS"
-            ):
-                conversion = UNIT_CONVERTER_MONTHLY[ds[ds_var].attrs["units"]]
-            else:
-                conversion = UNIT_CONVERTER[ds[ds_var].attrs["units"]]
-            ds[ds_var] = ds[ds_var] * conversion[0] + conversion[1]
-            ds[ds_var].attrs["units"] = conversion[2]
+            plan[ds_var] = UNIT_CONVERTER[units]
+    return plan
+
+
+def apply_conversion(
+    da: xr.DataArray, scale: float, offset: float, dtype: str = None
+) -> xr.DataArray:
+    """
+    Apply a linear unit conversion (da * scale + offset) keeping the data type.
+
+    The scale and offset are cast to the floating type of the data, so float32 data
+    stay in float32. Dask arrays are converted lazily; numpy arrays are converted
+    with a single output buffer. Identity conversions return the data untouched.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Data to be converted.
+    scale : float
+        Multiplicative factor.
+    offset : float
+        Additive offset.
+    dtype : str, optional
+        Data type of the converted data (e.g. "float32"). If None, the floating type
+        of the data is kept (float64 for integer data). The default is None.
+
+    Returns
+    -------
+    xarray.DataArray
+        Converted data with the attributes of the original data.
+    """
+    if scale == 1 and offset == 0:
+        return da if dtype is None else da.astype(dtype, copy=False)
+    if dtype is not None:
+        dtype = np.dtype(dtype)
+    elif np.issubdtype(da.dtype, np.floating):
+        dtype = da.dtype
+    else:
+        dtype = np.dtype("float64")
+    scale = dtype.type(scale)
+    offset = dtype.type(offset)
+    if isinstance(da.data, np.ndarray):
+        data = np.multiply(da.data, scale, dtype=dtype)
+        if offset != 0:
+            np.add(data, offset, out=data)
+    else:
+        data = (da.data * scale + offset).astype(dtype, copy=False)
+    return da.copy(deep=False, data=data)
+
+
+@instrumented()
+def convert_units(ds: xr.Dataset, project: str, dtype: str = None) -> xr.Dataset:
+    """
+    Transform the data units.
+
+    Performs data transformation by reading the 'units' attribute inside the metadata.
+    For instance: if data is in Kelvin, the function transform it in ºC
+
+    Parameters
+    ----------
+    ds: xarray.Dataset
+       data stored by dimensions
+    project : str
+       The name of the project.
+    dtype : str, optional
+       Data type of the converted variables (e.g. "float32"). If None, the floating
+       type of each variable is kept. The default is None.
+
+    Returns
+    -------
+    ds (xarray.Dataset): data with the new units
+    """
+    for ds_var, conversion in get_conversion_plan(ds, project).items():
+        ds[ds_var] = apply_conversion(ds[ds_var], conversion[0], conversion[1], dtype)
+        ds[ds_var].attrs["units"] = conversion[2]
     return ds
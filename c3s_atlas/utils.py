@@ -6,6 +6,11 @@ import numpy as np
 import datetime
 import glob
 import json
+import shutil
+
+from c3s_atlas.logger import get_logger, instrumented
+
+logger = get_logger("Utils")
 
 # Get current directory
 c_path = Path(__file__)
@@ -14,64 +19,347 @@ c_path_c3s_atlas = c_path.parents[1]
 def extract_zip_and_delete(zip_path):
     """
     Function to extract zip files and rename .nc file
-    
+
+    Only the NetCDF file is written to disk, see `extract_netcdf`.
+
     Parameters
     ----------
     zip_path (pathlib.Path): path to the downloaded zip files
     """
-    with zipfile.ZipFile(zip_path , 'r') as zip_ref:
-        names = zip_ref.namelist()
-        temporal_files = [
-            f"{zip_path.parent}/{name}" for name in names if name.split(".")[-1] == "nc"
-        ]
-        zip_ref.extractall(zip_path.parent)
+    extract_netcdf(zip_path, delete=True)
+
+def netcdf_members(zip_ref: zipfile.ZipFile) -> list:
+    """Names of the NetCDF files stored in an open zip archive."""
+    return [name for name in zip_ref.namelist() if name.split(".")[-1] == "nc"]
+
+
+def extract_netcdf(zip_path, delete: bool = True, block_size: int = 2**20) -> list:
+    """
+    Extract the NetCDF files of a zip archive straight to their final names.
+
+    Each file is decompressed in blocks into a temporary file next to the archive,
+    which is renamed once complete, and the other files of the archive are never
+    written to disk. A single NetCDF file is named after the archive, as in
+    `extract_zip_and_delete`; several are named after the archive and the file.
+
+    Parameters
+    ----------
+    zip_path (pathlib.Path): path to the downloaded zip file
+    delete (bool): remove the zip file once extracted. The default is True
+    block_size (int): number of bytes decompressed at once. The default is 1 MiB
+
+    Returns
+    -------
+    list of pathlib.Path with the extracted files
+    """
+    zip_path = Path(zip_path)
+    paths = []
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        names = netcdf_members(zip_ref)
         for name in names:
-            print(name)
-            if name.split(".")[-1] == "nc":
-                os.rename(f"{zip_path.parent}/{name}", 
-                          zip_path.with_name(zip_path.name.replace('.zip', '.nc'))
-                         )
+            if len(names) == 1:
+                path = zip_path.with_name(zip_path.name.replace('.zip', '.nc'))
             else:
-                os.remove(f"{zip_path.parent}/{name}") 
+                path = zip_path.with_name(f"{zip_path.stem}_{Path(name).name}")
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            try:
+                with zip_ref.open(name) as source, open(tmp_path, "wb") as target:
+                    shutil.copyfileobj(source, target, block_size)
+                os.replace(tmp_path, path)
+            finally:
+                if tmp_path.exists():
+                    os.remove(tmp_path)
+            paths.append(path)
+    if delete:
+        os.remove(zip_path)
+    return paths
+
+
+def extract_zips(zip_paths, max_workers: int = None, delete: bool = True) -> dict:
+    """
+    Extract the NetCDF files of many zip archives concurrently.
+
+    The archives are extracted with `extract_netcdf` in a thread pool (the
+    decompression and the writes release the GIL). Archives that fail are logged
+    and kept.
+
+    Parameters
+    ----------
+    zip_paths (list of pathlib.Path): paths to the downloaded zip files
+    max_workers (int): number of threads. The default is the ThreadPoolExecutor default
+    delete (bool): remove the zip files once extracted. The default is True
+
+    Returns
+    -------
+    dict with the extracted files of each zip file (None for the failed ones)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    zip_paths = [Path(zip_path) for zip_path in zip_paths]
+
+    def extract(zip_path):
+        try:
+            return extract_netcdf(zip_path, delete=delete)
+        except (OSError, zipfile.BadZipFile) as error:
+            logger.info(f"{zip_path} could not be extracted: {error}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        extracted = dict(zip(zip_paths, executor.map(extract, zip_paths)))
+    n_failed = sum(paths is None for paths in extracted.values())
+    logger.info(f"Extracted {len(zip_paths) - n_failed} of {len(zip_paths)} zip files")
+    return extracted
+
+
+def open_dataset_from_zip(zip_path, member: str = None, in_memory: bool = True, **kwargs):
+    """
+    Open a NetCDF file stored in a zip archive without extracting it.
+
+    Parameters
+    ----------
+    zip_path (pathlib.Path): path to the zip file
+    member (str): name of the NetCDF file in the archive. The default is the only
+        NetCDF file of the archive
+    in_memory (bool): decompress the file into memory and open it with netCDF4,
+        which reads any NetCDF format. If False, the file is read lazily from the
+        archive as a file-like object (h5netcdf or scipy engines), which avoids
+        holding it in memory but is slow for compressed archives. The default is True
+    **kwargs: passed to `xarray.open_dataset`
+
+    Returns
+    -------
+    xarray.Dataset: the caller must close it (e.g. with a `with` block) to release
+        the file read from the archive
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        if member is None:
+            names = netcdf_members(zip_ref)
+            if len(names) != 1:
+                raise ValueError(
+                    f"{zip_path} contains {len(names)} NetCDF files, please specify one "
+                    f"of the following: {names}."
+                )
+            member = names[0]
+        if in_memory:
+            data = zip_ref.read(member)
+        else:
+            # The member stays readable once the archive is closed, the archive file
+            # is released when the member is closed
+            source = zip_ref.open(member)
+    if in_memory:
+        import netCDF4
+
+        source = netCDF4.Dataset(Path(member).name, mode="r", memory=data)
+    try:
+        store = xr.backends.NetCDF4DataStore(source) if in_memory else source
+        return xr.open_dataset(store, **kwargs)
+    except Exception:
+        source.close()
+        raise
 
-    os.remove(zip_path)
 
-def get_ds_to_fill(variable: str, target: xr.Dataset, reference: xr.Dataset):
+def get_ds_to_fill(
+    variable: str, target: xr.Dataset, reference: xr.Dataset, dtype: str = "float64",
+    storage: str = None, path=None, chunks=None
+):
     """
     Create an empty dataset which will be filled with the bias adjusted data.
 
+    By default the data are allocated in memory. For large targets the data can be
+    a memory-mapped file or a Zarr store on disk, which are filled block by block
+    with `fill_region` without holding the full array in memory. The data can also be
+    a lazy dask array of zeros, e.g. as a template, which `fill_region` does not fill:
+    each assignment would keep its block in the dask graph.
+
     Parameters
     ----------
     variable (str): variable name
     dataset (xarray.dataset): dataset reference to create the new dataset to fill,
     this dataset must be the experiment/future dataset
+    dtype (str): data type of the dataset to fill, e.g. "float32"
+    storage (str): None (numpy array in memory), "dask" (lazy dask array, not
+        fillable with `fill_region`),
+        "memmap" (numpy memory-mapped file at `path`) or "zarr" (Zarr store
+        at `path`, only the metadata is written)
+    path (str or pathlib.Path): file used by the "memmap" and "zarr" storages
+    chunks (dict or int): chunks of the "dask" and "zarr" storages, e.g.
+        {"time": 365}. The default lets dask choose them
 
     Returns
     -------
     ds_bias (xarray.Dataset): empty dataset with the same dimensions and
     coordinates that the reference dataset provided
     """
+    shape = (
+        len(target.time.values),
+        len(reference.lon.values),
+        len(reference.lat.values),
+    )
+    coords = dict(
+        time=(["time"], target.time.values),
+        lon=(["lon"], reference.lon.values),
+        lat=(["lat"], reference.lat.values),
+    )
+    if storage is None:
+        data = np.zeros(shape=shape, dtype=dtype)
+    elif storage in ["dask", "zarr"]:
+        import dask.array
+
+        if isinstance(chunks, dict):
+            chunks = tuple(chunks.get(dim, -1) for dim in ["time", "lon", "lat"])
+        data = dask.array.zeros(shape, dtype=dtype, chunks=chunks or "auto")
+    elif storage == "memmap":
+        if path is None:
+            raise ValueError("A path must be provided to use the 'memmap' storage")
+        data = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    else:
+        raise ValueError(
+            f"Storage '{storage}' not implemented. Please, specify "
+            "one of the following: None, 'dask', 'memmap', 'zarr'."
+        )
     ds_bias = xr.Dataset(
-        data_vars={
-            f"{variable}": (
-                ["time", "lon", "lat"],
-                np.zeros(
-                    shape=(
-                        len(target.time.values),
-                        len(reference.lon.values),
-                        len(reference.lat.values),
-                    )
-                ),
-            ),
-        },
-        coords=dict(
-            time=(["time"], target.time.values),
-            lon=(["lon"], reference.lon.values),
-            lat=(["lat"], reference.lat.values),
-        ),
+        data_vars={f"{variable}": (["time", "lon", "lat"], data)},
+        coords=coords,
     )
+    if storage == "zarr":
+        if path is None:
+            raise ValueError("A path must be provided to use the 'zarr' storage")
+        # Only the metadata and the coordinates are written, no chunk is computed
+        ds_bias.to_zarr(path, mode="w", compute=False)
+        ds_bias = xr.open_zarr(path)
     return ds_bias
 
+def fill_region(ds_to_fill: xr.Dataset, variable: str, values, region: dict, path=None):
+    """
+    Fill a block of the dataset created with `get_ds_to_fill`.
+
+    Parameters
+    ----------
+    ds_to_fill (xarray.Dataset): dataset created with `get_ds_to_fill`
+    variable (str): variable name
+    values (np.ndarray): values of the block, ordered as the dimensions of the variable
+    region (dict): slice of each dimension to fill, e.g. {"time": slice(0, 365)}.
+        Missing dimensions are filled entirely
+    path (str or pathlib.Path): Zarr store of a dataset created with the "zarr"
+        storage. The block is written directly to disk. For in-memory and memmap
+        datasets it must be None. With Zarr, blocks written in parallel must be
+        aligned with the chunks of the store
+
+    Dask-backed datasets (the "dask" storage, or a Zarr store without `path`) are
+    not supported: assigning a block to a dask array is not thread safe and keeps
+    the block in the dask graph. Use the "memmap" or "zarr" storage instead.
+
+    Returns
+    -------
+    None
+    """
+    dims = ds_to_fill[variable].dims
+    region = {dim: region.get(dim, slice(None)) for dim in dims}
+    if path is None and ds_to_fill[variable].chunks is not None:
+        raise ValueError(
+            "Dask-backed datasets cannot be filled by blocks. Please, create the "
+            "dataset with the 'memmap' or 'zarr' storage (passing the path of the "
+            "Zarr store)."
+        )
+    if path is None:
+        ds_to_fill[variable][region] = values
+    else:
+        region = {
+            dim: slice(*region[dim].indices(ds_to_fill.sizes[dim])[:2]) for dim in dims
+        }
+        block = xr.Dataset({variable: (dims, np.asarray(values))})
+        block.to_zarr(path, region=region, mode="r+")
+
+@instrumented()
+def cast_data_vars(ds: xr.Dataset, dtype: str = None) -> xr.Dataset:
+    """
+    Cast the floating point data variables of a dataset to the given data type.
+
+    Parameters
+    ----------
+    ds (xarray.Dataset): data stored by dimensions
+    dtype (str): data type, e.g. "float32". If None, the dataset is returned unchanged.
+
+    Returns
+    -------
+    ds (xarray.Dataset): dataset with the floating point variables cast
+    """
+    if dtype is None:
+        return ds
+    for var in ds.data_vars:
+        if np.issubdtype(ds[var].dtype, np.floating) and ds[var].dtype != dtype:
+            ds[var] = ds[var].astype(dtype)
+    return ds
+
+def nanquantile_columns(a: np.ndarray, quantiles: np.ndarray) -> np.ndarray:
+    """
+    Quantiles of every column of `a` ignoring NaNs, with a single sort.
+
+    Equivalent to `np.nanquantile(a, quantiles, axis=0)` (linear method), which
+    loops over the columns in Python when it is called along an axis.
+
+    Parameters
+    ----------
+    a (np.ndarray): (time, cells) data
+    quantiles (np.ndarray): quantiles to compute, between 0 and 1
+
+    Returns
+    -------
+    np.ndarray: (quantiles, cells) quantiles of each column
+    """
+    a_sorted = np.sort(a, axis=0)  # NaNs are sorted to the end
+    n_valid = np.count_nonzero(~np.isnan(a_sorted), axis=0)
+    position = np.asarray(quantiles)[:, None] * (n_valid - 1)
+    position = np.clip(position, 0, None)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0))
+    cols = np.broadcast_to(np.arange(a.shape[1]), lower.shape)
+    v0 = a_sorted[lower, cols].astype("float64")
+    v1 = a_sorted[upper, cols].astype("float64")
+    result = v0 + (position - lower) * (v1 - v0)
+    result[:, n_valid == 0] = np.nan
+    return result
+
+def interp_columns(x: np.ndarray, xp: np.ndarray, fp: np.ndarray) -> np.ndarray:
+    """
+    Linear interpolation of every column of `x` on its own increasing `xp` column.
+
+    Equivalent to calling `np.interp(x[:, i], xp[:, i], fp[:, i])` for every column,
+    with a single `np.searchsorted` over all the columns. Columns where `xp` has
+    missing values return NaN.
+
+    Parameters
+    ----------
+    x (np.ndarray): (time, cells) values to interpolate
+    xp (np.ndarray): (quantiles, cells) increasing x-coordinates of each column
+    fp (np.ndarray): (quantiles, cells) y-coordinates of each column
+
+    Returns
+    -------
+    np.ndarray: (time, cells) interpolated values
+    """
+    n_q, n_cells = xp.shape
+    valid = ~np.isnan(xp).any(axis=0)
+    xp = np.where(valid, xp, np.arange(n_q)[:, None]).astype("float64")
+    lower = min(np.nanmin(xp), np.nanmin(x) if np.isfinite(x).any() else 0)
+    upper = max(np.nanmax(xp), np.nanmax(x) if np.isfinite(x).any() else 0)
+    # Shift every column to its own disjoint interval to search all of them at once
+    offsets = np.arange(n_cells) * (upper - lower + 1.0)
+    xp_flat = (xp - lower + offsets).T.ravel()
+    x_shifted = np.clip(x, xp[0], xp[-1]) - lower + offsets
+    idx = np.searchsorted(xp_flat, x_shifted) - np.arange(n_cells) * n_q
+    idx = np.clip(idx, 1, n_q - 1)
+    cols = np.broadcast_to(np.arange(n_cells), x.shape)
+    x0, x1 = xp[idx - 1, cols], xp[idx, cols]
+    f0, f1 = fp[idx - 1, cols], fp[idx, cols]
+    dx = x1 - x0
+    weight = np.divide(
+        np.clip(x, x0, x1) - x0, dx, out=np.zeros(x.shape), where=dx > 0
+    )
+    result = f0 + weight * (f1 - f0)
+    result[:, ~valid] = np.nan
+    return result
+
 def load_IAMD(
     root, 
     project, 
@@ -94,8 +382,8 @@ def load_IAMD(
         ds_hist = xr.open_dataset(file_hist[0])
         ds_sce = xr.open_dataset(file_sce[0])
         mem_inters = np.intersect1d(ds_hist.member_id.values, ds_sce.member_id.values)
-        ds_hist = ds_hist.isel(member = np.in1d(ds_hist.member_id.values, mem_inters))
-        ds_sce = ds_sce.isel(member = np.in1d(ds_sce.member_id.values, mem_inters))
+        ds_hist = ds_hist.isel(member = np.isin(ds_hist.member_id.values, mem_inters))
+        ds_sce = ds_sce.isel(member = np.isin(ds_sce.member_id.values, mem_inters))
         ds = xr.concat([ds_hist, ds_sce], dim = 'time')
         if scenario == 'historical':
             today = datetime.date.today()
@@ -111,6 +399,54 @@ def load_IAMD(
 
     return ds
 
+class SettingsRegistry:
+    """
+    Process-wide access to `auxiliar/settings.json`.
+
+    The file is read on first use and again only when its modification time changes.
+
+    Parameters
+    ----------
+    path (str or pathlib.Path): path to the settings file
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mtime = None
+        self._settings = {}
+        self.variable_names = {}
+        self.units_labels = {}
+
+    def _load(self):
+        """Read the settings again if the file has changed."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            with open(self.path, 'r') as file:
+                settings = json.load(file)
+            self.variable_names = {
+                key: entry.get('name') for key, entry in settings.get('variable', {}).items()
+            }
+            self.units_labels = dict(settings.get('units', {}))
+            self._settings, self._mtime = settings, mtime
+
+    @property
+    def settings(self) -> dict:
+        """The settings, reloaded if the file has changed."""
+        self._load()
+        return self._settings
+
+    def variable_name(self, key):
+        """Name of a variable (e.g. 't' -> 'Mean temperature'), None if unknown."""
+        self._load()
+        return self.variable_names.get(key)
+
+    def units_label(self, units):
+        """Label of some units (e.g. 'degC·day' -> '&deg;C·day'), None if unknown."""
+        self._load()
+        return self.units_labels.get(units)
+
+settings_registry = SettingsRegistry(f"{c_path_c3s_atlas}/auxiliar/settings.json")
+
 def get_attribute(attrs, name):
     """
     Function to get the name of a variable from the attrs dictionary.
@@ -127,11 +463,8 @@ def get_attribute(attrs, name):
     str
         Name of the variable.
     """
-    # Open and read the JSON file
-    with open(f"{c_path_c3s_atlas}/auxiliar/settings.json", 'r') as file:
-        settings = json.load(file)
-    
-    return settings.get('variable', {}).get(name, {}).get('name')
+    # The settings are cached by the registry and only read again when they change
+    return settings_registry.variable_name(name)
 
 def season_get_name(season):
     '''
@@ -4,4 +4,7 @@ setup(
     name='c3s-atlas',
     version='0.1',
     packages=find_packages(),
+    entry_points={
+        'console_scripts': ['c3s-atlas=c3s_atlas.cli:main'],
+    },
 )
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+import pandas as pd
+import xarray as xr
+
+from c3s_atlas.GWLs import GWLIndex, get_mean_data, get_mean_data_batch
+
+GWLS = ["1.5", "2"]
+SCENARIOS = ["ssp245", "ssp585"]
+
+
+def members_dataset(n_members=6, n_lat=3, n_lon=4):
+    """Monthly 1990-2100 dataset with `n_members` members and some missing values."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1990-01-01", "2100-12-01", freq="MS")
+    data = rng.random((n_members, len(time), n_lat, n_lon), dtype="float32")
+    data[:, :24, 0, 0] = np.nan
+    return xr.Dataset(
+        {"tas": (["member", "time", "lat", "lon"], data)},
+        coords={
+            "member": np.arange(n_members),
+            "member_id": ("member", [f"r{i + 1}i1p1f1" for i in range(n_members)]),
+            "time": time,
+            "lat": np.linspace(-60, 60, n_lat),
+            "lon": np.linspace(-150, 150, n_lon),
+        },
+    )
+
+
+def GWLs_table(members):
+    """GWLs table with 20-year periods, one member not reaching each GWL."""
+    rng = np.random.default_rng(1)
+    columns = pd.MultiIndex.from_product([GWLS, SCENARIOS])
+    start = rng.integers(2000, 2080, (len(members), len(columns)))
+    values = np.char.add(np.char.add(start.astype(str), "-"), (start + 19).astype(str))
+    values[0] = "NA"
+    # The table lists the members in another order than the dataset
+    return pd.DataFrame(values, index=members, columns=columns).iloc[::-1]
+
+
+def test_mean_data_periods_match_dict():
+    ds = members_dataset()
+    periods = GWLIndex(GWLs_table(ds.member_id.values)).select(ds, "ssp245", "2")
+    expected, expected_members = get_mean_data(ds, dict(periods.items()))
+    result, members = get_mean_data(ds, periods)
+    np.testing.assert_array_equal(result.member_id, expected.member_id)
+    np.testing.assert_array_equal(members.member_id, expected_members.member_id)
+    np.testing.assert_allclose(result.tas, expected.tas, rtol=1e-6)
+
+
+def per_call_means(ds, index):
+    """The window means of `get_mean_data`, one call per (scenario, GWL)."""
+    means = []
+    for scenario in SCENARIOS:
+        for GWL in GWLS:
+            averaged_data, _ = get_mean_data(ds, index.select(ds, scenario, GWL))
+            means.append(averaged_data.tas.reindex(member=ds.member).values)
+    return np.stack(means).reshape(len(SCENARIOS), len(GWLS), *means[0].shape)
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 100, "lat": 2}])
+def test_mean_data_batch_matches_per_call(chunks):
+    ds = members_dataset()
+    index = GWLIndex(GWLs_table(ds.member_id.values))
+    expected = per_call_means(ds, index)
+    if chunks:
+        ds = ds.chunk(chunks)
+    result = get_mean_data_batch(ds, index, SCENARIOS, GWLS).tas
+    result = result.transpose("scenario", "gwl", "member", ...)
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result.values, expected, rtol=1e-5)
+    # The member that does not reach the GWLs is missing
+    assert np.isnan(result.values[:, :, 0]).all()
@@ -0,0 +1,62 @@
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.aggregation import AggregationFunction, aggregate_in_time
+
+
+def hourly_dataset(n_days=40):
+    """Float32 hourly data with large values, where float32 sums lose precision."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=n_days * 24, freq="1h")
+    data = (1e4 + 100 * rng.random((len(time), 3, 4))).astype("float32")
+    return xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data)},
+        coords={"time": time, "lat": np.arange(3.0), "lon": np.arange(4.0)},
+    )
+
+
+@pytest.mark.parametrize("agg_res", ["1D", "MS"])
+@pytest.mark.parametrize("agg_funct", list(AggregationFunction))
+def test_float32_is_kept(agg_funct, agg_res):
+    ds = hourly_dataset()
+    result = aggregate_in_time(ds, agg_funct, agg_res, dtype="float32")
+    expected = aggregate_in_time(ds.astype("float64"), agg_funct, agg_res)
+    assert result["tas"].dtype == np.float32
+    assert expected["tas"].dtype == np.float64
+    # Means and sums are accumulated in float64, only the result is rounded
+    np.testing.assert_allclose(result["tas"], expected["tas"], rtol=np.finfo("float32").eps)
+
+
+# Daily sums use the (day, step) blocks, monthly sums the resampling
+@pytest.mark.parametrize("agg_res", ["1D", "MS"])
+def test_float64_accumulation(agg_res):
+    ds = hourly_dataset()
+    result = aggregate_in_time(ds, AggregationFunction.Sum, agg_res, dtype="float32")
+    expected = ds.astype("float64").resample(time=agg_res).sum("time")
+    float32_sum = ds.resample(time=agg_res).sum("time")
+    error = abs(result["tas"] - expected["tas"]).max()
+    assert error <= abs(float32_sum["tas"] - expected["tas"]).max()
+    np.testing.assert_allclose(result["tas"], expected["tas"], rtol=np.finfo("float32").eps)
+
+
+def test_default_dtype():
+    ds = hourly_dataset(n_days=3)
+    assert aggregate_in_time(ds, AggregationFunction.Max)["tas"].dtype == np.float32
+    assert aggregate_in_time(ds.astype("float64"), AggregationFunction.Mean)["tas"].dtype == np.float64
+
+
+@pytest.mark.parametrize("agg_res", ["1D", "MS"])
+def test_no_float64_copy(agg_res):
+    ds = hourly_dataset(n_days=2000)
+    float64_size = ds["tas"].size * 8
+    tracemalloc.start()
+    try:
+        aggregate_in_time(ds, AggregationFunction.Mean, agg_res, dtype="float32")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < float64_size / 2
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.analysis import mean_values_map, mean_values_map_batch
+
+PERIODS = [slice("2021", "2040"), "2041-2060"]
+SEASONS = {"DJF": [12, 1, 2], "JJA": [6, 7, 8]}
+
+
+def monthly_dataset(members=True, n_lat=3, n_lon=4):
+    """Monthly 1981-2060 float32 dataset with some missing values."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1981-01-01", "2060-12-01", freq="MS")
+    shape = (len(time), n_lat, n_lon)
+    dims = ["time", "lat", "lon"]
+    if members:
+        shape, dims = (3,) + shape, ["member"] + dims
+    data = (280 + 10 * rng.random(shape)).astype("float32")
+    data[..., :30, 0, 0] = np.nan
+    return xr.Dataset(
+        {"tas": (dims, data)},
+        coords={"time": time, "lat": np.linspace(-60, 60, n_lat), "lon": np.linspace(0, 300, n_lon)},
+    )
+
+
+@pytest.mark.parametrize("members", [True, False])
+@pytest.mark.parametrize("chunks", [None, {"time": 120}])
+def test_mean_values_map_batch_matches_per_call(members, chunks):
+    ds = monthly_dataset(members)
+    model = "CMIP6" if members else "ERA5"
+    if chunks:
+        ds = ds.chunk(chunks)
+    result = mean_values_map_batch(ds, "tas", "change", PERIODS, SEASONS)["tas"]
+    assert result.dtype == np.float32
+    for period, name in zip(PERIODS, ["2021-2040", "2041-2060"]):
+        for season, months in SEASONS.items():
+            for diff in ["abs", "rel"]:
+                # The batch accumulates in float64, as the mean of float64 data
+                expected = mean_values_map(
+                    ds.astype("float64"), "tas", model, "change",
+                    diff=diff, season=months, period=period,
+                )
+                np.testing.assert_allclose(
+                    result.sel(period=name, season=season, diff=diff),
+                    expected.transpose("lat", "lon"), rtol=1e-5, atol=1e-5,
+                )
+
+
+def test_mean_values_map_batch_accumulates_in_float64():
+    ds = monthly_dataset(members=False)
+    result = mean_values_map_batch(ds, "tas", "climatology", PERIODS)["tas"]
+    expected = mean_values_map_batch(ds.astype("float64"), "tas", "climatology", PERIODS)["tas"]
+    assert expected.dtype == np.float64
+    # Only the final rounding to float32 differs from the float64 computation
+    np.testing.assert_allclose(result, expected, rtol=np.finfo("float32").eps)
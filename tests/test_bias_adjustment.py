@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.bias_adjustment import BiasAdjustment, lon_blocks
+from c3s_atlas.utils import get_ds_to_fill
+
+
+def dataset(start, n_days, seed, n_lat=6, n_lon=64):
+    rng = np.random.default_rng(seed)
+    time = pd.date_range(start, periods=n_days, freq="D")
+    data = rng.normal(15, 5, size=(n_days, n_lat, n_lon)).astype("float32")
+    data[:, 0, 0] = np.nan
+    return xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data)},
+        coords={"time": time, "lat": np.arange(n_lat, dtype=float), "lon": np.arange(n_lon, dtype=float)},
+    )
+
+
+@pytest.mark.parametrize("method", ["eqm", "linear_scaling"])
+def test_zarr_output_matches_memory(tmp_path, method):
+    pytest.importorskip("zarr")
+    obs, hist, fut = dataset("1981-01-01", 730, 0), dataset("1981-01-01", 730, 1), dataset("2041-01-01", 365, 2)
+    attrs = {"var_name": "tas", "method": method, "block_size": 10, "max_workers": 8}
+
+    in_memory = BiasAdjustment(attrs)(obs, hist, fut, get_ds_to_fill("tas", fut, fut, dtype="float32"))
+    path = tmp_path / "adjusted.zarr"
+    ds_zarr = get_ds_to_fill("tas", fut, fut, dtype="float32", storage="zarr", path=path, chunks={"lon": 4})
+    BiasAdjustment(attrs)(obs, hist, fut, ds_zarr, path=path)
+    on_disk = xr.open_zarr(path).load()
+
+    expected, result = in_memory["tas"].values, on_disk["tas"].values
+    assert np.isnan(result).sum() == np.isnan(expected).sum() == 365
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_zarr_blocks_cover_whole_chunks(tmp_path):
+    pytest.importorskip("zarr")
+    fut = dataset("2041-01-01", 10, 0, n_lon=30)
+    path = tmp_path / "adjusted.zarr"
+    ds_zarr = get_ds_to_fill("tas", fut, fut, storage="zarr", path=path, chunks={"lon": 4})
+    blocks = lon_blocks(ds_zarr, "tas", 10, path)
+    assert [(block.start, block.stop) for block in blocks] == [(0, 12), (12, 24), (24, 30)]
+    assert len(lon_blocks(ds_zarr, "tas", 10)) == 3
+
+
+@pytest.mark.parametrize("storage", [None, "memmap"])
+def test_threaded_blocks_are_all_filled(tmp_path, storage):
+    obs, hist, fut = dataset("1981-01-01", 365, 0), dataset("1981-01-01", 365, 1), dataset("2041-01-01", 60, 2)
+    attrs = {"var_name": "tas", "method": "linear_scaling", "block_size": 1, "max_workers": 32}
+    expected = BiasAdjustment(dict(attrs, block_size=64, max_workers=1))(
+        obs, hist, fut, get_ds_to_fill("tas", fut, fut, dtype="float32")
+    )
+    path = tmp_path / "adjusted.dat" if storage else None
+    for _ in range(5):
+        ds_to_fill = get_ds_to_fill("tas", fut, fut, dtype="float32", storage=storage, path=path)
+        result = BiasAdjustment(attrs)(obs, hist, fut, ds_to_fill)
+        np.testing.assert_array_equal(result["tas"].values, expected["tas"].values)
+
+
+def test_dask_placeholder_is_rejected():
+    obs, hist, fut = dataset("1981-01-01", 365, 0), dataset("1981-01-01", 365, 1), dataset("2041-01-01", 60, 2)
+    ds_to_fill = get_ds_to_fill("tas", fut, fut, storage="dask")
+    attrs = {"var_name": "tas", "method": "linear_scaling", "block_size": 1, "max_workers": 8}
+    with pytest.raises(ValueError, match="memmap"):
+        BiasAdjustment(attrs)(obs, hist, fut, ds_to_fill)
@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas import cache
+from c3s_atlas.cache import ResultCache, cached, call_key, data_token
+
+
+def write_dataset(path):
+    time = pd.date_range("2000-01-01", periods=4, freq="D")
+    xr.Dataset(
+        {
+            "tas": (["time", "x"], np.arange(8.0).reshape(4, 2), {"units": "K"}),
+            "pr": (["time", "x"], np.ones((4, 2))),
+        },
+        coords={"time": time, "x": [10, 20]},
+    ).to_netcdf(path)
+    return path
+
+
+def test_token_of_unmodified_file(tmp_path):
+    path = write_dataset(tmp_path / "data.nc")
+    with xr.open_dataset(path) as ds, xr.open_dataset(path) as other:
+        assert data_token(ds) == data_token(other)
+        assert data_token(ds["tas"]) == data_token(other["tas"])
+        assert data_token(ds.isel(time=[0, 1])) != data_token(ds.isel(time=[2, 3]))
+
+
+def test_token_of_modified_variable(tmp_path):
+    path = write_dataset(tmp_path / "data.nc")
+    with xr.open_dataset(path) as ds, xr.open_dataset(path) as modified:
+        # The other variables are still lazily read from the file
+        modified["tas"] = modified["tas"] + 100
+        assert data_token(ds) != data_token(modified)
+
+
+def test_token_of_modified_attributes(tmp_path):
+    path = write_dataset(tmp_path / "data.nc")
+    with xr.open_dataset(path) as ds, xr.open_dataset(path) as modified:
+        modified["tas"].attrs["units"] = "degC"
+        assert data_token(ds) != data_token(modified)
+        assert data_token(ds["tas"]) != data_token(modified["tas"])
+
+
+def test_token_of_data_in_memory():
+    ds = xr.Dataset({"tas": ("x", np.arange(3.0))})
+    assert data_token(ds) == data_token(ds.copy(deep=True))
+    assert data_token(ds) != data_token(ds + 1)
+    assert data_token(ds.chunk()) == data_token(ds.chunk())
+
+
+def test_call_key_depends_on_the_code():
+    def compute(ds):
+        return ds + 1
+
+    def changed(ds):
+        return ds + 2
+
+    changed.__qualname__ = compute.__qualname__
+    ds = xr.Dataset({"tas": ("x", np.arange(3.0))})
+    assert call_key(compute, (ds,), {}) == call_key(compute, (ds,), {})
+    assert call_key(compute, (ds,), {}) != call_key(changed, (ds,), {})
+
+
+def test_cached_results(tmp_path):
+    calls = []
+
+    @cached(cache=ResultCache(tmp_path))
+    def add(ds, value):
+        calls.append(value)
+        return ds + value
+
+    ds = xr.Dataset({"tas": ("x", np.arange(3.0))})
+    xr.testing.assert_identical(add(ds, 1), ds + 1)
+    xr.testing.assert_identical(add(ds, 1), ds + 1)
+    add(ds, 2)
+    assert calls == [1, 2]
+
+
+def test_eviction(tmp_path):
+    result_cache = ResultCache(tmp_path / "cache")
+    ds = xr.Dataset({"tas": ("x", np.arange(1000.0))})
+    for key in ["a", "b", "c"]:
+        result_cache.put(key, ds)
+        os.utime(result_cache.path(key, "dataset"), ns=(0, {"a": 1, "b": 2, "c": 3}[key] * 10**9))
+    # "a" is read again, so "b" is the least recently used
+    result_cache.get("a")
+    result_cache.max_bytes = 2 * result_cache.path("a", "dataset").stat().st_size
+    result_cache.evict()
+    assert result_cache.get("b") is None
+    assert result_cache.get("a") is not None
+    assert result_cache.get("c") is not None
+    assert result_cache.size() <= result_cache.max_bytes
+
+
+def test_cached_without_cache_dir(monkeypatch):
+    monkeypatch.delenv(cache.CACHE_DIR_VARIABLE, raising=False)
+    cache.default_cache.cache_clear()
+
+    def function(ds):
+        return ds
+
+    try:
+        assert cached(function) is function
+    finally:
+        cache.default_cache.cache_clear()
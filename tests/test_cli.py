@@ -0,0 +1,80 @@
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas import cli
+
+yaml = pytest.importorskip("yaml")
+
+
+def docstring_job():
+    """The example job spec of the module docstring."""
+    text = cli.__doc__.split("e.g.:\n")[1].split("\nA matrix entry")[0]
+    return yaml.safe_load(textwrap.dedent(text))
+
+
+def write_raw_files(directory, scenarios):
+    """Tiny raw CMIP6-like monthly files with members, one per scenario."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1971-01-01", "2100-12-01", freq="MS")
+    for i, scenario in enumerate(scenarios):
+        data = 280 + i + rng.random((3, len(time), 4, 6))
+        xr.Dataset(
+            {"tas": (["member", "time", "lat", "lon"], data.astype("float32"), {"units": "K"})},
+            coords={
+                "member": np.arange(3),
+                "time": time,
+                "lat": np.linspace(60, -60, 4),
+                "lon": np.arange(15, 360, 60.0),
+            },
+        ).to_netcdf(directory / f"tas_{scenario}_197101-210012.nc")
+
+
+@pytest.fixture
+def offline_coastlines(monkeypatch):
+    """Empty coastlines, Natural Earth cannot be downloaded in the tests."""
+    import cartopy.crs as ccrs
+    import cartopy.feature as cfeature
+
+    monkeypatch.setattr(cfeature, "COASTLINE", cfeature.ShapelyFeature([], ccrs.PlateCarree()))
+
+
+@pytest.mark.parametrize("interpolation", [True, False])
+def test_docstring_job(tmp_path, offline_coastlines, interpolation):
+    job = docstring_job()
+    steps = {step["name"]: step for step in job["steps"]}
+    if interpolation:
+        pytest.importorskip("xesmf")
+    else:
+        # The analysis steps read the fixed data instead
+        job["steps"].remove(steps["regridded"])
+        steps["map"]["needs"] = steps["robustness"]["needs"] = "fixed"
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    write_raw_files(data_dir, job["matrix"]["scenario"])
+    steps["fixed"]["input"] = str(data_dir / "tas_{scenario}_*.nc")
+    job["output_dir"] = str(tmp_path / "job")
+
+    report = cli.run_job(job, max_workers=2)
+    assert (report["status"] == "done").all(), report
+    for scenario in job["matrix"]["scenario"]:
+        for season in job["matrix"]["season"]:
+            assert (tmp_path / "job" / "figures" / f"tas_{scenario}_{season}.png").exists()
+
+    # The months of the season label reach the analysis, the label reaches the titles
+    tasks = cli.build_tasks(job).values()
+    task = next(task for task in tasks if task["name"] == "map" and task["values"]["season"] == "DJF")
+    assert task["config"]["kwargs"]["season"] == [12, 1, 2]
+    task = next(task for task in tasks if task["name"] == "figure" and task["values"]["season"] == "DJF")
+    assert task["config"]["attrs"]["season_name"] == "DJF"
+    # The robustness categories are stored with the other outputs of the function
+    with xr.open_dataset(report.set_index("name").loc["robustness", "output"].iloc[0]) as ds:
+        assert list(ds.data_vars) == ["robustness", "robustness_1", "robustness_2"]
+        assert set(np.unique(ds["robustness"])) <= {1, 2, 3}
+
+    # A second run resumes from the checkpoint
+    report = cli.run_job(job, max_workers=2)
+    assert (report["status"] == "skipped").all()
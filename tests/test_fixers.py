@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.fixers import apply_fixers
+
+VAR_MAPPING = {
+    "dataset_variable": {"tas": "t2m"},
+    "aggregation": {"tas": "mean"},
+}
+
+
+def era5_hourly_dataset(n_days=10):
+    """ERA5-like float32 hourly data in Kelvin, on a (0, 360) grid with decreasing latitudes."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=24 * n_days, freq="h")
+    data = (285 + 10 * rng.random((len(time), 4, 8))).astype("float32")
+    return xr.Dataset(
+        {"t2m": (["time", "latitude", "longitude"], data, {"units": "K"})},
+        coords={
+            "time": time,
+            "latitude": ("latitude", np.linspace(60, -60, 4), {"units": "degrees_north"}),
+            "longitude": ("longitude", np.arange(0, 360, 45.0), {"units": "degrees_east"}),
+        },
+    )
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 48}])
+def test_float32_is_kept(chunks):
+    ds = era5_hourly_dataset()
+    if chunks:
+        ds = ds.chunk(chunks)
+    result = apply_fixers(ds.copy(), "tas", "era5", VAR_MAPPING, dtype="float32")
+    expected = apply_fixers(ds.astype("float64"), "tas", "era5", VAR_MAPPING)
+    assert result["tas"].dtype == np.float32
+    assert expected["tas"].dtype == np.float64
+    assert result["tas"].sizes == expected["tas"].sizes
+    # Units converted in float32 and daily means accumulated in float64
+    np.testing.assert_allclose(result["tas"], expected["tas"], rtol=0, atol=1e-4)
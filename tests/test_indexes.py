@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.indexes import cooling_degree_days, heating_degree_days
+
+
+def temperatures():
+    """Daily float32 tas, tasmax and tasmin in Celsius over 30 years."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("1981-01-01", "2010-12-31", freq="D")
+    cycle = 15 - 12 * np.cos(2 * np.pi * time.dayofyear.values / 365.25)[:, None]
+    tas = (cycle + 3 * rng.standard_normal((len(time), 5))).astype("float32")
+    spread = (2 + 4 * rng.random((len(time), 5))).astype("float32")
+
+    def data_array(values):
+        return xr.DataArray(values, dims=["time", "x"], coords={"time": time})
+
+    return data_array(tas), data_array(tas + spread), data_array(tas - spread)
+
+
+@pytest.mark.parametrize("index", [heating_degree_days, cooling_degree_days])
+def test_float32_is_kept(index):
+    tas, tasmax, tasmin = temperatures()
+    result = index(tas, tasmax, tasmin, freq="YS", dtype="float32")
+    expected = index(*(da.astype("float64") for da in (tas, tasmax, tasmin)), freq="YS")
+    assert result.dtype == np.float32
+    assert expected.dtype == np.float64
+    # The daily values are float32, the yearly sums are accumulated in float64
+    np.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-3)
+    assert (expected > 0).all()
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.interpolation import (
+    Interpolator,
+    generate_destination_grid,
+    generate_reference_grid,
+    get_destination_mask,
+    get_source_mask,
+)
+
+
+def global_dataset(resolution=4.0, n_time=3):
+    """Float32 data on a global regular grid."""
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=n_time, freq="MS")
+    lat = np.arange(-90 + resolution / 2, 90, resolution)
+    lon = np.arange(-180 + resolution / 2, 180, resolution)
+    data = (280 + 10 * rng.random((n_time, lat.size, lon.size))).astype("float32")
+    return xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data)},
+        coords={
+            "time": time,
+            "lat": ("lat", lat, {"standard_name": "latitude", "units": "degrees_north"}),
+            "lon": ("lon", lon, {"standard_name": "longitude", "units": "degrees_east"}),
+        },
+    )
+
+
+def test_float32_is_kept():
+    pytest.importorskip("xesmf")
+    ds = global_dataset()
+    attrs = {"interpolation_method": "conservative_normed", "resolution": 10.0, "var_name": "tas"}
+    result = Interpolator(dict(attrs, dtype="float32"))(ds)
+    expected = Interpolator(attrs)(ds.astype("float64"))
+    assert result["tas"].dtype == np.float32
+    assert expected["tas"].dtype == np.float64
+    np.testing.assert_allclose(result["tas"], expected["tas"], rtol=1e-6)
+
+
+def test_source_mask_of_missing_values():
+    ds = global_dataset(resolution=20.0)
+    ds["tas"][:, 0, 0] = np.nan
+    ds["tas"][0, 1, 1] = np.nan
+    ds_ref = generate_reference_grid(ds, "tas")
+    mean = get_source_mask(ds_ref, "tas", "mean")
+    first = get_source_mask(ds_ref, "tas", "first")
+    assert mean.dims == ("y", "x")
+    assert mean[0, 0] == 0 and mean[1, 1] == 1 and int(mean.sum()) == mean.size - 1
+    assert first[0, 0] == 0 and first[1, 1] == 0 and int(first.sum()) == first.size - 2
+
+
+def test_land_sea_masks():
+    ds_ref = generate_reference_grid(global_dataset(resolution=2.0), "tas")
+    land = get_source_mask(ds_ref, "tas", "land")
+    sea = get_source_mask(ds_ref, "tas", "sea")
+    assert land.shape == ds_ref["lon"].shape
+    np.testing.assert_array_equal(land + sea, 1)
+    # Sahara (lon 21, lat 21) and equatorial Pacific (lon -151, lat 1)
+    assert land.values[55, 100] == 1 and land.values[45, 14] == 0
+    ds_dest = generate_destination_grid(x=ds_ref["lon"].values[0, :], y=ds_ref["lat"].values[:, 0])
+    np.testing.assert_array_equal(get_destination_mask(ds_dest, "land"), land)
+    np.testing.assert_array_equal(get_destination_mask(ds_dest), 1)
+
+
+def test_land_sea_masks_need_regular_grids():
+    ds_ref = generate_reference_grid(global_dataset(resolution=2.0), "tas")
+    # Shift every row of a curvilinear grid
+    ds_ref["lon"] = ds_ref["lon"] + 0.1 * np.arange(ds_ref.sizes["y"])[:, None]
+    with pytest.raises(ValueError, match="regular grids"):
+        get_source_mask(ds_ref, "tas", "land")
+    with pytest.raises(ValueError, match="regular grids"):
+        get_destination_mask(ds_ref, "sea")
@@ -0,0 +1,86 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from c3s_atlas import logger
+from c3s_atlas.logger import (
+    instrument,
+    instrumented,
+    stage_records,
+    stage_summary,
+)
+
+
+@pytest.fixture
+def instrumentation(monkeypatch):
+    """Enabled instrumentation with its own records, restored afterwards."""
+    monkeypatch.setitem(logger._instrumentation, "enabled", True)
+    monkeypatch.setitem(logger._instrumentation, "trace_memory", False)
+    monkeypatch.setitem(logger._instrumentation, "records", deque(maxlen=logger.MAX_STAGE_RECORDS))
+    monkeypatch.setitem(logger._instrumentation, "stack", [])
+    return logger._instrumentation
+
+
+@instrumented()
+def double(data):
+    return data * 2
+
+
+def test_disabled_stages_are_not_recorded(monkeypatch):
+    monkeypatch.setitem(logger._instrumentation, "enabled", False)
+    monkeypatch.setitem(logger._instrumentation, "records", deque())
+    with instrument("stage", np.zeros(10)) as record:
+        assert record is None
+    np.testing.assert_array_equal(double(np.ones(3)), 2)
+    assert stage_records() == []
+
+
+def test_instrumented_records(instrumentation):
+    data = np.ones(100)
+    np.testing.assert_array_equal(double(data), 2)
+    with instrument("custom", data) as record:
+        record["output_bytes"] = 8
+    first, second = stage_records(clear=True)
+    assert first["stage"] == "test_logger.double"
+    assert first["input_bytes"] == first["output_bytes"] == data.nbytes
+    assert second["stage"] == "custom" and second["output_bytes"] == 8
+    for record in (first, second):
+        assert record["wall_seconds"] >= 0 and record["cpu_seconds"] >= 0
+        assert record["process_peak_rss_mb"] > 0
+        assert record["peak_rss_increase_mb"] >= 0
+        assert record["traced_peak_mb"] is None
+    assert stage_records() == []
+
+
+def test_traced_peak_of_nested_stages(instrumentation):
+    instrumentation["trace_memory"] = True
+    with instrument("outer"):
+        with instrument("inner"):
+            np.ones(2**20)  # 8 MiB
+        np.ones(2**17)  # 1 MiB
+    inner, outer = stage_records()
+    assert inner["traced_peak_mb"] >= 8
+    # The peak of the inner stage is also the peak of the enclosing stage
+    assert outer["traced_peak_mb"] >= inner["traced_peak_mb"]
+
+
+def test_records_are_bounded(instrumentation):
+    instrumentation["records"] = deque(maxlen=3)
+    for i in range(5):
+        with instrument(f"stage_{i}"):
+            pass
+    assert [record["stage"] for record in stage_records()] == ["stage_2", "stage_3", "stage_4"]
+
+
+def test_stage_summary(instrumentation):
+    for _ in range(3):
+        double(np.ones(10))
+    with instrument("other", np.ones(5)):
+        pass
+    summary = stage_summary()
+    assert summary.loc["test_logger.double", "calls"] == 3
+    assert summary.loc["test_logger.double", "input_bytes"] == 3 * 80
+    assert summary.loc["other", "calls"] == 1
+    assert {"process_peak_rss_mb", "peak_rss_increase_mb", "traced_peak_mb"} <= set(summary.columns)
+    assert list(summary["wall_seconds"]) == sorted(summary["wall_seconds"], reverse=True)
@@ -0,0 +1,88 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas import parallel_interpolation
+from c3s_atlas.parallel_interpolation import grid_key, interpolate_files
+
+ATTRS = {"interpolation_method": "conservative_normed", "resolution": 1.0, "var_name": "tas"}
+
+
+def write_file(path, n_lon=6, seed=0, missing=None):
+    """Small (time, lat, lon) file, with the cells of `missing` NaN in the first slice."""
+    rng = np.random.default_rng(seed)
+    data = rng.random((2, 4, n_lon)).astype("float32")
+    if missing:
+        data[0][missing] = np.nan
+    xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data)},
+        coords={
+            "time": pd.date_range("2000-01-01", periods=2, freq="MS"),
+            "lat": ("lat", np.linspace(-60, 60, 4), {"standard_name": "latitude"}),
+            "lon": ("lon", np.linspace(-150, 150, n_lon), {"standard_name": "longitude"}),
+        },
+    ).to_netcdf(path)
+    return path
+
+
+def test_grid_key(tmp_path):
+    first = write_file(tmp_path / "first.nc")
+    same_grid = write_file(tmp_path / "same_grid.nc", seed=1)
+    other_mask = write_file(tmp_path / "other_mask.nc", missing=(0, 0))
+    other_grid = write_file(tmp_path / "other_grid.nc", n_lon=8)
+    assert grid_key(first, "tas") == grid_key(same_grid, "tas")
+    assert grid_key(first, "tas") != grid_key(other_grid, "tas")
+    for source_mask in ["mean", "first"]:
+        assert grid_key(first, "tas", source_mask) != grid_key(other_mask, "tas", source_mask)
+    # The shipped land-sea masks only depend on the grid
+    assert grid_key(first, "tas", "land") == grid_key(other_mask, "tas", "land")
+
+
+def fake_interpolate_file(path, output_path, interpolation_attrs, hash_value):
+    """Record whether the weights existed, then fail for the "bad" files."""
+    weights_path = Path(interpolation_attrs["weights_path"])
+    with open(output_path.parent / "calls.log", "a") as log:
+        log.write(f"{path.name} {weights_path.exists()}\n")
+    time.sleep(0.2)
+    if path.name.startswith("bad"):
+        raise ValueError("Corrupted file")
+    weights_path.touch()
+    output_path.touch()
+    return 0.2
+
+
+def test_weights_are_built_once_per_group(tmp_path, monkeypatch):
+    # The workers are forked and see the patched function
+    monkeypatch.setattr(parallel_interpolation, "interpolate_file", fake_interpolate_file)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    paths = [write_file(inputs / name) for name in ["bad_a.nc", "a1.nc", "a2.nc", "a3.nc"]]
+    paths += [write_file(inputs / name, n_lon=8) for name in ["b1.nc", "b2.nc"]]
+    output_dir = tmp_path / "outputs"
+
+    report = interpolate_files(paths, ATTRS, output_dir, max_workers=4)
+    status = dict(zip(report["path"].map(lambda path: Path(path).name), report["status"]))
+    assert status.pop("bad_a.nc") == "failed"
+    assert set(status.values()) == {"done"}
+    calls = [line.split() for line in (output_dir / "calls.log").read_text().splitlines()]
+    builders = [name for name, weights_exist in calls if weights_exist == "False"]
+    # The failed file, the file promoted after it and the first file of the other grid
+    assert sorted(builders) == ["a1.nc", "b1.nc", "bad_a.nc"]
+    assert len(calls) == len(paths)
+
+
+def test_unreadable_files_fail_alone(tmp_path, monkeypatch):
+    monkeypatch.setattr(parallel_interpolation, "interpolate_file", fake_interpolate_file)
+    inputs = tmp_path / "inputs"
+    inputs.mkdir()
+    paths = [write_file(inputs / name) for name in ["a1.nc", "a2.nc"]]
+    (inputs / "corrupt.nc").write_bytes(b"not a netCDF file")
+    paths += [inputs / "corrupt.nc", inputs / "missing.nc"]
+
+    report = interpolate_files(paths, ATTRS, tmp_path / "outputs", max_workers=2)
+    status = dict(zip(report["path"].map(lambda path: Path(path).name), report["status"]))
+    assert status == {"a1.nc": "done", "a2.nc": "done", "corrupt.nc": "failed", "missing.nc": "failed"}
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.units import convert_units
+
+
+def kelvin_dataset(dtype):
+    rng = np.random.default_rng(0)
+    time = pd.date_range("2000-01-01", periods=24, freq="MS")
+    data = (250 + 60 * rng.random((len(time), 3, 4))).astype(dtype)
+    return xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data, {"units": "K"})},
+        coords={"time": time, "lat": np.arange(3.0), "lon": np.arange(4.0)},
+    )
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 6}])
+def test_float32_is_kept(chunks):
+    ds = kelvin_dataset("float32")
+    if chunks:
+        ds = ds.chunk(chunks)
+    expected = convert_units(ds.astype("float64"), "cmip6")
+    for dtype in [None, "float32"]:
+        result = convert_units(ds.copy(), "cmip6", dtype=dtype)
+        assert result["tas"].attrs["units"] == expected["tas"].attrs["units"]
+        assert result["tas"].dtype == np.float32
+        # The offset is applied in float32: the error is the float32 rounding of the result
+        np.testing.assert_allclose(result["tas"], expected["tas"], rtol=0, atol=4e-5)
+
+
+def test_dtype_of_integer_data():
+    ds = kelvin_dataset("int32")
+    assert convert_units(ds.copy(), "cmip6")["tas"].dtype == np.float64
+    assert convert_units(ds.copy(), "cmip6", dtype="float32")["tas"].dtype == np.float32
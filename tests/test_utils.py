@@ -0,0 +1,86 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from c3s_atlas.products import get_name_and_units
+from c3s_atlas.utils import SettingsRegistry, get_ds_to_fill, open_dataset_from_zip
+
+
+def grid_dataset(n_time=10):
+    time = pd.date_range("2000-01-01", periods=n_time, freq="D")
+    data = np.zeros((n_time, 3, 4), dtype="float32")
+    return xr.Dataset(
+        {"tas": (["time", "lat", "lon"], data)},
+        coords={"time": time, "lat": np.arange(3.0), "lon": np.arange(4.0)},
+    )
+
+
+@pytest.mark.parametrize("storage", [None, "dask", "memmap", "zarr"])
+@pytest.mark.parametrize("dtype", ["float32", "float64"])
+def test_ds_to_fill_dtype(tmp_path, storage, dtype):
+    ds = grid_dataset()
+    path = tmp_path / f"fill.{storage}" if storage in ["memmap", "zarr"] else None
+    ds_to_fill = get_ds_to_fill("tas", ds, ds, dtype=dtype, storage=storage, path=path)
+    assert ds_to_fill["tas"].dtype == np.dtype(dtype)
+    assert ds_to_fill["tas"].dims == ("time", "lon", "lat")
+
+
+def zipped_dataset(tmp_path):
+    """Zip archive with one NetCDF3 file, readable from a file-like object by scipy."""
+    import zipfile
+
+    nc_path = tmp_path / "tas.nc"
+    grid_dataset().to_netcdf(nc_path, format="NETCDF3_64BIT", engine="scipy")
+    zip_path = tmp_path / "tas.zip"
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        zip_ref.write(nc_path, "tas.nc")
+    return zip_path
+
+
+def open_files(path):
+    """Open file descriptors of this process pointing to `path`."""
+    fd_dir = Path("/proc/self/fd")
+    return [fd for fd in os.listdir(fd_dir) if os.path.realpath(fd_dir / fd) == str(path)]
+
+
+@pytest.mark.parametrize("in_memory", [True, False])
+def test_open_dataset_from_zip(tmp_path, in_memory):
+    zip_path = zipped_dataset(tmp_path)
+    engine = None if in_memory else "scipy"
+    with open_dataset_from_zip(zip_path, in_memory=in_memory, engine=engine) as ds:
+        np.testing.assert_array_equal(ds["tas"], grid_dataset()["tas"])
+    if Path("/proc/self/fd").exists():
+        assert not open_files(zip_path)
+
+
+@pytest.mark.skipif(not Path("/proc/self/fd").exists(), reason="needs /proc")
+@pytest.mark.parametrize("in_memory", [True, False])
+def test_open_dataset_from_zip_closes_on_error(tmp_path, in_memory):
+    zip_path = zipped_dataset(tmp_path)
+    with pytest.raises(ValueError) as error:
+        open_dataset_from_zip(zip_path, in_memory=in_memory, engine="no-such-engine")
+    # `error` keeps the traceback alive, so the archive must have been closed explicitly
+    assert not open_files(zip_path)
+
+
+def test_settings_registry_reloads(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps({"variable": {"t": {"name": "Mean temperature"}}, "units": {}}))
+    registry = SettingsRegistry(path)
+    assert registry.variable_name("t") == "Mean temperature"
+    assert registry.units_label("degC") is None
+    path.write_text(json.dumps({"variable": {}, "units": {"degC": "&deg;C"}}))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    assert registry.variable_name("t") is None
+    assert registry.units_label("degC") == "&deg;C"
+
+
+def test_name_and_units_labels():
+    assert get_name_and_units("t", {"unit": "degC·day"}) == ("Mean temperature", "&deg;C·day")
+    # Units without a label are kept as they are
+    assert get_name_and_units("t", {"unit": "K"}) == ("Mean temperature", "K")